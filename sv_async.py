@@ -0,0 +1,262 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Asynchronous Meshing
+"""
+asyncio interface for meshing jobs
+
+GenerateMesh blocks the calling thread for the whole TetGen run. run_job
+runs an sv_jobs job (see sv_jobs.make_job) in a separate Python process
+instead and returns an awaitable result, so one event loop can supervise
+many meshing jobs. While the job runs, progress events are passed to a
+callback:
+
+    {'event': 'stage', 'stage': 'pyMeshObject.GenerateMesh', 'state': 'start', 'elapsed': ...}
+    {'event': 'heartbeat', 'stage': ..., 'elapsed': ..., 'rss': ...}
+    {'event': 'log', 'line': ...}
+    {'event': 'done', 'elapsed': ..., 'num_elements': ..., 'peak_rss': ...}
+
+The report entry's peak_rss is the larger of the worker's own peak and
+the largest heartbeat rss.
+
+A timeout or cancelling the awaiting task kills the worker process.
+
+Example:
+    async def main():
+        result = await run_job(job, timeout=3600., on_progress=print)
+    asyncio.run(main())
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+
+MARKER = '@@svjob@@ '
+
+# tasks of coroutine progress callbacks; the event loop keeps only weak
+# references to tasks, so they are held here until they finish
+_callback_tasks = set()
+
+def _rss(pid):
+    """
+    Current resident set size of a process in bytes (Linux only)
+    """
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+def _emit(event):
+    sys.stdout.write(MARKER + json.dumps(event) + '\n')
+    sys.stdout.flush()
+
+def _worker():
+    """
+    Worker process entry: read a job from stdin and report over stdout
+    """
+    import sv_jobs
+    import sv_profile
+
+    class ProgressProfiler(sv_profile.Profiler):
+        def call(self, stage, func, *args, **kwargs):
+            _emit({'event': 'stage', 'stage': stage, 'state': 'start'})
+            try:
+                return sv_profile.Profiler.call(self, stage, func, *args, **kwargs)
+            finally:
+                _emit({'event': 'stage', 'stage': stage, 'state': 'end'})
+
+    job = json.loads(sys.stdin.read())
+    sv_profile.enable(ProgressProfiler())
+    result = sv_jobs.run_job(job)
+    sv_profile.disable()
+    _emit({'event': 'result', 'result': result})
+
+def _report(on_progress, event):
+    if on_progress is None:
+        return
+    out = on_progress(event)
+    if asyncio.iscoroutine(out):
+        task = asyncio.ensure_future(out)
+        _callback_tasks.add(task)
+        task.add_done_callback(_callback_tasks.discard)
+
+async def run_job(job, timeout=None, on_progress=None, python=None, heartbeat=1.):
+    """
+    Run an sv_jobs job in a subprocess
+
+    Args:
+        job: dict from sv_jobs.make_job
+        timeout: seconds before the job is killed and asyncio.TimeoutError raised
+        on_progress: function or coroutine function called with progress events
+        python: interpreter with the SV Python API, sys.executable by default
+        heartbeat: seconds between heartbeat events
+    Returns:
+        the sv_jobs report entry of the job
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    proc = await asyncio.create_subprocess_exec(python or sys.executable,
+            os.path.abspath(__file__), '--worker',
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+    state = {'stages': [], 'result': None, 'log': [], 'peak_rss': None}
+
+    def elapsed():
+        return loop.time() - start
+
+    async def read():
+        proc.stdin.write(json.dumps(job).encode())
+        await proc.stdin.drain()
+        proc.stdin.close()
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            line = line.decode(errors='replace').rstrip('\n')
+            if not line.startswith(MARKER):
+                state['log'] = (state['log'] + [line])[-50:]
+                _report(on_progress, {'event': 'log', 'line': line, 'elapsed': elapsed()})
+                continue
+            event = json.loads(line[len(MARKER):])
+            if event['event'] == 'result':
+                state['result'] = event['result']
+                continue
+            if event['event'] == 'stage':
+                if event['state'] == 'start':
+                    state['stages'].append(event['stage'])
+                elif event['stage'] in state['stages']:
+                    state['stages'].remove(event['stage'])
+            event['elapsed'] = elapsed()
+            _report(on_progress, event)
+        await proc.wait()
+
+    async def beat():
+        while True:
+            await asyncio.sleep(heartbeat)
+            stage = state['stages'][-1] if state['stages'] else None
+            rss = _rss(proc.pid)
+            if rss is not None:
+                state['peak_rss'] = max(rss, state['peak_rss'] or 0)
+            _report(on_progress, {'event': 'heartbeat', 'stage': stage,
+                'elapsed': elapsed(), 'rss': rss})
+
+    beat_task = asyncio.ensure_future(beat())
+    try:
+        await asyncio.wait_for(read(), timeout)
+    except BaseException:
+        # timeout or cancellation: do not leave TetGen running
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    finally:
+        beat_task.cancel()
+
+    result = state['result']
+    if result is None:
+        result = {
+                'name': job.get('name'),
+                'scenario': job.get('scenario'),
+                'ok': False,
+                'wall_time': elapsed(),
+                'error': "Worker exited with code %s:\n%s" % (proc.returncode, '\n'.join(state['log'])),
+                'pid': proc.pid,
+        }
+    if state['peak_rss'] is not None:
+        result['peak_rss'] = max(state['peak_rss'], result.get('peak_rss') or 0)
+    _report(on_progress, {'event': 'done', 'elapsed': elapsed(), 'ok': result['ok'],
+        'num_elements': result.get('num_elements'), 'peak_rss': result.get('peak_rss')})
+    return result
+
+async def run_jobs(jobs, concurrency=None, timeout=None, on_progress=None, python=None):
+    """
+    Run many jobs with at most `concurrency` worker processes
+
+    Timed out jobs are reported as failures instead of raising. on_progress
+    is called with (job name, event).
+    Returns:
+        report entries in the order of jobs
+    """
+    semaphore = asyncio.Semaphore(concurrency or os.cpu_count() or 1)
+
+    async def one(job):
+        async with semaphore:
+            callback = None
+            if on_progress is not None:
+                callback = lambda event: on_progress(job.get('name'), event)
+            start = time.time()
+            try:
+                return await run_job(job, timeout, callback, python)
+            except asyncio.TimeoutError:
+                return {
+                        'name': job.get('name'),
+                        'scenario': job.get('scenario'),
+                        'ok': False,
+                        'wall_time': time.time() - start,
+                        'error': "Timed out after %g s" % timeout,
+                        'pid': None,
+                }
+    return await asyncio.gather(*[one(job) for job in jobs])
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--worker']:
+        _worker()
+    else:
+        import sv_jobs
+        solid_fn = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cylinder.vtp')
+        out_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test')
+        try:
+            os.makedirs(out_dir)
+        except Exception as e: print(e)
+        mesh_ops = {
+                'SurfaceMeshFlag': True,
+                'VolumeMeshFlag': True,
+                'GlobalEdgeSize': 0.5,
+                'MeshWallFirst': True,
+                'NoMerge':True,
+                'NoBisect': True,
+                'Epsilon': 1e-8,
+                'Optimization': 3,
+                'QualityRatio': 1.4
+        }
+        jobs = [sv_jobs.make_job('cylinder_%g' % size, 'mesh', solid_fn, dict(mesh_ops, GlobalEdgeSize=size),
+            (os.path.join(out_dir, 'async_%g_surface.vtp' % size), os.path.join(out_dir, 'async_%g_vol.vtu' % size)))
+            for size in (0.5, 0.3, 0.2)]
+        def progress(name, event):
+            if event['event'] != 'log':
+                print(name, event)
+        results = asyncio.run(run_jobs(jobs, timeout=600., on_progress=progress))
+        sv_jobs.print_report(results)
@@ -0,0 +1,495 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Benchmarks
+"""
+Benchmark suite for the solid, mesh, geom and I/O examples
+
+Every case runs in its own worker process (see sv_jobs.run_jobs), one at a
+time, so timings do not interfere and the peak RSS of a case is not
+inflated by the cases before it. A case is timed over `repeat` runs and
+the fastest run is kept; throughput is reported as elements/s and, for
+I/O cases, MB/s.
+
+Scaled variants multiply the size of the bundled data: I/O cases tile
+cylinder.vtp, cylinder.vtu and demo.vtp `scale` times, meshing and
+remeshing cases shrink the edge size so the element count grows roughly
+`scale` times.
+
+Results can be saved as a baseline and later runs compared against it,
+e.g. before and after an SV upgrade:
+
+    python sv_bench.py --save-baseline bench_baseline.json
+    python sv_bench.py --baseline bench_baseline.json --threshold 0.1
+"""
+import os
+import re
+import sys
+import json
+import time
+import platform
+import functools
+from collections import OrderedDict
+from sv import *
+
+import numpy as np
+import sv_io
+import sv_jobs
+import sv_vtkxml
+from sv_session import clean_repos
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MESH_OPS = {
+        'SurfaceMeshFlag': True,
+        'VolumeMeshFlag': True,
+        'GlobalEdgeSize': 0.5,
+        'MeshWallFirst': True,
+        'NoMerge':True,
+        'NoBisect': True,
+        'Epsilon': 1e-8,
+        'Optimization': 3,
+        'QualityRatio': 1.4
+}
+
+def tile(mesh, copies):
+    """
+    Repeat a mesh `copies` times side by side along x
+
+    Global*ID arrays are renumbered so the copies stay distinct.
+    Returns:
+        sv_vtkxml.MeshArrays
+    """
+    points = np.asarray(mesh.points)
+    if copies <= 1:
+        return mesh
+    width = 1.1 * (points[:, 0].max() - points[:, 0].min()) or 1.
+    shift = np.zeros((copies, 1, 3), dtype=points.dtype)
+    shift[:, 0, 0] = np.arange(copies) * width
+    connectivity = np.asarray(mesh.connectivity)
+    offsets = np.asarray(mesh.offsets)
+    npts, nconn = len(points), len(connectivity)
+    def repeat(values, count):
+        values = np.asarray(values)
+        out = np.concatenate([values] * copies)
+        if count is not None:
+            step = np.repeat(np.arange(copies, dtype=values.dtype) * count, len(values))
+            out += step.reshape((-1,) + (1,) * (values.ndim - 1))
+        return out
+    def data(arrays, count):
+        return OrderedDict((name, repeat(arrays[name], count if name.startswith('Global') else None))
+                for name in arrays)
+    return sv_vtkxml.MeshArrays(mesh.kind,
+            points=(points[None] + shift).reshape(-1, 3),
+            connectivity=repeat(connectivity, npts),
+            offsets=repeat(offsets, nconn),
+            types=None if mesh.types is None else repeat(mesh.types, None),
+            point_data=data(mesh.point_data, npts),
+            cell_data=data(mesh.cell_data, len(offsets)))
+
+def _scaled_file(ctx, fn):
+    """
+    Path of a bundled file tiled ctx['scale'] times, written once per run
+    """
+    scale = ctx['scale']
+    if scale <= 1:
+        return os.path.join(DATA_DIR, fn)
+    base, ext = os.path.splitext(fn)
+    out = os.path.join(ctx['out_dir'], '%s_x%d%s' % (base, scale, ext))
+    if not os.path.exists(out):
+        sv_vtkxml.write(out, tile(sv_vtkxml.read(os.path.join(DATA_DIR, fn)), scale))
+    return out
+
+def _fresh(*names):
+    for name in names:
+        if Repository.Exists(name):
+            Repository.Delete(name)
+
+def _union_surface(name, edge_size):
+    """
+    Remeshed surface of two intersecting cylinders, as in sv_geom
+    """
+    Solid.SetKernel('PolyData')
+    cyl_1 = Solid.pySolidModel()
+    cyl_1.Cylinder('cyl',1.,10.,[0,0,0],[0,0,1])
+    cyl_2 = Solid.pySolidModel()
+    cyl_2.Cylinder('cyl2', 0.6, 10., [0,5,0], [0,1,0])
+    union = Solid.pySolidModel()
+    union.Union('u', 'cyl', 'cyl2', 'All')
+    union.GetBoundaryFaces(90)
+    union.GetPolyData(name + '_raw', 2)
+    MeshUtil.Remesh(name + '_raw', name, edge_size, edge_size * 4. / 3.)
+    return name
+
+# Each case function prepares its inputs and returns the callable that is
+# timed; the callable returns the number of elements and bytes processed.
+
+def _solid_primitives(ctx):
+    import sv_solid
+    Solid.SetKernel('PolyData')
+    def run():
+        clean_repos()
+        cells = 0
+        for func, name in ((sv_solid.cylinder, 'cyl_poly'), (sv_solid.sphere, 'sph_poly'),
+                (sv_solid.box, 'box_poly'), (sv_solid.ellipsoid, 'ellpsd_poly')):
+            func()
+            cells += sv_io.export_arrays(name).num_cells
+        return {'elements': cells}
+    return run
+
+def _solid_boolean(ctx, mode):
+    import sv_solid
+    Solid.SetKernel('PolyData')
+    fn = os.path.join(ctx['out_dir'], 'bench_%s.vtp' % mode)
+    def run():
+        sv_solid.boolean_ops(mode, fn)
+        return {}
+    return run
+
+def _mesh_scenario(ctx, scenario, refine_ops):
+    import sv_mesh
+    MeshObject.SetKernel('TetGen')
+    Solid.SetKernel('PolyData')
+    solid_fn = os.path.join(DATA_DIR, 'cylinder.vtp')
+    ops = dict(MESH_OPS, GlobalEdgeSize=MESH_OPS['GlobalEdgeSize'] / ctx['scale'] ** (1. / 3.))
+    prefix = os.path.join(ctx['out_dir'], 'bench_%s_x%d' % (scenario, ctx['scale']))
+    fns_out = (prefix + '_surface.vtp', prefix + '_vol.vtu')
+    def run():
+        if scenario == 'mesh':
+            sv_mesh.mesh(scenario, solid_fn, ops, fns_out)
+        else:
+            getattr(sv_mesh, scenario)(scenario, solid_fn, ops, refine_ops, fns_out)
+        return {'elements': sv_io.export_arrays(fns_out[1]).num_cells}
+    return run
+
+def _mesh2_local_size_function(ctx):
+    import sv_mesh2
+    MeshObject.SetKernel('TetGen')
+    Solid.SetKernel('PolyData')
+    solid_fn = os.path.join(DATA_DIR, 'demo.vtp')
+    f = ctx['scale'] ** (1. / 3.)
+    sizes = [1, 0.15/f, 2, 0.3/f, 3, 0.6/f, 4, 0.6/f]
+    prefix = os.path.join(ctx['out_dir'], 'bench_sf_x%d' % ctx['scale'])
+    fns_out = (prefix + '_surface.vtp', prefix + '_vol.vtu')
+    def run():
+        sv_mesh2.local_size_function('sf_bench', solid_fn, 5./f, sizes, fns_out)
+        return {'elements': sv_io.export_arrays(fns_out[1]).num_cells}
+    return run
+
+def _solid_remesh_face(ctx):
+    import sv_solid
+    Solid.SetKernel('PolyData')
+    fn = os.path.join(ctx['out_dir'], 'bench_remesh_face.vtp')
+    def run():
+        sv_solid.remesh(fn)
+        return {}
+    return run
+
+def _geom_remesh(ctx):
+    clean_repos()
+    edge_size = 0.3 / ctx['scale'] ** 0.5
+    _union_surface('bench_surf', 0.3)
+    def run():
+        _fresh('bench_remesh')
+        MeshUtil.Remesh('bench_surf', 'bench_remesh', edge_size, edge_size * 4. / 3.)
+        return {'elements': sv_io.export_arrays('bench_remesh').num_cells}
+    return run
+
+def _geom_smooth(ctx, method):
+    clean_repos()
+    _union_surface('bench_surf', 0.3 / ctx['scale'] ** 0.5)
+    Geom.Set_array_for_local_op_sphere('bench_surf', 'bench_pt', 3, [0,0,0],'LocalOpsArray', 0)
+    Geom.Set_array_for_local_op_sphere('bench_pt', 'bench_smth', 3, [0,0,0],'LocalOpsArray', 1)
+    cells = sv_io.export_arrays('bench_smth').num_cells
+    def run():
+        _fresh('bench_smth_out')
+        if method == 'sv':
+            Geom.Local_constrain_smooth('bench_smth', 'bench_smth_out', 5, 0.8, 30,
+                    'LocalOpsArray', 'LocalOpsArray')
+        else:
+            import sv_smooth
+            sv_smooth.local_constrain_smooth('bench_smth', 'bench_smth_out', 5, 0.8, 30,
+                    'LocalOpsArray', 'LocalOpsArray')
+        return {'elements': cells}
+    return run
+
+def _io_write(ctx, kind, fmt):
+    import sv_mesh
+    if kind == 'polydata':
+        src = _scaled_file(ctx, 'cylinder.vtp')
+        sv_io.read_polydata(src, 'bench_io')
+        ext = '.vtp'
+    else:
+        src = _scaled_file(ctx, 'cylinder.vtu')
+        msh = sv_mesh.new_object('bench_io_msh', meshName=src)
+        msh.GetUnstructuredGrid('bench_io')
+        ext = '.vtu'
+    if fmt in sv_io.LEGACY_FORMATS:
+        ext = '.vtk'
+    cells = sv_vtkxml.read(src).num_cells
+    fn = os.path.join(ctx['out_dir'], 'bench_io_%s_x%d_%s%s' % (kind, ctx['scale'], fmt, ext))
+    def run():
+        if kind == 'polydata':
+            sv_io.write_polydata('bench_io', fn, fmt)
+        else:
+            sv_io.write_ugrid('bench_io', fn, fmt)
+        return {'elements': cells, 'bytes': os.path.getsize(fn)}
+    return run
+
+def _io_read(ctx, fn, reader):
+    src = _scaled_file(ctx, fn)
+    size = os.path.getsize(src)
+    def run():
+        if reader == 'vtkxml':
+            mesh = sv_vtkxml.read(src)
+            for name in list(mesh.arrays) + list(mesh.point_data) + list(mesh.cell_data):
+                mesh[name]
+            cells = mesh.num_cells
+        else:
+            _fresh('bench_read')
+            sv_io.read_polydata(src, 'bench_read')
+            cells = sv_io.export_arrays('bench_read').num_cells
+        return {'elements': cells, 'bytes': size}
+    return run
+
+def _io_write_vtkxml(ctx, fn):
+    mesh = sv_vtkxml.read(_scaled_file(ctx, fn))
+    mesh = sv_vtkxml.MeshArrays(mesh.kind, mesh.points, mesh.connectivity, mesh.offsets,
+            mesh.types, dict(mesh.point_data), dict(mesh.cell_data))
+    out = os.path.join(ctx['out_dir'], 'bench_vtkxml_x%d_%s' % (ctx['scale'], fn))
+    def run():
+        sv_vtkxml.write(out, mesh)
+        return {'elements': len(mesh.offsets), 'bytes': os.path.getsize(out)}
+    return run
+
+def _cases():
+    cases = OrderedDict()
+    # name -> (group, setup function, honours the scale factor)
+    cases['solid_primitives'] = ('solid', _solid_primitives, False)
+    for mode in ('union', 'subtract', 'intersect'):
+        cases['solid_boolean_' + mode] = ('solid', functools.partial(_solid_boolean, mode=mode), False)
+    for scenario, refine_ops in (('mesh', None),
+            ('sphere_refine', {'size':0.2, 'rad':1, 'center':[0,0,0]}),
+            ('cylinder_refine', {'size':0.2, 'rad':1, 'length': 10, 'center':[0,0,0], 'nrm':[0,0,1]}),
+            ('boundary_layer', {'type':0, 'id':0, 'side':0, 'num_lyr': 2, 'H':[0.1,0.3]})):
+        cases['mesh_' + scenario] = ('mesh', functools.partial(_mesh_scenario,
+            scenario=scenario, refine_ops=refine_ops), True)
+    cases['mesh2_local_size_function'] = ('mesh', _mesh2_local_size_function, True)
+    cases['solid_remesh_face'] = ('geom', _solid_remesh_face, False)
+    cases['geom_remesh'] = ('geom', _geom_remesh, True)
+    cases['geom_smooth_sv'] = ('geom', functools.partial(_geom_smooth, method='sv'), True)
+    cases['geom_smooth_numpy'] = ('geom', functools.partial(_geom_smooth, method='numpy'), True)
+    for kind in ('polydata', 'ugrid'):
+        for fmt in sv_io.FORMATS:
+            cases['io_write_%s_%s' % (kind, fmt)] = ('io', functools.partial(_io_write, kind=kind, fmt=fmt), True)
+    for fn in ('cylinder.vtp', 'cylinder.vtu', 'demo.vtp'):
+        cases['io_read_vtkxml_' + fn] = ('io', functools.partial(_io_read, fn=fn, reader='vtkxml'), True)
+        cases['io_write_vtkxml_' + fn] = ('io', functools.partial(_io_write_vtkxml, fn=fn), True)
+    for fn in ('cylinder.vtp', 'demo.vtp'):
+        cases['io_read_polydata_' + fn] = ('io', functools.partial(_io_read, fn=fn, reader='vtk'), True)
+    return cases
+
+CASES = _cases()
+
+def _run_case(job):
+    """
+    sv_jobs worker target: time one case and return its report entry
+    """
+    import traceback
+    import sv_profile
+    result = {
+            'name': job['name'],
+            'scenario': job['scenario'],
+            'case': job['case'],
+            'scale': job['scale'],
+            'ok': False,
+            'wall_time': 0.,
+            'error': None,
+            'pid': os.getpid(),
+    }
+    start = time.time()
+    try:
+        ctx = {'scale': job['scale'], 'out_dir': job['out_dir']}
+        run = CASES[job['case']][1](ctx)
+        times = []
+        for i in range(job['repeat']):
+            t = time.time()
+            counts = run()
+            times.append(time.time() - t)
+        seconds = min(times)
+        result['seconds'] = seconds
+        result['mean'] = sum(times) / len(times)
+        result['elements'] = counts.get('elements')
+        result['bytes'] = counts.get('bytes')
+        if result['elements'] is not None and seconds > 0:
+            result['elements_per_s'] = result['elements'] / seconds
+        if result['bytes'] is not None and seconds > 0:
+            result['mb_per_s'] = result['bytes'] / seconds / 1e6
+        result['peak_rss'] = sv_profile.peak_rss()
+        result['ok'] = True
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['wall_time'] = time.time() - start
+    return result
+
+def run(out_dir, scales=(1,), repeat=3, only=None, timeout=None):
+    """
+    Run the benchmark cases
+
+    Args:
+        out_dir: directory for outputs and scaled input files
+        scales: scale factors; cases that ignore the scale run at 1 only
+        repeat: timed runs per case, the fastest is reported
+        only: regular expression selecting case names
+        timeout: seconds before a case is killed and reported as failed
+    Returns:
+        list of report entries, see sv_jobs.run_jobs
+    """
+    try:
+        os.makedirs(out_dir)
+    except Exception as e: print(e)
+    jobs = []
+    for case, (group, func, scalable) in CASES.items():
+        if only is not None and not re.search(only, case):
+            continue
+        for scale in (scales if scalable else [1]):
+            name = case if scale == 1 else '%s@x%d' % (case, scale)
+            jobs.append({'name': name, 'scenario': group, 'case': case, 'scale': scale,
+                'repeat': repeat, 'out_dir': out_dir})
+    return sv_jobs.run_jobs(jobs, processes=1, timeout=timeout, target=_run_case)
+
+def save_baseline(results, fn):
+    """
+    Store successful results as a JSON baseline
+    """
+    baseline = {
+            'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cases': OrderedDict((r['name'], r) for r in results if r['ok']),
+    }
+    with open(fn, 'w') as f:
+        json.dump(baseline, f, indent=1)
+
+def load_baseline(fn):
+    with open(fn) as f:
+        return json.load(f)
+
+def compare(results, baseline, threshold=0.1, min_seconds=0.01, min_rss=4e6):
+    """
+    Flag cases that got slower, use more memory or produce a different
+    number of elements than in the baseline
+
+    Args:
+        threshold: allowed relative increase of time and peak RSS
+        min_seconds, min_rss: time (s) and peak RSS (bytes) differences
+            below these are treated as noise
+    Returns:
+        list of (case name, message)
+    """
+    flags = []
+    cases = baseline['cases']
+    for r in results:
+        base = cases.get(r['name'])
+        if base is None:
+            continue
+        if not r['ok']:
+            flags.append((r['name'], "failed, passed in the baseline"))
+            continue
+        if (r['seconds'] > base['seconds'] * (1. + threshold)
+                and r['seconds'] - base['seconds'] > min_seconds):
+            flags.append((r['name'], "time %.3f s -> %.3f s (%+.0f%%)" % (base['seconds'],
+                r['seconds'], 100. * (r['seconds'] / base['seconds'] - 1.))))
+        if (r.get('peak_rss') and base.get('peak_rss')
+                and r['peak_rss'] > base['peak_rss'] * (1. + threshold)
+                and r['peak_rss'] - base['peak_rss'] > min_rss):
+            flags.append((r['name'], "peak RSS %.1f MB -> %.1f MB" % (base['peak_rss'] / 1e6,
+                r['peak_rss'] / 1e6)))
+        if r.get('elements') != base.get('elements'):
+            flags.append((r['name'], "elements %s -> %s" % (base.get('elements'), r.get('elements'))))
+    return flags
+
+def print_table(results, baseline=None):
+    """
+    Print one row per case, with the change against a baseline if given
+
+    MB is the size of the data a case wrote or read, so the io_write rows
+    compare bytes and seconds per output format.
+    """
+    def fmt(value, spec):
+        return spec % value if value is not None else '-'
+    print("%-36s %10s %10s %12s %10s %10s %10s %8s" % ('case', 'seconds', 'elements', 'elements/s',
+        'MB', 'MB/s', 'peak MB', 'change'))
+    for r in results:
+        if not r['ok']:
+            print("%-36s FAILED" % r['name'])
+            continue
+        change = '-'
+        base = baseline['cases'].get(r['name']) if baseline is not None else None
+        if base is not None and base['seconds'] > 0:
+            change = "%+.0f%%" % (100. * (r['seconds'] / base['seconds'] - 1.))
+        print("%-36s %10.3f %10s %12s %10s %10s %10s %8s" % (r['name'], r['seconds'],
+            fmt(r.get('elements'), '%d'), fmt(r.get('elements_per_s'), '%.4g'),
+            fmt(r['bytes'] / 1e6 if r.get('bytes') is not None else None, '%.3f'),
+            fmt(r.get('mb_per_s'), '%.1f'),
+            fmt(r['peak_rss'] / 1e6 if r.get('peak_rss') else None, '%.1f'), change))
+    for r in results:
+        if not r['ok']:
+            print("*********%s failed*********" % r['name'])
+            print(r['error'])
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--out-dir', default=os.path.join(DATA_DIR, 'test', 'bench'))
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help='regular expression selecting cases')
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--baseline', help='compare against this baseline file')
+    parser.add_argument('--save-baseline', help='store the results as a baseline')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    parser.add_argument('--list', action='store_true', help='list the cases and exit')
+    args = parser.parse_args()
+    if args.list:
+        for case, (group, func, scalable) in CASES.items():
+            print("%-6s %s%s" % (group, case, ' (scaled)' if scalable else ''))
+        sys.exit(0)
+
+    results = run(args.out_dir, args.scale, args.repeat, args.only, args.timeout)
+    baseline = load_baseline(args.baseline) if args.baseline else None
+    print_table(results, baseline)
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+    if baseline is not None:
+        flags = compare(results, baseline, args.threshold)
+        for name, message in flags:
+            print("REGRESSION %s: %s" % (name, message))
+        sys.exit(1 if flags else 0)
@@ -0,0 +1,221 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Mesh Cache
+"""
+On-disk cache for generated surface and volume meshes
+
+Entries are keyed on the bytes of the input solid file plus the
+normalized meshing options (mesh_ops, refinement and boundary layer
+arguments), so re-running a parameter study only calls GenerateMesh for
+the cases that changed. Every entry is its own directory; the
+modification time of its meta file records the last use and the least
+recently used entries are evicted once the cache grows past max_bytes.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+_digests = {}
+
+def file_digest(fn):
+    """
+    sha256 of a file, memoized on path, size and modification time
+    """
+    st = os.stat(fn)
+    stamp = (os.path.abspath(fn), st.st_size, st.st_mtime)
+    if stamp not in _digests:
+        h = hashlib.sha256()
+        with open(fn, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        _digests[stamp] = h.hexdigest()
+    return _digests[stamp]
+
+def _normalize(obj):
+    if isinstance(obj, dict):
+        return dict((str(k), _normalize(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [_normalize(v) for v in obj]
+    if isinstance(obj, float):
+        return repr(obj)
+    if isinstance(obj, (bool, int, str)) or obj is None:
+        return obj
+    return repr(obj)
+
+class MeshCache(object):
+    """
+    Content-addressed mesh cache
+
+    Args:
+        cache_dir: directory holding the cache entries
+        max_bytes: total size of the cache before LRU eviction
+    """
+    META = 'meta.json'
+
+    def __init__(self, cache_dir, max_bytes=10*1024**3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
+
+    def key(self, solid_fn, options):
+        """
+        Cache key of a meshing run
+
+        Args:
+            solid_fn: input solid file
+            options: dict with everything that affects the result, e.g.
+                {'scenario': 'sphere_refine', 'mesh_ops': args, 'refine': ops}
+        """
+        import sv_io
+        options = dict(options)
+        options['output_format'] = sv_io.get_default_format()
+        if sv_io.get_default_reorder() is not None:
+            options['reorder'] = sv_io.get_default_reorder()
+        h = hashlib.sha256()
+        h.update(file_digest(solid_fn).encode())
+        h.update(json.dumps(_normalize(options), sort_keys=True).encode())
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key, fns_out):
+        """
+        Copy the cached outputs of key to fns_out
+
+        Returns:
+            on a cache hit, fns_out with None for the outputs that were not
+            cached; None on a miss
+        """
+        entry = self._entry(key)
+        meta_fn = os.path.join(entry, self.META)
+        try:
+            with open(meta_fn) as f:
+                meta = json.load(f)
+            files = meta['files']
+            if len(files) != len(fns_out):
+                raise KeyError(key)
+            for cached, fn in zip(files, fns_out):
+                if cached is None:
+                    continue
+                if fn is None or os.path.splitext(fn)[1] != os.path.splitext(cached)[1]:
+                    raise KeyError(key)
+            for cached, fn in zip(files, fns_out):
+                if cached is not None:
+                    shutil.copyfile(os.path.join(entry, cached), fn)
+            os.utime(meta_fn, None)
+        except (IOError, OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return tuple(fn if cached is not None else None for cached, fn in zip(files, fns_out))
+
+    def put(self, key, fns_out):
+        """
+        Store the output files of key
+
+        Args:
+            key: cache key from key()
+            fns_out: output files, None for outputs that were not written
+        """
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        files = []
+        for i, fn in enumerate(fns_out):
+            if fn is None or not os.path.exists(fn):
+                files.append(None)
+                continue
+            cached = 'output%d%s' % (i, os.path.splitext(fn)[1])
+            shutil.copyfile(fn, os.path.join(tmp, cached))
+            files.append(cached)
+        with open(os.path.join(tmp, self.META), 'w') as f:
+            json.dump({'files': files, 'created': time.time()}, f)
+        entry = self._entry(key)
+        if os.path.isdir(entry):
+            shutil.rmtree(entry, ignore_errors=True)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # another process stored the same key first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def _entries(self):
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry = self._entry(key)
+            meta_fn = os.path.join(entry, self.META)
+            if key.startswith('.'):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, fn)) for fn in os.listdir(entry))
+                entries.append((os.path.getmtime(meta_fn), size, key))
+            except OSError:
+                # evicted or replaced by another process during the scan
+                continue
+        return entries
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits max_bytes
+        """
+        entries = sorted(self._entries())
+        total = sum(e[1] for e in entries)
+        while entries and total > self.max_bytes:
+            last_used, size, key = entries.pop(0)
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        for last_used, size, key in self._entries():
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+
+    def stats(self):
+        """
+        Hit/miss counts of this instance and current size of the cache
+        """
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits) / lookups if lookups else 0.,
+                'entries': len(entries),
+                'bytes': sum(e[1] for e in entries),
+        }
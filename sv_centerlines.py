@@ -0,0 +1,197 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Centerlines
+"""
+Cached centerlines and KD-tree distance to centerlines for radius based meshing
+
+VMTKUtils.Centerlines is one of the most expensive steps of the pipeline.
+CenterlineCache stores the centerlines and Voronoi diagram of a surface
+per (surface file, cap source list, cap target list), both in memory and
+on disk. distance_to_centerlines replaces VMTKUtils.Distancetocenterlines:
+a cKDTree query finds the centerline points closest to every surface
+point, and the distance is taken to the polyline segments at those points.
+radius_sizing writes it as the 'DistanceToCenterlines' point array consumed
+by SetSizeFunctionBasedMesh.
+"""
+import os
+import json
+import hashlib
+
+import numpy as np
+from scipy.spatial import cKDTree
+from sv import *
+
+import sv_io
+import sv_cache
+
+DISTANCE_ARRAY = 'DistanceToCenterlines'
+
+def polyline_segments(connectivity, offsets, num_points):
+    """
+    Segments of polylines and the segments at each point
+
+    Args:
+        connectivity, offsets: polyline cells in the VTK XML convention
+    Returns:
+        (segments, point_segments): (nsegments, 2) point ids, and an
+        (num_points, max segments per point) table of segment ids padded with -1
+    """
+    connectivity = np.asarray(connectivity, dtype=np.int64)
+    last = np.zeros(len(connectivity), dtype=bool)
+    last[np.asarray(offsets, dtype=np.int64) - 1] = True
+    segments = np.stack([connectivity[:-1], connectivity[1:]], axis=1)[~last[:-1]]
+    ends = segments.ravel()
+    seg_ids = np.repeat(np.arange(len(segments)), 2)
+    order = np.argsort(ends, kind='stable')
+    counts = np.bincount(ends, minlength=num_points)
+    starts = np.cumsum(counts) - counts
+    rank = np.arange(len(ends)) - starts[ends[order]]
+    point_segments = np.full((num_points, max(int(counts.max()) if len(counts) else 0, 1)), -1, dtype=np.int64)
+    point_segments[ends[order], rank] = seg_ids[order]
+    return segments, point_segments
+
+class CenterlineCache(object):
+    """
+    Centerlines and Voronoi diagrams keyed on surface content and caps
+
+    Args:
+        cache_dir: directory for the cached .vtp files; None keeps the
+            centerlines in the Repository only
+    """
+    def __init__(self, cache_dir=None):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._trees = {}
+        if cache_dir is None:
+            return
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
+
+    def key(self, fn, cap_source_list, cap_target_list):
+        h = hashlib.sha256()
+        h.update(sv_cache.file_digest(fn).encode())
+        h.update(json.dumps([list(cap_source_list), list(cap_target_list)]).encode())
+        return h.hexdigest()
+
+    def centerlines(self, poly_name, fn, cap_source_list, cap_target_list):
+        """
+        Centerlines and Voronoi diagram of a surface in the Repository
+
+        Args:
+            poly_name: Repository polydata of the surface read from fn
+            fn: surface file, used for the cache key
+            cap_source_list, cap_target_list: cap ids passed to VMTKUtils.Centerlines
+        Returns:
+            (centerlines name, Voronoi diagram name)
+        """
+        key = self.key(fn, cap_source_list, cap_target_list)
+        lines = 'centerlines_' + key[:16]
+        voronoi = 'voronoi_' + key[:16]
+        lines_fn, voronoi_fn = None, None
+        if self.cache_dir is not None:
+            lines_fn = os.path.join(self.cache_dir, key + '_lines.vtp')
+            voronoi_fn = os.path.join(self.cache_dir, key + '_voronoi.vtp')
+        if Repository.Exists(lines) and Repository.Exists(voronoi):
+            self.hits += 1
+        elif lines_fn is not None and os.path.exists(lines_fn) and os.path.exists(voronoi_fn):
+            self.hits += 1
+            sv_io.read_polydata(lines_fn, lines)
+            sv_io.read_polydata(voronoi_fn, voronoi)
+        else:
+            self.misses += 1
+            VMTKUtils.Centerlines(poly_name, cap_source_list, cap_target_list, lines, voronoi)
+            if lines_fn is not None:
+                sv_io.write_polydata(lines, lines_fn, 'zlib')
+                sv_io.write_polydata(voronoi, voronoi_fn, 'zlib')
+        return lines, voronoi
+
+    def tree(self, lines_name):
+        """
+        KD-tree over the centerline points and the polyline segments,
+        built once per centerline object
+
+        Returns:
+            (cKDTree, points, segments, point_segments), see polyline_segments
+        """
+        if lines_name not in self._trees:
+            lines = sv_io.export_arrays(lines_name)
+            points = np.asarray(lines.points, dtype=np.float64)
+            segments, point_segments = polyline_segments(lines.connectivity, lines.offsets, len(points))
+            self._trees[lines_name] = (cKDTree(points), points, segments, point_segments)
+        return self._trees[lines_name]
+
+def distance_to_centerlines(surface_points, centerlines, k=8):
+    """
+    Distance of every surface point to the closest centerline segment
+
+    The segments considered for a surface point are the ones at its k
+    closest centerline points.
+    Args:
+        centerlines: tuple returned by CenterlineCache.tree
+    Returns:
+        (distances, index of the closest segment)
+    """
+    tree, points, segments, point_segments = centerlines
+    x = np.asarray(surface_points, dtype=np.float64)
+    if len(segments) == 0:
+        return tree.query(x)
+    k = min(k, len(points))
+    _, near = tree.query(x, k=k)
+    candidates = point_segments[near.reshape(len(x), k)].reshape(len(x), -1)
+    valid = candidates >= 0
+    seg = segments[np.where(valid, candidates, 0)]
+    a = points[seg[..., 0]]
+    ab = points[seg[..., 1]] - a
+    ap = x[:, None, :] - a
+    t = np.clip(np.sum(ap * ab, axis=2) / np.maximum(np.sum(ab * ab, axis=2), 1e-300), 0., 1.)
+    d = np.linalg.norm(ap - t[..., None] * ab, axis=2)
+    d[~valid] = np.inf
+    closest = np.argmin(d, axis=1)
+    rows = np.arange(len(x))
+    return d[rows, closest], candidates[rows, closest]
+
+def radius_sizing(poly_name, dst_name, lines_name, cache, array_name=DISTANCE_ARRAY):
+    """
+    Copy a surface with a distance-to-centerline point array
+
+    The array holds the local vessel radius: the distance to the closest
+    centerline segment, as VMTKUtils.Distancetocenterlines computes it.
+    Returns:
+        the distance array
+    """
+    surface = sv_io.export_arrays(poly_name)
+    distance, _ = distance_to_centerlines(surface.points, cache.tree(lines_name))
+    sv_io.set_array(poly_name, dst_name, array_name, distance, 0)
+    return distance
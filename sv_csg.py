@@ -0,0 +1,234 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API CSG Trees
+"""
+Memoized, parallel evaluation of constructive solid geometry trees
+
+A tree is built from Cylinder/Sphere/Box3d primitives and Union/Subtract/
+Intersect nodes. Every node is identified by a hash of its operation,
+parameters and children, and its result is stored with WriteNative in a
+cache directory, so changing one leaf only re-evaluates the nodes on the
+path from that leaf to the root. Uncached nodes of the same height do not
+depend on each other and are evaluated concurrently in worker processes.
+
+Example:
+    tree = union(cylinder(1., 10., [0,0,0], [0,0,1]),
+                 cylinder(0.6, 10., [0,5,0], [0,1,0]))
+    solid = CSGEvaluator(cache_dir).evaluate(tree, 'model')
+"""
+import os
+import json
+import hashlib
+import traceback
+
+from sv import *
+
+import sv_jobs
+
+BOOLEAN_OPS = ('union', 'subtract', 'intersect')
+# simplification flag passed to the boolean calls, as in sv_solid.boolean_ops
+DEFAULT_SIMPLIFY = {'union': 'All', 'subtract': 'All', 'intersect': 'None'}
+NATIVE_EXT = {'PolyData': '.vtp', 'OpenCASCADE': '.brep'}
+
+def _node(op, children=(), **params):
+    node = {'op': op, 'params': params, 'children': list(children)}
+    h = hashlib.sha256()
+    h.update(json.dumps([op, sorted((k, repr(v)) for k, v in params.items())]).encode())
+    for child in node['children']:
+        h.update(child['hash'].encode())
+    node['hash'] = h.hexdigest()
+    return node
+
+def cylinder(radius, length, center, axis):
+    return _node('cylinder', radius=float(radius), length=float(length),
+            center=[float(x) for x in center], axis=[float(x) for x in axis])
+
+def sphere(radius, center):
+    return _node('sphere', radius=float(radius), center=[float(x) for x in center])
+
+def box(dims, center):
+    return _node('box', dims=[float(x) for x in dims], center=[float(x) for x in center])
+
+def union(a, b, simplify=None):
+    return _node('union', (a, b), simplify=simplify or DEFAULT_SIMPLIFY['union'])
+
+def subtract(a, b, simplify=None):
+    return _node('subtract', (a, b), simplify=simplify or DEFAULT_SIMPLIFY['subtract'])
+
+def intersect(a, b, simplify=None):
+    return _node('intersect', (a, b), simplify=simplify or DEFAULT_SIMPLIFY['intersect'])
+
+def union_all(nodes):
+    """
+    Balanced union of many nodes, so that subtrees can run concurrently
+    """
+    nodes = list(nodes)
+    while len(nodes) > 1:
+        nodes = [union(nodes[i], nodes[i+1]) if i + 1 < len(nodes) else nodes[i]
+                for i in range(0, len(nodes), 2)]
+    return nodes[0]
+
+def _height(node):
+    return 1 + max(_height(c) for c in node['children']) if node['children'] else 0
+
+def _object_name(node):
+    return 'csg_' + node['hash'][:16]
+
+def _read(fn, name):
+    if Repository.Exists(name):
+        Repository.Delete(name)
+    solid = Solid.pySolidModel()
+    solid.ReadNative(name, fn)
+    return solid
+
+def _evaluate_node(job):
+    """
+    Evaluate one node whose children are cached, and cache its result
+    """
+    result = {'name': job['name'], 'scenario': job['scenario'], 'ok': False, 'error': None}
+    try:
+        node = job['node']
+        name = _object_name(node)
+        if Repository.Exists(name):
+            Repository.Delete(name)
+        solid = Solid.pySolidModel()
+        p = node['params']
+        if node['op'] == 'cylinder':
+            solid.Cylinder(name, p['radius'], p['length'], p['center'], p['axis'])
+        elif node['op'] == 'sphere':
+            solid.Sphere(name, p['radius'], p['center'])
+        elif node['op'] == 'box':
+            solid.Box3d(name, p['dims'], p['center'])
+        elif node['op'] in BOOLEAN_OPS:
+            a, b = [_object_name(c) for c in node['children']]
+            for child, fn in zip((a, b), job['children']):
+                _read(fn, child)
+            op = {'union': solid.Union, 'subtract': solid.Subtract, 'intersect': solid.Intersect}[node['op']]
+            op(name, a, b, p['simplify'])
+        else:
+            raise ValueError("Unknown CSG operation: " + str(node['op']))
+        tmp = job['fn'] + '.tmp' + NATIVE_EXT[job['kernel']]
+        if not solid.WriteNative(tmp):
+            raise RuntimeError("Failed writing " + tmp)
+        os.rename(tmp, job['fn'])
+        result['ok'] = True
+    except Exception:
+        result['error'] = traceback.format_exc()
+    return result
+
+class CSGEvaluator(object):
+    """
+    Evaluates CSG trees with a persistent result cache
+
+    Args:
+        cache_dir: directory of the cached node results
+        processes: concurrent workers, all cores if None; 1 evaluates in
+            the calling process
+    """
+    def __init__(self, cache_dir, processes=None):
+        self.cache_dir = cache_dir
+        self.processes = processes
+        self.hits = 0
+        self.misses = 0
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
+
+    def _kernel(self):
+        return Solid.GetKernel()
+
+    def _fn(self, node):
+        kernel = self._kernel()
+        return os.path.join(self.cache_dir, '%s_%s%s' % (kernel, node['hash'], NATIVE_EXT[kernel]))
+
+    def _pending(self, node, pending):
+        """
+        Collect the uncached nodes of a tree by height
+        """
+        if os.path.exists(self._fn(node)):
+            self.hits += 1
+            return
+        self.misses += 1
+        for child in node['children']:
+            self._pending(child, pending)
+        level = pending.setdefault(_height(node), {})
+        level[node['hash']] = node
+
+    def evaluate(self, tree, name):
+        """
+        Evaluate a tree and return its result as a solid model called name
+        """
+        pending = {}
+        self._pending(tree, pending)
+        for height in sorted(pending):
+            jobs = []
+            for node in pending[height].values():
+                jobs.append({
+                        'name': node['op'],
+                        'scenario': node['hash'][:16],
+                        'node': node,
+                        'fn': self._fn(node),
+                        'children': [self._fn(c) for c in node['children']],
+                        'kernel': self._kernel(),
+                })
+            if self.processes == 1 or len(jobs) == 1:
+                results = [_evaluate_node(job) for job in jobs]
+            else:
+                results = sv_jobs.run_jobs(jobs, processes=self.processes, target=_evaluate_node)
+            failed = [r for r in results if not r['ok']]
+            if failed:
+                raise RuntimeError("CSG evaluation failed: " + "; ".join(
+                    "%s %s: %s" % (r['name'], r['scenario'], r['error']) for r in failed))
+        return _read(self._fn(tree), name)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+if __name__ == '__main__':
+    Solid.SetKernel('PolyData')
+    out_dir = os.path.join(os.path.dirname(__file__), 'test')
+    evaluator = CSGEvaluator(os.path.join(out_dir, 'csg_cache'))
+
+    # two intersected cylinders of sv_geom.py
+    tree = union(cylinder(1., 10., [0,0,0], [0,0,1]), cylinder(0.6, 10., [0,5,0], [0,1,0]))
+    solid = evaluator.evaluate(tree, 'two_cylinders')
+    solid.WriteNative(os.path.join(out_dir, 'csg_two_cylinders.vtp'))
+
+    # a vessel tree of many branches; changing one branch re-evaluates its path only
+    branches = [cylinder(0.5, 8., [0, 0, 2.*i], [1, 0, 0]) for i in range(8)]
+    tree = subtract(union_all([cylinder(1., 20., [0,0,7], [0,0,1])] + branches), sphere(0.8, [0,0,-3]))
+    evaluator.evaluate(tree, 'branches').WriteNative(os.path.join(out_dir, 'csg_branches.vtp'))
+    branches[3] = cylinder(0.4, 8., [0, 0, 6.], [1, 0, 0])
+    tree = subtract(union_all([cylinder(1., 20., [0,0,7], [0,0,1])] + branches), sphere(0.8, [0,0,-3]))
+    evaluator.evaluate(tree, 'branches_edit').WriteNative(os.path.join(out_dir, 'csg_branches_edit.vtp'))
+    print(evaluator.stats())
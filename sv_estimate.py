@@ -0,0 +1,428 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Mesh Size Estimation
+"""
+Element count, memory and runtime prediction before GenerateMesh
+
+SurfaceModel.estimate takes the mesh options and refinement arguments in
+the form the sv_mesh/sv_mesh2 scenarios use them and predicts the number
+of surface and volume elements without meshing:
+
+    surface   sum over the triangles of area / (sqrt(3)/4 h^2)
+    volume    integral over the enclosed volume of 1 / (h^3 / 6 sqrt(2)),
+              sampled at points inside the surface
+    boundary  num_lyr prisms per wall surface element
+
+where h is the edge size in effect at a location: GlobalEdgeSize,
+LocalEdgeSize per face, sphere/cylinder refinement regions or a
+MeshSizingFunction point array. These are the element counts of meshes of
+regular elements; a Calibration fitted to recorded runs (see record)
+corrects them for what TetGen actually produces and converts the element
+count to peak memory and runtime.
+
+A scheduler can drop oversized jobs before running them:
+
+    accepted, rejected = screen(jobs, max_elements=2e6, calibration=Calibration.from_file('runs.jsonl'))
+    results = sv_jobs.run_jobs(accepted) + rejected
+"""
+import os
+import json
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+import sv_cache
+import sv_vtkxml
+import sv_sizing
+
+# area of an equilateral triangle and volume of a regular tetrahedron with edge 1
+TRIANGLE_AREA = np.sqrt(3.) / 4.
+TET_VOLUME = 1. / (6. * np.sqrt(2.))
+
+_models = {}
+
+class Calibration(object):
+    """
+    Correction factors from raw element counts to measured meshes
+
+    Attributes:
+        volume_factor, surface_factor: measured / raw element counts
+        seconds_per_element, seconds_exponent: runtime = a * elements ** b
+        base_bytes, bytes_per_element: peak memory = base + k * elements
+    """
+    DEFAULTS = {
+            'volume_factor': 1.,
+            'surface_factor': 1.,
+            'seconds_per_element': 1e-5,
+            'seconds_exponent': 1.,
+            'base_bytes': 3e8,
+            'bytes_per_element': 1e3,
+    }
+
+    def __init__(self, **kwargs):
+        for key, value in self.DEFAULTS.items():
+            setattr(self, key, float(kwargs.pop(key, value)))
+        if kwargs:
+            raise TypeError("Unknown calibration parameters: " + ", ".join(kwargs))
+
+    def as_dict(self):
+        return dict((key, getattr(self, key)) for key in self.DEFAULTS)
+
+    @classmethod
+    def fit(cls, records):
+        """
+        Fit the factors to records written by record()
+
+        Factors without enough data keep their defaults.
+        """
+        cal = cls()
+        volume = [(r['elements'] - r['raw']['boundary_layer']) / r['raw']['volume'] for r in records
+                if r.get('elements') is not None and r['raw']['volume']]
+        if volume:
+            cal.volume_factor = float(np.median(volume))
+        surface = [r['surface_elements'] / r['raw']['surface'] for r in records
+                if r.get('surface_elements') is not None and r['raw']['surface']]
+        if surface:
+            cal.surface_factor = float(np.median(surface))
+
+        timed = [(r['elements'], r['seconds']) for r in records
+                if r.get('elements') and r.get('seconds')]
+        n = np.array([t[0] for t in timed], dtype=np.float64)
+        if len(timed) > 1 and np.ptp(np.log(n)) > 0:
+            b, log_a = np.polyfit(np.log(n), np.log([t[1] for t in timed]), 1)
+            cal.seconds_per_element, cal.seconds_exponent = float(np.exp(log_a)), float(b)
+        elif timed:
+            cal.seconds_per_element = float(np.median([t / e for e, t in timed]))
+            cal.seconds_exponent = 1.
+
+        measured = [(r['elements'], r['peak_rss']) for r in records
+                if r.get('elements') and r.get('peak_rss')]
+        n = np.array([m[0] for m in measured], dtype=np.float64)
+        if len(measured) > 1 and np.ptp(n) > 0:
+            k, base = np.polyfit(n, [m[1] for m in measured], 1)
+            cal.bytes_per_element, cal.base_bytes = float(max(k, 0.)), float(max(base, 0.))
+        elif measured:
+            cal.bytes_per_element = float(max(measured[0][1] - cal.base_bytes, 0.) / measured[0][0])
+        return cal
+
+    @classmethod
+    def from_file(cls, fn):
+        """
+        Fit to the records of a JSON lines file, defaults if it does not exist
+        """
+        if not os.path.exists(fn):
+            return cls()
+        with open(fn) as f:
+            return cls.fit([json.loads(line) for line in f if line.strip()])
+
+def record(fn, estimate, elements=None, surface_elements=None, seconds=None, peak_rss=None):
+    """
+    Append the estimate and the measured result of a run to a JSON lines file
+    """
+    entry = {
+            'raw': estimate['raw'],
+            'elements': elements,
+            'surface_elements': surface_elements,
+            'seconds': seconds,
+            'peak_rss': peak_rss,
+    }
+    with open(fn, 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+def record_job(fn, job, result):
+    """
+    Record a finished sv_jobs/sv_async job, using its num_elements,
+    wall_time and peak_rss
+    """
+    if result['ok']:
+        record(fn, estimate_job(job), elements=result.get('num_elements'),
+                seconds=result['wall_time'], peak_rss=result.get('peak_rss'))
+
+def sizing_args(mesh_ops, sph_rfn_ops=None, cyl_rfn_ops=None, local_edge_size=None):
+    """
+    Sizing description from sv_mesh style arguments
+
+    Args:
+        mesh_ops: mesh options, GlobalEdgeSize and optionally LocalEdgeSize
+            ([face id, size, face id, size, ...]) and MeshSizingFunction
+        sph_rfn_ops: {'size', 'rad', 'center'} of SetSphereRefinement
+        cyl_rfn_ops: {'size', 'rad', 'length', 'center', 'nrm'} of SetCylinderRefinement
+        local_edge_size: LocalEdgeSize list, overrides mesh_ops
+    """
+    local = local_edge_size if local_edge_size is not None else mesh_ops.get('LocalEdgeSize')
+    regions = []
+    if sph_rfn_ops is not None:
+        regions.append({'type': 'sphere', 'size': sph_rfn_ops['size'],
+            'center': sph_rfn_ops['center'], 'radius': sph_rfn_ops['rad']})
+    if cyl_rfn_ops is not None:
+        regions.append({'type': 'cylinder', 'size': cyl_rfn_ops['size'], 'center': cyl_rfn_ops['center'],
+            'radius': cyl_rfn_ops['rad'], 'length': cyl_rfn_ops['length'], 'axis': cyl_rfn_ops['nrm']})
+    return {
+            'global': float(mesh_ops['GlobalEdgeSize']),
+            'faces': dict(zip(local[::2], local[1::2])) if local else {},
+            'regions': regions,
+            'sizing_function': 'MeshSizingFunction' in mesh_ops,
+    }
+
+def _in_region(x, region):
+    center = np.asarray(region['center'], dtype=np.float64)
+    if region['type'] == 'sphere':
+        return np.sum((x - center) ** 2, axis=1) <= region['radius'] ** 2
+    axis = np.asarray(region['axis'], dtype=np.float64)
+    axis = axis / np.linalg.norm(axis)
+    t = (x - center).dot(axis)
+    radial = np.sum((x - center - t[:, None] * axis) ** 2, axis=1)
+    return (np.abs(t) <= 0.5 * region['length']) & (radial <= region['radius'] ** 2)
+
+class SurfaceModel(object):
+    """
+    Area, enclosed volume and inside test of a closed triangle surface
+
+    Args:
+        points, triangles: the surface
+        face_ids: ModelFaceID per triangle, needed for LocalEdgeSize and walls
+        point_data: point arrays of the surface, e.g. MeshSizingFunction
+    """
+    def __init__(self, points, triangles, face_ids=None, point_data=None):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.triangles = np.asarray(triangles, dtype=np.int64)
+        self.face_ids = None if face_ids is None else np.asarray(face_ids)
+        self.point_data = point_data or {}
+        p0, p1, p2 = (self.points[self.triangles[:, k]] for k in range(3))
+        self.tri_areas = 0.5 * np.linalg.norm(np.cross(p1 - p0, p2 - p0), axis=1)
+        self.centroids = (p0 + p1 + p2) / 3.
+        self.area = self.tri_areas.sum()
+        self.volume = abs(np.einsum('ij,ij->i', p0, np.cross(p1, p2)).sum()) / 6.
+        self.normals, _ = sv_sizing.point_normals_areas(self.points, self.triangles)
+        self.tree = cKDTree(self.points)
+        self._samples = {}
+
+    @classmethod
+    def from_mesh(cls, mesh, angle=None):
+        """
+        Model of a MeshArrays surface; face ids from GetBoundaryFaces(angle)
+        if angle is given, else from its ModelFaceID array
+        """
+        if angle is not None:
+            import sv_segment
+            face_ids = sv_segment.FaceSegmenter.from_mesh(mesh).segment(angle)
+        else:
+            face_ids = mesh.cell_data['ModelFaceID'] if 'ModelFaceID' in mesh.cell_data else None
+        point_data = {}
+        if sv_sizing.SIZING_ARRAY in mesh.point_data:
+            point_data[sv_sizing.SIZING_ARRAY] = mesh.point_data[sv_sizing.SIZING_ARRAY]
+        return cls(mesh.points, mesh.cell_array(3), face_ids, point_data)
+
+    @classmethod
+    def from_file(cls, fn, angle=None):
+        """
+        Model of a .vtp file, memoized per file content and angle
+        """
+        key = (sv_cache.file_digest(fn), angle)
+        if key not in _models:
+            _models[key] = cls.from_mesh(sv_vtkxml.read(fn), angle)
+        return _models[key]
+
+    @classmethod
+    def from_repository(cls, name, angle=None):
+        import sv_io
+        return cls.from_mesh(sv_io.export_arrays(name), angle)
+
+    def inside(self, x):
+        """
+        Whether points lie inside the surface, judged by the normal of the closest surface point
+        """
+        # no inside point is farther from the surface than half the smallest extent
+        bound = 0.5 * np.ptp(self.points, axis=0).min()
+        d, i = self.tree.query(x, distance_upper_bound=bound)
+        near = np.isfinite(d)
+        result = np.zeros(len(x), dtype=bool)
+        result[near] = np.einsum('ij,ij->i', x[near] - self.points[i[near]], self.normals[i[near]]) < 0.
+        return result
+
+    def volume_samples(self, samples=200000, seed=0):
+        """
+        Random points inside the surface, drawn from `samples` points in
+        the bounding box and kept for later estimates
+        """
+        key = (int(samples), seed)
+        if key not in self._samples:
+            lo, hi = self.points.min(axis=0), self.points.max(axis=0)
+            x = lo + (hi - lo) * np.random.RandomState(seed).random_sample((int(samples), 3))
+            self._samples[key] = x[self.inside(x)]
+        return self._samples[key]
+
+    def _point_sizes(self, sizing):
+        """
+        Edge size at the surface points from the face sizes and sizing function
+        """
+        h = np.full(len(self.points), sizing['global'])
+        if sizing['faces'] and self.face_ids is not None:
+            tri_h = np.full(len(self.triangles), sizing['global'])
+            for face, size in sizing['faces'].items():
+                tri_h[self.face_ids == face] = size
+            for k in range(3):
+                np.minimum.at(h, self.triangles[:, k], tri_h)
+        if sizing['sizing_function'] and sv_sizing.SIZING_ARRAY in self.point_data:
+            h = np.minimum(h, self.point_data[sv_sizing.SIZING_ARRAY])
+        return h
+
+    def _apply_regions(self, h, x, sizing):
+        for region in sizing['regions']:
+            h = np.where(_in_region(x, region), np.minimum(h, region['size']), h)
+        return h
+
+    def estimate(self, sizing, bl_ops=None, walls=None, calibration=None, samples=200000, seed=0):
+        """
+        Predict the mesh size for a sizing description (see sizing_args)
+
+        Args:
+            bl_ops: SetBoundaryLayer arguments, {'num_lyr', ...}
+            walls: face ids the boundary layer is grown on, all faces if None
+            calibration: Calibration, defaults if None
+            samples: volume sample points in the bounding box
+        Returns:
+            dict with surface_elements, volume_elements, boundary_layer_elements,
+            elements, bytes, seconds and the uncalibrated counts under 'raw'
+        """
+        cal = calibration or Calibration()
+        point_h = self._point_sizes(sizing)
+        tri_h = point_h[self.triangles].mean(axis=1)
+        tri_h = self._apply_regions(tri_h, self.centroids, sizing)
+        tri_count = self.tri_areas / (TRIANGLE_AREA * tri_h ** 2)
+        surface = tri_count.sum()
+
+        boundary_layer = 0.
+        if bl_ops is not None:
+            wall = np.ones(len(self.triangles), dtype=bool)
+            if walls is not None and self.face_ids is not None:
+                wall = np.isin(self.face_ids, walls)
+            boundary_layer = bl_ops['num_lyr'] * tri_count[wall].sum()
+
+        x = self.volume_samples(samples, seed)
+        # rescale to the exact enclosed volume to cancel sampling and inside test errors
+        cell_volume = self.volume / max(len(x), 1)
+        if sizing['faces'] or sizing['sizing_function']:
+            # TetGen interpolates the surface sizes into the volume
+            d, i = self.tree.query(x, k=4)
+            w = 1. / np.maximum(d, 1e-12)
+            h = np.sum(w * point_h[i], axis=1) / w.sum(axis=1)
+        else:
+            h = np.full(len(x), sizing['global'])
+        h = self._apply_regions(h, x, sizing)
+        volume = np.sum(cell_volume / (TET_VOLUME * h ** 3))
+
+        elements = cal.volume_factor * volume + boundary_layer
+        return {
+                'surface_elements': int(round(cal.surface_factor * surface)),
+                'volume_elements': int(round(cal.volume_factor * volume)),
+                'boundary_layer_elements': int(round(boundary_layer)),
+                'elements': int(round(elements)),
+                'bytes': cal.base_bytes + cal.bytes_per_element * elements,
+                'seconds': cal.seconds_per_element * elements ** cal.seconds_exponent,
+                'area': self.area,
+                'volume': self.volume,
+                'raw': {'surface': surface, 'volume': volume, 'boundary_layer': boundary_layer},
+        }
+
+def estimate_job(job, calibration=None, samples=200000):
+    """
+    Estimate an sv_jobs job from its solid file and arguments
+    """
+    scenario = job['scenario']
+    refine_ops = job.get('refine_ops') or {}
+    bl_ops, walls = None, None
+    if scenario == 'local_size_function':
+        model = SurfaceModel.from_file(job['solid'], 50.)
+        sizing = sizing_args({'GlobalEdgeSize': refine_ops['global_edge_size']},
+                local_edge_size=refine_ops['local_edge_size'])
+        bl_ops = refine_ops.get('bl_ops')
+        walls = bl_ops['wall'] if bl_ops is not None else None
+    else:
+        model = SurfaceModel.from_file(job['solid'], 80.)
+        sizing = sizing_args(job['mesh_ops'],
+                sph_rfn_ops=refine_ops if scenario == 'sphere_refine' else None,
+                cyl_rfn_ops=refine_ops if scenario == 'cylinder_refine' else None)
+        if scenario == 'boundary_layer':
+            # sv_mesh.boundary_layer grows the layers on face 2
+            bl_ops, walls = refine_ops, [2]
+    return model.estimate(sizing, bl_ops, walls, calibration, samples)
+
+def screen(jobs, max_elements=None, max_seconds=None, max_bytes=None, calibration=None):
+    """
+    Split jobs into those within the limits and report entries of the others
+
+    Returns:
+        (accepted jobs, sv_jobs style failure entries of the rejected jobs)
+    """
+    accepted, rejected = [], []
+    for job in jobs:
+        est = estimate_job(job, calibration)
+        reasons = []
+        if max_elements is not None and est['elements'] > max_elements:
+            reasons.append("%d elements > %d" % (est['elements'], max_elements))
+        if max_seconds is not None and est['seconds'] > max_seconds:
+            reasons.append("%.0f s > %.0f s" % (est['seconds'], max_seconds))
+        if max_bytes is not None and est['bytes'] > max_bytes:
+            reasons.append("%.0f MB > %.0f MB" % (est['bytes'] / 1e6, max_bytes / 1e6))
+        if not reasons:
+            accepted.append(job)
+            continue
+        rejected.append({
+                'name': job.get('name'),
+                'scenario': job.get('scenario'),
+                'ok': False,
+                'wall_time': 0.,
+                'error': "Rejected, estimated " + "; ".join(reasons),
+                'pid': None,
+                'estimate': est,
+        })
+    return accepted, rejected
+
+def print_estimate(est):
+    print("surface %d, volume %d (boundary layer %d) elements, ~%.0f MB, ~%.1f s" % (
+        est['surface_elements'], est['volume_elements'] + est['boundary_layer_elements'],
+        est['boundary_layer_elements'], est['bytes'] / 1e6, est['seconds']))
+
+if __name__ == '__main__':
+    import sys
+    import time
+    fn = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cylinder.vtp')
+    model = SurfaceModel.from_file(fn, 80.)
+    print("area %.3f, volume %.3f" % (model.area, model.volume))
+    for size in (0.5, 0.25):
+        start = time.time()
+        est = model.estimate(sizing_args({'GlobalEdgeSize': size}))
+        print("GlobalEdgeSize %g, estimated in %.2f s:" % (size, time.time() - start))
+        print_estimate(est)
+    est = model.estimate(sizing_args({'GlobalEdgeSize': 0.5}, sph_rfn_ops={'size':0.2, 'rad':1, 'center':[0,0,0]}))
+    print("sphere refinement:")
+    print_estimate(est)
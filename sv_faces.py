@@ -0,0 +1,234 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Face Access
+"""
+Indexed access to the faces of a surface mesh
+
+FaceIndex groups the cells of a surface by ModelFaceID once; any subset of
+faces (caps, walls) can then be extracted as compact arrays with the
+points renumbered, without GetFacePolyData calls or copies of the whole
+surface. GlobalNodeID values are mapped back to local point ids of the
+surface and, if given, of the volume mesh, as needed for boundary
+condition setup. write_faces writes every face to its own file in one
+pass.
+
+Example:
+    faces = FaceIndex.from_file('cylinder.vtp')
+    cap = faces.extract([2])            # MeshArrays of face 2
+    wall_nodes = faces.node_ids([1])    # GlobalNodeID of the wall nodes
+    faces.write_faces('test/faces')     # face_1.vtp, face_2.vtp, ...
+"""
+import os
+
+import numpy as np
+
+import sv_vtkxml
+
+FACE_ARRAY = 'ModelFaceID'
+NODE_ARRAY = 'GlobalNodeID'
+
+class FaceIndex(object):
+    """
+    Cells of a triangle surface grouped by face id
+
+    Args:
+        mesh: sv_vtkxml.MeshArrays surface with a ModelFaceID cell array
+        volume: optional MeshArrays of the volume mesh sharing GlobalNodeID
+    """
+    def __init__(self, mesh, volume=None):
+        self.mesh = mesh
+        self.triangles = mesh.cell_array(3)
+        face_ids = np.asarray(mesh.cell_data[FACE_ARRAY]).ravel()
+        self.order = np.argsort(face_ids, kind='stable')
+        self.face_ids, starts = np.unique(face_ids[self.order], return_index=True)
+        bounds = np.append(starts, len(face_ids))
+        self._ranges = dict((int(face), (bounds[i], bounds[i+1])) for i, face in enumerate(self.face_ids))
+        self._global = self._id_map(mesh)
+        self._volume_global = self._id_map(volume) if volume is not None else None
+        self._split = None
+
+    @staticmethod
+    def _id_map(mesh):
+        """
+        Sorted GlobalNodeID values and the point ids they belong to
+        """
+        if NODE_ARRAY not in mesh.point_data:
+            return None
+        ids = np.asarray(mesh.point_data[NODE_ARRAY]).ravel()
+        order = np.argsort(ids, kind='stable')
+        return ids[order], order
+
+    @classmethod
+    def from_file(cls, fn, volume_fn=None):
+        return cls(sv_vtkxml.read(fn), sv_vtkxml.read(volume_fn) if volume_fn is not None else None)
+
+    @classmethod
+    def from_repository(cls, name, volume_name=None):
+        import sv_io
+        volume = sv_io.export_arrays(volume_name) if volume_name is not None else None
+        return cls(sv_io.export_arrays(name), volume)
+
+    @property
+    def faces(self):
+        return [int(face) for face in self.face_ids]
+
+    def cells(self, faces):
+        """
+        Ids of the surface cells on the given faces
+        """
+        faces = [faces] if np.isscalar(faces) else faces
+        parts = [self.order[slice(*self._ranges[int(face)])] for face in faces if int(face) in self._ranges]
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+
+    def points(self, faces):
+        """
+        Ids of the surface points on the given faces, sorted
+        """
+        return np.unique(self.triangles[self.cells(faces)])
+
+    def node_ids(self, faces):
+        """
+        GlobalNodeID values of the points on the given faces
+        """
+        if NODE_ARRAY not in self.mesh.point_data:
+            raise ValueError("Mesh has no %s array" % NODE_ARRAY)
+        return np.asarray(self.mesh.point_data[NODE_ARRAY])[self.points(faces)]
+
+    def _lookup(self, id_map, global_ids):
+        if id_map is None:
+            raise ValueError("Mesh has no %s array" % NODE_ARRAY)
+        sorted_ids, order = id_map
+        global_ids = np.asarray(global_ids)
+        pos = np.clip(np.searchsorted(sorted_ids, global_ids), 0, max(len(sorted_ids) - 1, 0))
+        if len(global_ids) and not np.array_equal(sorted_ids[pos], global_ids):
+            raise KeyError("Unknown %s values" % NODE_ARRAY)
+        return order[pos]
+
+    def local_ids(self, global_ids):
+        """
+        Surface point ids of GlobalNodeID values
+        """
+        return self._lookup(self._global, global_ids)
+
+    def volume_ids(self, global_ids):
+        """
+        Volume mesh point ids of GlobalNodeID values
+        """
+        if self._volume_global is None:
+            raise ValueError("FaceIndex was built without a volume mesh")
+        return self._lookup(self._volume_global, global_ids)
+
+    def _subset(self, cells, points):
+        """
+        MeshArrays of the given cells, points renumbered in the order of `points`
+        """
+        local = np.full(len(self.mesh.points), -1, dtype=np.int64)
+        local[points] = np.arange(len(points))
+        conn = local[self.triangles[cells]]
+        dtype = np.asarray(self.mesh.connectivity).dtype
+        mesh = sv_vtkxml.MeshArrays('PolyData',
+                points=np.asarray(self.mesh.points)[points],
+                connectivity=conn.ravel().astype(dtype),
+                offsets=np.arange(1, len(cells) + 1, dtype=dtype) * 3,
+                point_data=dict((name, np.asarray(array)[points]) for name, array in self.mesh.point_data.items()),
+                cell_data=dict((name, np.asarray(array)[cells]) for name, array in self.mesh.cell_data.items()))
+        mesh.num_points = len(points)
+        mesh.num_cells = len(cells)
+        return mesh
+
+    def extract(self, faces):
+        """
+        Compact MeshArrays of the given faces with the point and cell arrays of the surface
+        """
+        cells = self.cells(faces)
+        return self._subset(cells, np.unique(self.triangles[cells]))
+
+    def split(self):
+        """
+        MeshArrays of every face, computed in one pass over the surface
+
+        Returns:
+            dict face id -> MeshArrays
+        """
+        if self._split is None:
+            ncells = len(self.order)
+            faces = np.repeat(np.arange(len(self.face_ids)),
+                    np.diff([self._ranges[int(face)][0] for face in self.face_ids] + [ncells]))
+            # (face, point) pairs of all faces, sorted; each face's points are contiguous
+            pairs = np.unique(faces[:, None] * len(self.mesh.points) + self.triangles[self.order])
+            pair_face = pairs // len(self.mesh.points)
+            starts = np.searchsorted(pair_face, np.arange(len(self.face_ids) + 1))
+            self._split = {}
+            for i, face in enumerate(self.face_ids):
+                begin, end = self._ranges[int(face)]
+                points = pairs[starts[i]:starts[i+1]] % len(self.mesh.points)
+                self._split[int(face)] = self._subset(self.order[begin:end], points)
+        return self._split
+
+    def write_faces(self, out_dir, prefix='face_', faces=None, threads=None):
+        """
+        Write each face to out_dir/<prefix><face id>.vtp
+
+        Args:
+            faces: face ids to write, all if None
+            threads: writer threads; zlib compression releases the GIL
+        Returns:
+            dict face id -> file name
+        """
+        try:
+            os.makedirs(out_dir)
+        except OSError:
+            if not os.path.isdir(out_dir):
+                raise
+        split = self.split() if faces is None else dict((int(f), self.extract([f])) for f in faces)
+        fns = dict((face, os.path.join(out_dir, '%s%d.vtp' % (prefix, face))) for face in split)
+        if threads == 1:
+            for face in split:
+                sv_vtkxml.write(fns[face], split[face])
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(threads) as pool:
+                list(pool.map(lambda face: sv_vtkxml.write(fns[face], split[face]), split))
+        return fns
+
+if __name__ == '__main__':
+    import sys
+    import time
+    base = os.path.dirname(os.path.abspath(__file__))
+    fn = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base, 'cylinder.vtp')
+    start = time.time()
+    faces = FaceIndex.from_file(fn)
+    print("indexed %d faces in %.1f ms" % (len(faces.faces), (time.time() - start) * 1000.))
+    for face in faces.faces:
+        print("face %d: %d cells, %d points" % (face, len(faces.cells(face)), len(faces.points([face]))))
+    start = time.time()
+    fns = faces.write_faces(os.path.join(base, 'test', 'faces'))
+    print("wrote %d faces in %.1f ms" % (len(fns), (time.time() - start) * 1000.))
@@ -32,17 +32,15 @@
 # Author: Fanwei Kong (fanwei_kong@berkeley.edu)
 import os
 from sv import *
+import sv_io
+from sv_session import clean_repos
 def geom_local_constrain_smooth():
     out_dir = os.path.join(os.path.dirname(__file__), 'test')
     try:
         os.makedirs(out_dir)
     except Exception as e: print(e)
-    objs = Repository.List()
-    for name in objs:
-        try:
-            Repository.Delete(name)
-        except Exception as e: print(e)
-    
+    clean_repos()
+
     # create geometry: two intersected cylinders
     Solid.SetKernel('PolyData')
     cyl_1 = Solid.pySolidModel()
@@ -64,11 +62,11 @@ def geom_local_constrain_smooth():
     Geom.Set_array_for_local_op_sphere('poly3', 'smth', 3, [0,0,0],'LocalOpsArray', 0)
     Geom.Set_array_for_local_op_sphere('smth', 'smth2', 3, [0,0,0],'LocalOpsArray', 1)
     # check arrays on surfaces 
-    Repository.WriteVtkPolyData('smth2', 'ascii', output_1)
+    sv_io.write_polydata('smth2', output_1)
     # local constrained smoothing: name, dst_name, iter, relax_factor, numcgsolves, pt array name, cell array name
     Geom.Local_constrain_smooth('smth2', 'smth3', 5, 0.8, 30, 'LocalOpsArray','LocalOpsArray')
     output = os.path.join(out_dir, 'geom_test_local_smooth.vtk')
-    Repository.WriteVtkPolyData('smth3', 'ascii', output)
+    sv_io.write_polydata('smth3', output)
 
 
 if __name__ == '__main__':
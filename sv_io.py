@@ -0,0 +1,384 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Output Helpers
+"""
+Output format layer for writing Repository objects to disk
+
+All example scripts write polydata and unstructured grids through
+write_polydata/write_ugrid instead of calling Repository.WriteVtk* with a
+hard-coded 'ascii' flag. .vtk outputs stay ASCII unless a format is
+given per call or set with set_default_format. Supported formats:
+
+    ascii   legacy .vtk, ASCII (Repository.WriteVtk*)
+    binary  legacy .vtk, binary (Repository.WriteVtk*)
+    xml     VTK XML (.vtp/.vtu), raw appended binary data
+    zlib    VTK XML (.vtp/.vtu), appended data compressed with vtkZLibDataCompressor
+    stream  same layout as zlib, written block by block by sv_vtkxml so the
+            peak extra memory does not grow with the mesh size
+
+Unstructured grids can be renumbered for locality before they are written,
+see set_default_reorder and sv_reorder.
+"""
+import os
+import threading
+from sv import *
+
+import numpy as np
+import sv_vtkxml
+
+FORMATS = ('ascii', 'binary', 'xml', 'zlib', 'stream')
+LEGACY_FORMATS = ('ascii', 'binary')
+
+_default_format = 'ascii'
+_default_reorder = None
+_writers = []
+
+def set_default_format(fmt):
+    """
+    Set the format used for .vtk outputs when no format is given
+    """
+    global _default_format
+    if fmt not in FORMATS:
+        raise ValueError("Unknown output format: " + str(fmt))
+    _default_format = fmt
+
+def get_default_format():
+    return _default_format
+
+def set_default_reorder(method):
+    """
+    Renumber unstructured grids with an sv_reorder method ('rcm', 'morton')
+    before writing them; None writes them in TetGen order
+    """
+    global _default_reorder
+    if method is not None:
+        import sv_reorder
+        if method not in sv_reorder.METHODS:
+            raise ValueError("Unknown reordering method: " + str(method))
+    _default_reorder = method
+
+def get_default_reorder():
+    return _default_reorder
+
+def resolve_format(fn, fmt=None):
+    """
+    Pick the output format for a file
+
+    XML file extensions (.vtp/.vtu) default to zlib compressed XML, any
+    other extension uses the module default format.
+    """
+    if fmt is None:
+        ext = os.path.splitext(fn)[1].lower()
+        fmt = 'zlib' if ext in ('.vtp', '.vtu') else _default_format
+    if fmt not in FORMATS:
+        raise ValueError("Unknown output format: " + str(fmt))
+    return fmt
+
+def _write_xml(obj, fn, kind, fmt):
+    import vtk
+    if kind == 'polydata':
+        writer = vtk.vtkXMLPolyDataWriter()
+    else:
+        writer = vtk.vtkXMLUnstructuredGridWriter()
+    writer.SetInputData(obj)
+    writer.SetFileName(fn)
+    writer.SetDataModeToAppended()
+    writer.EncodeAppendedDataOff()
+    if fmt == 'zlib':
+        writer.SetCompressorTypeToZLib()
+    else:
+        writer.SetCompressorTypeToNone()
+    if not writer.Write():
+        raise RuntimeError("Error writing " + fn)
+
+def _write_legacy(obj, fn, kind, fmt):
+    import vtk
+    if kind == 'polydata':
+        writer = vtk.vtkPolyDataWriter()
+    else:
+        writer = vtk.vtkUnstructuredGridWriter()
+    writer.SetInputData(obj)
+    writer.SetFileName(fn)
+    if fmt == 'binary':
+        writer.SetFileTypeToBinary()
+    else:
+        writer.SetFileTypeToASCII()
+    if not writer.Write():
+        raise RuntimeError("Error writing " + fn)
+
+def _prepare(name, fn, kind, fmt, reorder=None):
+    """
+    Return a callable that writes the object; XML outputs export the
+    Repository object to VTK right away
+    """
+    if reorder is not None:
+        import sv_reorder
+        mesh, _, _ = sv_reorder.reorder(export_arrays(name), reorder)
+        if fmt == 'stream':
+            return lambda: sv_vtkxml.write(fn, mesh)
+        obj = arrays_to_vtk(mesh)
+        if fmt in LEGACY_FORMATS:
+            return lambda: _write_legacy(obj, fn, kind, fmt)
+        return lambda: _write_xml(obj, fn, kind, fmt)
+    if fmt in LEGACY_FORMATS:
+        if kind == 'polydata':
+            return lambda: Repository.WriteVtkPolyData(name, fmt, fn)
+        return lambda: Repository.WriteVtkUnstructuredGrid(name, fmt, fn)
+    if fmt == 'stream':
+        mesh = export_arrays(name)
+        return lambda: sv_vtkxml.write(fn, mesh)
+    obj = Repository.ExportToVtk(name)
+    return lambda: _write_xml(obj, fn, kind, fmt)
+
+def _dispatch(name, fn, kind, fmt, background, reorder=None):
+    fmt = resolve_format(fn, fmt)
+    task = _prepare(name, fn, kind, fmt, reorder)
+    if not background:
+        task()
+        return None
+    # the repository object must not be deleted or modified until wait()
+    writer = _BackgroundWriter(fn, task)
+    _writers.append(writer)
+    writer.start()
+    return writer
+
+class _BackgroundWriter(threading.Thread):
+    def __init__(self, fn, task):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.fn = fn
+        self.error = None
+        self._task = task
+
+    def run(self):
+        try:
+            self._task()
+        except Exception as e:
+            self.error = e
+
+def write_polydata(name, fn, fmt=None, background=False):
+    """
+    Write a Repository polydata object
+
+    Args:
+        name: Repository object name
+        fn: output file name
+        fmt: one of FORMATS, chosen from the file extension if None
+        background: write in a background thread; call wait() before
+            relying on the file
+    """
+    return _dispatch(name, fn, 'polydata', fmt, background)
+
+def write_ugrid(name, fn, fmt=None, background=False, reorder=None):
+    """
+    Write a Repository unstructured grid object, see write_polydata
+
+    Args:
+        reorder: sv_reorder method to renumber nodes and cells with, the
+            module default (see set_default_reorder) if None
+    """
+    return _dispatch(name, fn, 'ugrid', fmt, background, reorder or _default_reorder)
+
+def wait():
+    """
+    Wait for all background writes and raise the first error, if any
+    """
+    error = None
+    while _writers:
+        writer = _writers.pop(0)
+        writer.join()
+        if writer.error is not None and error is None:
+            error = RuntimeError("Error writing %s: %s" % (writer.fn, writer.error))
+    if error is not None:
+        raise error
+
+def vtk_to_arrays(obj):
+    """
+    Convert a vtkPolyData/vtkUnstructuredGrid to sv_vtkxml.MeshArrays
+    """
+    from vtk.util import numpy_support
+    if obj.IsA('vtkPolyData'):
+        kind = 'PolyData'
+        cells = obj.GetPolys()
+        types = None
+        if cells.GetNumberOfCells() == 0 and obj.GetLines().GetNumberOfCells() > 0:
+            # as sv_vtkxml.read, polydata without polygons exposes its lines, e.g. centerlines
+            cells = obj.GetLines()
+    else:
+        kind = 'UnstructuredGrid'
+        cells = obj.GetCells()
+        types = numpy_support.vtk_to_numpy(obj.GetCellTypesArray())
+    if hasattr(cells, 'GetConnectivityArray'):
+        connectivity = numpy_support.vtk_to_numpy(cells.GetConnectivityArray())
+        offsets = numpy_support.vtk_to_numpy(cells.GetOffsetsArray())[1:]
+    else:
+        # legacy cell array: [npts, id0, id1, ..., npts, ...]
+        legacy = numpy_support.vtk_to_numpy(cells.GetData())
+        ncells = cells.GetNumberOfCells()
+        npts = int(legacy[0]) if len(legacy) else 0
+        if len(legacy) == ncells * (npts + 1) and np.all(legacy[::npts+1] == npts):
+            connectivity = legacy.reshape(ncells, npts + 1)[:, 1:].ravel()
+            offsets = np.arange(1, ncells + 1, dtype=legacy.dtype) * npts
+        else:
+            sizes = np.empty(ncells, dtype=legacy.dtype)
+            pos = 0
+            for i in range(ncells):
+                sizes[i] = legacy[pos]
+                pos += sizes[i] + 1
+            starts = np.cumsum(sizes + 1) - sizes
+            offsets = np.cumsum(sizes)
+            index = np.repeat(starts - (offsets - sizes), sizes) + np.arange(offsets[-1] if ncells else 0)
+            connectivity = legacy[index]
+    mesh = sv_vtkxml.MeshArrays(kind,
+            points=numpy_support.vtk_to_numpy(obj.GetPoints().GetData()),
+            connectivity=connectivity, offsets=offsets, types=types)
+    for data, arrays in ((obj.GetPointData(), mesh.point_data), (obj.GetCellData(), mesh.cell_data)):
+        for i in range(data.GetNumberOfArrays()):
+            array = data.GetArray(i)
+            if array is not None:
+                arrays[array.GetName()] = numpy_support.vtk_to_numpy(array)
+    mesh.num_points = obj.GetNumberOfPoints()
+    mesh.num_cells = obj.GetNumberOfCells()
+    return mesh
+
+def arrays_to_vtk(mesh):
+    """
+    Convert sv_vtkxml.MeshArrays to a vtkPolyData/vtkUnstructuredGrid
+    """
+    import vtk
+    from vtk.util import numpy_support
+    def to_vtk(array):
+        return numpy_support.numpy_to_vtk(np.ascontiguousarray(array), deep=1)
+    connectivity = np.asarray(mesh.connectivity, dtype=np.int64)
+    offsets = np.concatenate([[0], np.asarray(mesh.offsets, dtype=np.int64)])
+    cells = vtk.vtkCellArray()
+    if hasattr(cells, 'SetData') and hasattr(cells, 'GetConnectivityArray'):
+        cells.SetData(numpy_support.numpy_to_vtkIdTypeArray(offsets, deep=1),
+                numpy_support.numpy_to_vtkIdTypeArray(connectivity, deep=1))
+    else:
+        # legacy cell array: [npts, id0, id1, ..., npts, ...]
+        sizes = np.diff(offsets)
+        legacy = np.insert(connectivity, offsets[:-1], sizes)
+        cells.SetCells(len(sizes), numpy_support.numpy_to_vtkIdTypeArray(legacy, deep=1))
+    if mesh.kind == 'PolyData':
+        obj = vtk.vtkPolyData()
+        obj.SetPolys(cells)
+    else:
+        obj = vtk.vtkUnstructuredGrid()
+        types = numpy_support.numpy_to_vtk(np.asarray(mesh.types, dtype=np.uint8), deep=1,
+                array_type=vtk.VTK_UNSIGNED_CHAR)
+        obj.SetCells(types, cells)
+    points = vtk.vtkPoints()
+    points.SetData(to_vtk(mesh.points))
+    obj.SetPoints(points)
+    for arrays, data in ((mesh.point_data, obj.GetPointData()), (mesh.cell_data, obj.GetCellData())):
+        for array_name in arrays:
+            array = to_vtk(arrays[array_name])
+            array.SetName(array_name)
+            data.AddArray(array)
+    return obj
+
+def export_arrays(name):
+    """
+    NumPy arrays of a Repository polydata or unstructured grid object
+    """
+    return vtk_to_arrays(Repository.ExportToVtk(name))
+
+def import_polydata(obj, name):
+    """
+    Store a vtkPolyData in the Repository under name, replacing any existing object
+    """
+    if Repository.Exists(name):
+        Repository.Delete(name)
+    Repository.ImportVtkPd(obj, name)
+    return name
+
+def import_arrays(mesh, name):
+    """
+    Store polydata MeshArrays in the Repository under name
+    """
+    if mesh.kind != 'PolyData':
+        raise ValueError("Only polydata can be imported into the Repository")
+    return import_polydata(arrays_to_vtk(mesh), name)
+
+def read_polydata(fn, name):
+    """
+    Read a .vtp/.vtk polydata file into the Repository
+    """
+    import vtk
+    if fn.lower().endswith('.vtp'):
+        reader = vtk.vtkXMLPolyDataReader()
+    else:
+        reader = vtk.vtkPolyDataReader()
+    reader.SetFileName(fn)
+    reader.Update()
+    return import_polydata(reader.GetOutput(), name)
+
+def update_polydata(name, dst_name, points=None, point_data=None, cell_data=None):
+    """
+    Copy a Repository polydata, replacing its points and/or adding arrays
+
+    Args:
+        name: source polydata object
+        dst_name: Repository name of the copy
+        points: (npoints, 3) new coordinates, None to keep them
+        point_data, cell_data: dicts name -> NumPy array to add or replace
+    """
+    import vtk
+    from vtk.util import numpy_support
+    src = Repository.ExportToVtk(name)
+    obj = vtk.vtkPolyData()
+    obj.DeepCopy(src)
+    if points is not None:
+        vtk_points = vtk.vtkPoints()
+        vtk_points.SetData(numpy_support.numpy_to_vtk(np.ascontiguousarray(points), deep=1))
+        obj.SetPoints(vtk_points)
+    for arrays, data in ((point_data, obj.GetPointData()), (cell_data, obj.GetCellData())):
+        for array_name, values in (arrays or {}).items():
+            array = numpy_support.numpy_to_vtk(np.ascontiguousarray(values), deep=1)
+            array.SetName(array_name)
+            data.AddArray(array)
+    return import_polydata(obj, dst_name)
+
+def set_array(name, dst_name, array_name, values, data=0):
+    """
+    Copy a Repository polydata and attach a NumPy array to it
+
+    Args:
+        name: source polydata object
+        dst_name: Repository name of the copy
+        array_name: name of the new array, e.g. 'LocalOpsArray'
+        values: (n,) or (n, ncomp) array with one entry per point or cell
+        data: 0 for point data, 1 for cell data (like Geom.Set_array_for_local_op_*)
+    """
+    if data == 0:
+        return update_polydata(name, dst_name, point_data={array_name: values})
+    return update_polydata(name, dst_name, cell_data={array_name: values})
@@ -0,0 +1,285 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Job Scheduler
+"""
+Run the meshing scenarios of sv_mesh.py in parallel
+
+Every job runs in its own worker process, so each one gets a private
+Repository and clean_repos() in one job never touches another job's
+objects. Failures (Python exceptions or crashed workers) are collected
+in the returned report instead of being printed and dropped.
+"""
+import os
+import sys
+import time
+import resource
+import traceback
+import multiprocessing
+from multiprocessing.connection import wait
+
+# forked workers inherit models loaded by the parent process
+try:
+    _mp = multiprocessing.get_context('fork')
+except ValueError:
+    _mp = multiprocessing.get_context()
+
+SCENARIOS = ('mesh', 'sphere_refine', 'cylinder_refine', 'boundary_layer', 'local_size_function')
+
+def make_job(name, scenario, solid_fn, mesh_ops, fns_out, refine_ops=None, cache_dir=None,
+        quality_limits=None):
+    """
+    Build a job description for run_jobs
+
+    Args:
+        name: mesh object name, also used to label the job in the report
+        scenario: one of SCENARIOS, the sv_mesh function to call, or
+            sv_mesh2.local_size_function
+        solid_fn: solid model file passed to LoadModel
+        mesh_ops: dict of mesh options passed to SetMeshOptions
+        fns_out: (surface file, volume file) to write
+        refine_ops: sphere/cylinder refinement or boundary layer dict; for
+            local_size_function {'global_edge_size', 'local_edge_size', 'bl_ops'}
+        cache_dir: sv_cache.MeshCache directory to reuse meshes of earlier runs
+        quality_limits: sv_quality.check limits; the job fails if the
+            volume mesh violates them
+    """
+    if scenario not in SCENARIOS:
+        raise ValueError("Unknown meshing scenario: " + str(scenario))
+    if scenario == 'local_size_function':
+        mesh_ops = mesh_ops or {}
+    if scenario != 'mesh' and refine_ops is None:
+        raise ValueError("Scenario " + scenario + " requires refine_ops")
+    return {
+            'name': name,
+            'scenario': scenario,
+            'solid': solid_fn,
+            'mesh_ops': dict(mesh_ops),
+            'refine_ops': refine_ops,
+            'fns_out': tuple(fns_out),
+            'cache_dir': cache_dir,
+            'quality_limits': quality_limits,
+    }
+
+def peak_rss():
+    """
+    Peak resident set size of the current process in bytes
+    """
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def run_job(job, session=None):
+    """
+    Run one job in the current process and return its report entry
+
+    The entry of a finished job has the volume mesh element count
+    (num_elements) and the peak memory of the process (peak_rss), which
+    sv_estimate.record_job calibrates against. Without a session the
+    scenario cleans the whole Repository first, see sv_session.begin.
+    """
+    result = {
+            'name': job['name'],
+            'scenario': job['scenario'],
+            'ok': False,
+            'wall_time': 0.,
+            'error': None,
+            'pid': os.getpid(),
+    }
+    start = time.time()
+    try:
+        import sv_mesh
+        import sv_cache
+        cache = None
+        if job.get('cache_dir') is not None:
+            cache = sv_cache.MeshCache(job['cache_dir'])
+        sv_mesh.MeshObject.SetKernel('TetGen')
+        if job['scenario'] == 'local_size_function':
+            import sv_mesh2
+            ops = job['refine_ops']
+            sv_mesh2.local_size_function(job['name'], job['solid'], ops['global_edge_size'],
+                    ops['local_edge_size'], job['fns_out'], ops.get('bl_ops'), cache=cache, session=session)
+        elif job['scenario'] == 'mesh':
+            sv_mesh.mesh(job['name'], job['solid'], job['mesh_ops'], job['fns_out'], cache=cache,
+                    session=session)
+        else:
+            func = getattr(sv_mesh, job['scenario'])
+            func(job['name'], job['solid'], job['mesh_ops'], job['refine_ops'], job['fns_out'], cache=cache,
+                    session=session)
+        if cache is not None:
+            result['cache_hit'] = cache.hits > 0
+        if job['fns_out'][1] is not None:
+            import sv_io
+            result['num_elements'] = sv_io.export_arrays(job['fns_out'][1]).num_cells
+        if job.get('quality_limits') is not None:
+            import sv_quality
+            report = sv_quality.from_repository(job['fns_out'][1])
+            result['quality'] = report
+            failures = sv_quality.check(report, job['quality_limits'])
+            if failures:
+                raise RuntimeError("Mesh quality check failed: " + "; ".join(failures))
+        result['ok'] = True
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['wall_time'] = time.time() - start
+    result['peak_rss'] = peak_rss()
+    return result
+
+def _worker(target, job, conn):
+    try:
+        conn.send(target(job))
+    finally:
+        conn.close()
+
+def _receive(entry):
+    """
+    Read the result of a running job if its worker has sent it
+
+    A worker killed during send() leaves a truncated message; the job is
+    then reported as a failure.
+    """
+    recv = entry[3]
+    try:
+        if recv.poll():
+            entry[5] = recv.recv()
+            recv.close()
+    except (EOFError, OSError):
+        recv.close()
+
+def run_jobs(jobs, processes=None, timeout=None, target=run_job):
+    """
+    Run jobs in worker processes, at most `processes` at a time
+
+    A fresh process is started for every job so that no Repository state
+    leaks between jobs. A worker that dies without reporting (e.g. a crash
+    inside TetGen) or exceeds `timeout` seconds is reported as a failure.
+    `target` is called with the job dict in the worker and must return a
+    report entry like run_job does; workers are forked, so it may use
+    state loaded in the parent process.
+
+    Returns:
+        list of report entries, in the same order as jobs
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    results = [None] * len(jobs)
+    pending = list(enumerate(jobs))
+    running = {}
+    while pending or running:
+        while pending and len(running) < processes:
+            index, job = pending.pop(0)
+            recv, send = _mp.Pipe(duplex=False)
+            proc = _mp.Process(target=_worker, args=(target, job, send))
+            proc.start()
+            send.close()
+            running[proc.sentinel] = [index, job, proc, recv, time.time(), None]
+
+        # read results while the workers run; a result larger than the pipe
+        # buffer blocks its worker in send() until it is read
+        wait(list(running.keys()) + [entry[3] for entry in running.values() if not entry[3].closed],
+                timeout=1.)
+        for sentinel in list(running.keys()):
+            entry = running[sentinel]
+            index, job, proc, recv, start = entry[:5]
+            if not recv.closed:
+                _receive(entry)
+            expired = timeout is not None and time.time() - start > timeout
+            if proc.is_alive() and not expired:
+                continue
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+            if not recv.closed:
+                _receive(entry)
+                recv.close()
+            result = entry[5]
+            if result is None:
+                if expired:
+                    error = "Timed out after %g s" % timeout
+                else:
+                    error = "Worker exited with code %s" % proc.exitcode
+                result = {
+                        'name': job.get('name'),
+                        'scenario': job.get('scenario'),
+                        'ok': False,
+                        'wall_time': time.time() - start,
+                        'error': error,
+                        'pid': proc.pid,
+                }
+            results[index] = result
+            del running[sentinel]
+    return results
+
+def print_report(results):
+    """
+    Print per-job wall time and the errors of failed jobs
+    """
+    total = 0.
+    failed = [r for r in results if not r['ok']]
+    for r in results:
+        total += r['wall_time']
+        print("%-20s %-16s %-6s %10.2f s" % (r['name'], r['scenario'],
+            'ok' if r['ok'] else 'FAILED', r['wall_time']))
+    print("%d jobs, %d failed, %.2f s total job time" % (len(results), len(failed), total))
+    for r in failed:
+        print("*********%s (%s) failed*********" % (r['name'], r['scenario']))
+        print(r['error'])
+
+if __name__ == '__main__':
+    solid_fn = os.path.join(os.path.dirname(__file__), 'cylinder.vtp')
+    out_dir = os.path.join(os.path.dirname(__file__), 'test')
+    try:
+        os.makedirs(out_dir)
+    except Exception as e: print(e)
+
+    mesh_ops = {
+            'SurfaceMeshFlag': True,
+            'VolumeMeshFlag': True,
+            'GlobalEdgeSize': 0.5,
+            'MeshWallFirst': True,
+            'NoMerge':True,
+            'NoBisect': True,
+            'Epsilon': 1e-8,
+            'Optimization': 3,
+            'QualityRatio': 1.4
+    }
+    def outputs(prefix):
+        return (os.path.join(out_dir, prefix+'_surface.vtk'), os.path.join(out_dir, prefix+'_vol.vtk'))
+
+    jobs = [
+            make_job('cylinder', 'mesh', solid_fn, mesh_ops, outputs('mesh')),
+            make_job('sph_refine', 'sphere_refine', solid_fn, mesh_ops, outputs('sph_rfn'),
+                {'size':0.2, 'rad':1, 'center':[0,0,0]}),
+            make_job('cyl_refine', 'cylinder_refine', solid_fn, mesh_ops, outputs('cyl_rfn'),
+                {'size':0.2, 'rad':1, 'length': 10, 'center':[0,0,0], 'nrm':[0,0,1]}),
+            make_job('bl', 'boundary_layer', solid_fn, mesh_ops, outputs('bl'),
+                {'type':0, 'id':0, 'side':0, 'num_lyr': 2, 'H':[0.1,0.3]}),
+    ]
+    print_report(run_jobs(jobs))
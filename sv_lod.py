@@ -0,0 +1,248 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Surface Levels of Detail
+"""
+Cached pyramids of decimated surfaces for previews and coarse-to-fine work
+
+A pyramid holds the full surface and coarser levels of it, each keeping
+a fraction of the triangles of the full surface. Every level is decimated
+from the one above it, face by face, with vtkDecimatePro and boundary
+vertex deletion turned off: the points on face boundaries are kept, so the
+faces of a level still meet exactly and keep their ModelFaceID. Small
+faces with many boundary points, like caps, are reduced less than the
+requested fraction.
+
+The levels are cached by the sha256 of the surface file, so they are built
+once per model. Quick-look meshing, estimation and parameter tuning can use
+a coarse level, and only the final run the full surface:
+
+    pyramid = LODPyramid(cache_dir)
+    fn = pyramid.select('demo.vtp', max_triangles=10000)
+    sv_mesh.mesh('preview', fn, mesh_ops, fns_out)
+"""
+import os
+import json
+import time
+import hashlib
+
+import numpy as np
+
+import sv_cache
+import sv_vtkxml
+import sv_faces
+
+# fractions of the triangles of the full surface kept by each level
+RATIOS = (0.5, 0.25, 0.125, 0.0625)
+POINT_ID_ARRAY = 'LODPointID'
+
+def decimate_face(face, keep, feature_angle=60.):
+    """
+    Decimate one face with its boundary points fixed
+
+    Args:
+        face: triangle MeshArrays
+        keep: fraction of the triangles to keep
+        feature_angle: edges sharper than this are not collapsed across
+    Returns:
+        MeshArrays with the point data of the kept points
+    """
+    import vtk
+    import sv_io
+    decimate = vtk.vtkDecimatePro()
+    decimate.SetInputData(sv_io.arrays_to_vtk(face))
+    decimate.SetTargetReduction(1. - keep)
+    decimate.PreserveTopologyOn()
+    decimate.SplittingOff()
+    decimate.PreSplitMeshOff()
+    decimate.BoundaryVertexDeletionOff()
+    decimate.SetFeatureAngle(feature_angle)
+    decimate.Update()
+    return sv_io.vtk_to_arrays(decimate.GetOutput())
+
+def drop_duplicate_triangles(tris):
+    """
+    Mask of the triangles that do not repeat another triangle
+
+    When two neighbouring faces are both reduced to a triangle spanning
+    the same three boundary points, the surface has a doubly covered
+    triangle. Removing both copies closes it again.
+    """
+    _, inverse, counts = np.unique(np.sort(tris, axis=1), axis=0, return_inverse=True, return_counts=True)
+    return counts[inverse.ravel()] == 1
+
+def decimate(mesh, keep, feature_angle=60.):
+    """
+    Decimate a surface with a ModelFaceID cell array, face by face
+
+    Args:
+        mesh: triangle surface MeshArrays
+        keep: fraction of the triangles to keep
+        feature_angle: see decimate_face
+    Returns:
+        MeshArrays with the points, triangles and ModelFaceID of the result
+    """
+    if keep >= 1.:
+        return mesh
+    source = sv_vtkxml.MeshArrays('PolyData', points=np.asarray(mesh.points),
+            connectivity=mesh.cell_array(3).ravel(), offsets=mesh.offsets,
+            point_data={POINT_ID_ARRAY: np.arange(len(mesh.points), dtype=np.int64)},
+            cell_data={'ModelFaceID': np.asarray(mesh.cell_data['ModelFaceID'])})
+    tris = []
+    face_ids = []
+    for face_id, face in sorted(sv_faces.FaceIndex(source).split().items()):
+        face.cell_data.clear()
+        result = decimate_face(face, keep, feature_angle)
+        ids = np.asarray(result.point_data[POINT_ID_ARRAY])
+        tris.append(ids[result.cell_array(3)])
+        face_ids.append(np.full(len(tris[-1]), face_id, dtype=np.int32))
+    tris = np.concatenate(tris)
+    face_ids = np.concatenate(face_ids)
+    valid = drop_duplicate_triangles(tris)
+    tris = tris[valid]
+    used, local = np.unique(tris, return_inverse=True)
+    tris = local.reshape(-1, 3)
+    out = sv_vtkxml.MeshArrays('PolyData', points=np.asarray(mesh.points)[used],
+            connectivity=tris.ravel(), offsets=3 * np.arange(1, len(tris) + 1),
+            cell_data={'ModelFaceID': face_ids[valid]})
+    out.num_points = len(used)
+    out.num_cells = len(tris)
+    return out
+
+class LODPyramid(object):
+    """
+    Builds and caches the levels of detail of surface files
+
+    Args:
+        cache_dir: directory of the levels
+        ratios: fraction of the full triangle count kept by each level,
+            finest first
+        feature_angle: see decimate_face
+    """
+    def __init__(self, cache_dir, ratios=RATIOS, feature_angle=60.):
+        self.cache_dir = cache_dir
+        self.ratios = tuple(sorted(ratios, reverse=True))
+        self.feature_angle = feature_angle
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
+
+    def _key(self, fn):
+        h = hashlib.sha256()
+        h.update(json.dumps([sv_cache.file_digest(fn), self.ratios, self.feature_angle]).encode())
+        return h.hexdigest()
+
+    def build(self, fn):
+        """
+        Levels of a surface file, decimated on the first call
+
+        Returns:
+            list of {'ratio', 'fn', 'triangles', 'seconds'}, level 0 being
+            the file itself and the coarsest level last
+        """
+        key = self._key(fn)
+        info_fn = os.path.join(self.cache_dir, key + '.json')
+        if os.path.exists(info_fn):
+            with open(info_fn) as f:
+                levels = json.load(f)
+            if all(os.path.exists(level['fn']) for level in levels[1:]):
+                levels[0]['fn'] = fn
+                return levels
+        mesh = sv_vtkxml.read(fn)
+        total = len(mesh.offsets)
+        levels = [{'ratio': 1., 'fn': fn, 'triangles': total, 'seconds': 0.}]
+        for i, ratio in enumerate(self.ratios):
+            if ratio >= 1.:
+                continue
+            start = time.time()
+            mesh = decimate(mesh, min(1., ratio * total / float(len(mesh.offsets))), self.feature_angle)
+            level_fn = os.path.join(self.cache_dir, '%s_%d.vtp' % (key, len(levels)))
+            sv_vtkxml.write_polydata(level_fn + '.tmp', mesh.points, mesh.connectivity, cell_size=3,
+                    cell_data={'ModelFaceID': mesh.cell_data['ModelFaceID']})
+            os.rename(level_fn + '.tmp', level_fn)
+            levels.append({'ratio': ratio, 'fn': level_fn, 'triangles': len(mesh.offsets),
+                'seconds': time.time() - start})
+        with open(info_fn + '.tmp', 'w') as f:
+            json.dump(levels, f, indent=1)
+        os.rename(info_fn + '.tmp', info_fn)
+        return levels
+
+    def level(self, fn, index):
+        """
+        File of level index of a surface; 0 is the full surface, -1 the coarsest
+        """
+        return self.build(fn)[index]['fn']
+
+    def select(self, fn, max_triangles):
+        """
+        File of the finest level with at most max_triangles, the coarsest if none
+        """
+        levels = self.build(fn)
+        for level in levels:
+            if level['triangles'] <= max_triangles:
+                return level['fn']
+        return levels[-1]['fn']
+
+    def load(self, fn, index, name):
+        """
+        Read a level into the Repository as polydata called name
+        """
+        import sv_io
+        return sv_io.read_polydata(self.level(fn, index), name)
+
+def print_levels(levels):
+    print("%-6s %8s %10s %8s  %s" % ('level', 'ratio', 'triangles', 'time', 'file'))
+    for i, level in enumerate(levels):
+        print("%-6d %8.4g %10d %7.2fs  %s" % (i, level['ratio'], level['triangles'], level['seconds'],
+            level['fn']))
+
+if __name__ == '__main__':
+    import sv_estimate
+    surface_fn = os.path.join(os.path.dirname(__file__), 'demo.vtp')
+    out_dir = os.path.join(os.path.dirname(__file__), 'test')
+    try:
+        os.makedirs(out_dir)
+    except Exception as e: print(e)
+
+    pyramid = LODPyramid(os.path.join(out_dir, 'lod_cache'))
+    levels = pyramid.build(surface_fn)
+    print_levels(levels)
+
+    # tune the edge size on a coarse level, check the choice on the full surface
+    fn = pyramid.select(surface_fn, 10000)
+    sizing = sv_estimate.sizing_args({'GlobalEdgeSize': 0.5})
+    for level_fn in (fn, surface_fn):
+        start = time.time()
+        model = sv_estimate.SurfaceModel.from_file(level_fn)
+        est = model.estimate(sizing)
+        print("%s: %d volume elements estimated in %.2f s" % (os.path.basename(level_fn),
+            est['volume_elements'], time.time() - start))
@@ -33,13 +33,9 @@
 
 import os
 from sv import *
-
-def clean_repos():
-    objs = Repository.List()
-    for name in objs:
-        try:
-            Repository.Delete(name)
-        except Exception as e: print(e)
+import sv_io
+import sv_session
+import sv_faces
 
 def test_kernel(kernel_name):
     if kernel_name == 'TetGen':
@@ -78,7 +74,7 @@ def test_get_solid(msh, out_fn):
     out = msh.GetSolid(out_fn)
     if not out:
         raise RunTimeError("Error getting solid")
-    Repository.WriteVtkPolyData(out_fn, 'ascii', out_fn)
+    sv_io.write_polydata(out_fn, out_fn)
   
 
 def test_get_vtk_objects(msh, poly_fn, face_fn, mesh_fn):
@@ -86,16 +82,54 @@ def test_get_vtk_objects(msh, poly_fn, face_fn, mesh_fn):
     msh.GetUnstructuredGrid(mesh_fn)
     msh.GetFacePolyData(face_fn, 1)
     print(msh.GetModelFaceInfo())
-    Repository.WriteVtkPolyData(poly_fn, 'ascii', poly_fn)
-    Repository.WriteVtkUnstructuredGrid(mesh_fn, 'ascii', mesh_fn)
-    Repository.WriteVtkPolyData(face_fn, 'ascii', face_fn)
+    sv_io.write_polydata(poly_fn, poly_fn)
+    sv_io.write_ugrid(mesh_fn, mesh_fn)
+    sv_io.write_polydata(face_fn, face_fn)
+
+def write_faces(msh, out_dir, name='mesh_faces'):
+    """
+    Write every face of the surface mesh to its own file in one pass,
+    instead of one GetFacePolyData call and write per face
+    """
+    msh.GetPolyData(name)
+    return sv_faces.FaceIndex.from_repository(name).write_faces(out_dir)
+
+def load_cached(name, fn, fns_out, session=None):
+    """
+    Mesh object of a cache hit, left as a meshing run leaves it
+
+    The model is loaded through the session and the volume mesh with
+    LoadMesh; the outputs are put in the Repository under their file
+    names, like the writes of a meshing run.
 
-def mesh(name, fn, args, fns_out):
-    clean_repos()
+    Args:
+        fns_out: (surface file, volume file) returned by MeshCache.get,
+            None for outputs that were not cached
+    """
+    msh=MeshObject.pyMeshObject()
+    msh.NewObject(name)
+    sv_session.load_model(msh, fn, session)
+    poly_fn, ug_fn = fns_out
+    if ug_fn is not None:
+        if not msh.LoadMesh(ug_fn):
+            raise RuntimeError("Error loading mesh " + ug_fn)
+        msh.GetUnstructuredGrid(ug_fn)
+    if poly_fn is not None:
+        sv_io.read_polydata(poly_fn, poly_fn)
+    return msh
+
+def mesh(name, fn, args, fns_out, cache=None, session=None):
+    sv_session.begin(session)
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(fn, {'scenario': 'mesh', 'mesh_ops': args})
+        restored = cache.get(cache_key, fns_out)
+        if restored:
+            return load_cached(name, fn, restored, session)
     msh=MeshObject.pyMeshObject()
     msh.NewObject(name)
     #Load Model
-    msh.LoadModel(fn)
+    sv_session.load_model(msh, fn, session)
     msh.GetBoundaryFaces(80.)
     #Create new mesh
     msh.NewMesh()
@@ -113,17 +147,26 @@ def mesh(name, fn, args, fns_out):
     poly_fn, ug_fn = fns_out
     if args['SurfaceMeshFlag']:
         msh.GetPolyData(poly_fn)
-        Repository.WriteVtkPolyData(poly_fn, 'ascii', poly_fn)
+        sv_io.write_polydata(poly_fn, poly_fn)
     if args['VolumeMeshFlag']:
         msh.GetUnstructuredGrid(ug_fn)
-        Repository.WriteVtkUnstructuredGrid(ug_fn, 'ascii', ug_fn)
+        sv_io.write_ugrid(ug_fn, ug_fn)
+    if cache_key is not None:
+        cache.put(cache_key, (poly_fn if args['SurfaceMeshFlag'] else None,
+            ug_fn if args['VolumeMeshFlag'] else None))
     return msh
-def sphere_refine(name, fn, args, sph_rfn_ops, fns_out):
-    clean_repos()
+def sphere_refine(name, fn, args, sph_rfn_ops, fns_out, cache=None, session=None):
+    sv_session.begin(session)
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(fn, {'scenario': 'sphere_refine', 'mesh_ops': args, 'refine': sph_rfn_ops})
+        restored = cache.get(cache_key, fns_out)
+        if restored:
+            return load_cached(name, fn, restored, session)
     msh=MeshObject.pyMeshObject()
     msh.NewObject(name)
     #Load Model
-    msh.LoadModel(fn)
+    sv_session.load_model(msh, fn, session)
     msh.GetBoundaryFaces(80.)
     #Create new mesh
     msh.NewMesh()
@@ -143,18 +186,27 @@ def sphere_refine(name, fn, args, sph_rfn_ops, fns_out):
     poly_fn, ug_fn = fns_out
     if args['SurfaceMeshFlag']:
         msh.GetPolyData(poly_fn)
-        Repository.WriteVtkPolyData(poly_fn, 'ascii', poly_fn)
+        sv_io.write_polydata(poly_fn, poly_fn)
     if args['VolumeMeshFlag']:
         msh.GetUnstructuredGrid(ug_fn)
-        Repository.WriteVtkUnstructuredGrid(ug_fn, 'ascii', ug_fn)
+        sv_io.write_ugrid(ug_fn, ug_fn)
+    if cache_key is not None:
+        cache.put(cache_key, (poly_fn if args['SurfaceMeshFlag'] else None,
+            ug_fn if args['VolumeMeshFlag'] else None))
     return msh
 
-def cylinder_refine(name, fn, args, cyl_rfn_ops, fns_out):
-    clean_repos()
+def cylinder_refine(name, fn, args, cyl_rfn_ops, fns_out, cache=None, session=None):
+    sv_session.begin(session)
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(fn, {'scenario': 'cylinder_refine', 'mesh_ops': args, 'refine': cyl_rfn_ops})
+        restored = cache.get(cache_key, fns_out)
+        if restored:
+            return load_cached(name, fn, restored, session)
     msh=MeshObject.pyMeshObject()
     msh.NewObject(name)
     #Load Model
-    msh.LoadModel(fn)
+    sv_session.load_model(msh, fn, session)
     msh.GetBoundaryFaces(80.)
     #Create new mesh
     msh.NewMesh()
@@ -176,18 +228,27 @@ def cylinder_refine(name, fn, args, cyl_rfn_ops, fns_out):
     poly_fn, ug_fn = fns_out
     if args['SurfaceMeshFlag']:
         msh.GetPolyData(poly_fn)
-        Repository.WriteVtkPolyData(poly_fn, 'ascii', poly_fn)
+        sv_io.write_polydata(poly_fn, poly_fn)
     if args['VolumeMeshFlag']:
         msh.GetUnstructuredGrid(ug_fn)
-        Repository.WriteVtkUnstructuredGrid(ug_fn, 'ascii', ug_fn)
+        sv_io.write_ugrid(ug_fn, ug_fn)
+    if cache_key is not None:
+        cache.put(cache_key, (poly_fn if args['SurfaceMeshFlag'] else None,
+            ug_fn if args['VolumeMeshFlag'] else None))
     return msh
     
-def boundary_layer(name, fn, args, bl_ops, fns_out):
-    clean_repos()
+def boundary_layer(name, fn, args, bl_ops, fns_out, cache=None, session=None):
+    sv_session.begin(session)
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(fn, {'scenario': 'boundary_layer', 'mesh_ops': args, 'bl': bl_ops})
+        restored = cache.get(cache_key, fns_out)
+        if restored:
+            return load_cached(name, fn, restored, session)
     msh=MeshObject.pyMeshObject()
     msh.NewObject(name)
     #Load Model
-    msh.LoadModel(fn)
+    sv_session.load_model(msh, fn, session)
     msh.GetBoundaryFaces(80.)
     msh.SetWalls([2])
     #Create new mesh
@@ -206,10 +267,13 @@ def boundary_layer(name, fn, args, bl_ops, fns_out):
     poly_fn, ug_fn = fns_out
     if args['SurfaceMeshFlag']:
         msh.GetPolyData(poly_fn)
-        Repository.WriteVtkPolyData(poly_fn, 'ascii', poly_fn)
+        sv_io.write_polydata(poly_fn, poly_fn)
     if args['VolumeMeshFlag']:
         msh.GetUnstructuredGrid(ug_fn)
-        Repository.WriteVtkUnstructuredGrid(ug_fn, 'ascii', ug_fn)
+        sv_io.write_ugrid(ug_fn, ug_fn)
+    if cache_key is not None:
+        cache.put(cache_key, (poly_fn if args['SurfaceMeshFlag'] else None,
+            ug_fn if args['VolumeMeshFlag'] else None))
     return msh
 
 if __name__ == '__main__':
@@ -220,6 +284,7 @@ if __name__ == '__main__':
         os.makedirs(out_dir)
     except Exception as e: print(e)
     
+    session = sv_session.Session()
     print("*********mesh kernel*********")
     test_kernel('TetGen')
     print("*********mesh method*********")
@@ -254,7 +319,7 @@ if __name__ == '__main__':
         print("*********simple mesh**********")
         poly_fn = os.path.join(out_dir, 'mesh_surface.vtk')
         ug_fn = os.path.join(out_dir, 'mesh_vol.vtk')
-        msh = mesh('cylinder', solid_fn, mesh_ops, (poly_fn, ug_fn))
+        msh = mesh('cylinder', solid_fn, mesh_ops, (poly_fn, ug_fn), session=session)
     except Exception as e: print(e)
 
 
@@ -263,7 +328,7 @@ if __name__ == '__main__':
         poly_fn = os.path.join(out_dir, 'sph_rfn_surface.vtk')
         ug_fn = os.path.join(out_dir, 'sph_rfn_vol.vtk')
         msh = sphere_refine('sph_refine', solid_fn, mesh_ops, 
-            {'size':0.2, 'rad':1, 'center':[0,0,0]}, (poly_fn, ug_fn))
+            {'size':0.2, 'rad':1, 'center':[0,0,0]}, (poly_fn, ug_fn), session=session)
     except Exception as e: print(e)
     
     try:
@@ -271,7 +336,7 @@ if __name__ == '__main__':
         poly_fn = os.path.join(out_dir, 'cyl_rfn_surface.vtk')
         ug_fn = os.path.join(out_dir, 'cyl_rfn_vol.vtk')
         msh = cylinder_refine('cyl_refine', solid_fn, mesh_ops, 
-                {'size':0.2, 'rad':1, 'length': 10, 'center':[0,0,0], 'nrm':[0,0,1]}, (poly_fn, ug_fn))
+                {'size':0.2, 'rad':1, 'length': 10, 'center':[0,0,0], 'nrm':[0,0,1]}, (poly_fn, ug_fn), session=session)
     except Exception as e: print(e)
     
     try:
@@ -282,10 +347,16 @@ if __name__ == '__main__':
         test_get_vtk_objects(msh, poly_fn, face_fn, mesh_fn)
     except Exception as e: print(e)
     
+    try:
+        print("*********write faces*********")
+        print(write_faces(msh, os.path.join(out_dir, 'faces')))
+    except Exception as e: print(e)
+    
     try:
         print("*********boundary layer *****")
         poly_fn = os.path.join(out_dir, 'bl_surface.vtk')
         ug_fn = os.path.join(out_dir, 'bl_rfn_vol.vtk')
         msh = boundary_layer('sph_refine', solid_fn, mesh_ops, 
-                {'type':0, 'id':0, 'side':0, 'num_lyr': 2, 'H':[0.1,0.3]}, (poly_fn, ug_fn))
+                {'type':0, 'id':0, 'side':0, 'num_lyr': 2, 'H':[0.1,0.3]}, (poly_fn, ug_fn), session=session)
     except Exception as e: print(e)
+    session.close()
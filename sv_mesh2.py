@@ -33,19 +33,17 @@
 
 import os
 from sv import *
+import sv_io
+import sv_mesh
+import sv_session
+import sv_centerlines
+import sv_sizing
 
 """
 Example meshing functinos using SV Python API
 Functions in this file were tested using SV demo data
 """
 
-def clean_repos():
-    objs = Repository.List()
-    for name in objs:
-        try:
-            Repository.Delete(name)
-        except Exception as e: print(e)
-
 def new_object(name, meshName=None, solidName=None):
     msh=MeshObject.pyMeshObject()
     msh.NewObject(name)
@@ -61,9 +59,17 @@ def new_object(name, meshName=None, solidName=None):
             raise RuntimeError("Error loading model")
     return msh
 
-def boundary_layer(name, fn, wall_list, global_edge_size, bl_ops, fns_out):
-    clean_repos()
-    msh = new_object(name, solidName = fn)
+def boundary_layer(name, fn, wall_list, global_edge_size, bl_ops, fns_out, cache=None, session=None):
+    sv_session.begin(session)
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(fn, {'scenario': 'boundary_layer', 'walls': wall_list,
+            'global_edge_size': global_edge_size, 'bl': bl_ops})
+        restored = cache.get(cache_key, fns_out)
+        if restored:
+            return sv_mesh.load_cached(name, fn, restored, session)
+    msh = new_object(name)
+    sv_session.load_model(msh, fn, session)
     msh.GetBoundaryFaces(80.)
     msh.SetWalls(wall_list)
     #Create new mesh
@@ -90,59 +96,130 @@ def boundary_layer(name, fn, wall_list, global_edge_size, bl_ops, fns_out):
     poly_fn, ug_fn = fns_out
     if mesh_ops['SurfaceMeshFlag']:
         msh.GetPolyData(poly_fn)
-        Repository.WriteVtkPolyData(poly_fn, 'ascii', poly_fn)
+        sv_io.write_polydata(poly_fn, poly_fn)
     if mesh_ops['VolumeMeshFlag']:
         msh.GetUnstructuredGrid(ug_fn)
-        Repository.WriteVtkUnstructuredGrid(ug_fn, 'ascii', ug_fn)
+        sv_io.write_ugrid(ug_fn, ug_fn)
+    if cache_key is not None:
+        cache.put(cache_key, (poly_fn if mesh_ops['SurfaceMeshFlag'] else None,
+            ug_fn if mesh_ops['VolumeMeshFlag'] else None))
     return msh
 
-def size_function(name, fn, cap_source_list, cap_target_list, wall_list, mesh_ops, fns_out):
+def size_function(name, fn, cap_source_list, cap_target_list, wall_list, mesh_ops, fns_out, centerlines=None,
+        session=None):
     """
-    Attemping radius based meshing, not working yet
+    Radius based meshing
+
+    The surface is sized by its distance to the centerlines. Centerlines
+    are cached per surface and cap lists by the given
+    sv_centerlines.CenterlineCache; without one they are computed on
+    every call and not written to disk.
     """
-    clean_repos()
+    sv_session.begin(session)
+    if centerlines is None:
+        centerlines = sv_centerlines.CenterlineCache()
     solid = Solid.pySolidModel()
     solid.ReadNative('surface', fn)
     solid.GetPolyData('surface_p')
     solid.GetBoundaryFaces(45)
-    VMTKUtils.Centerlines('surface_p', cap_source_list, cap_target_list, 'lines', 'voronoi')
-    VMTKUtils.Distancetocenterlines('surface_p', 'lines', 'distance')
+    lines, voronoi = centerlines.centerlines('surface_p', fn, cap_source_list, cap_target_list)
+    sv_centerlines.radius_sizing('surface_p', 'distance', lines, centerlines)
 
     msh = new_object(name)
     msh.SetVtkPolyData('distance')
     msh.GetBoundaryFaces(50.)
-    #msh.SetWalls(wall_list)
+    if wall_list:
+        msh.SetWalls(wall_list)
     msh.NewMesh()
-    mesh_ops = {
-            'SurfaceMeshFlag': True,
-            'VolumeMeshFlag': True,
-            'GlobalEdgeSize': 0.5,
-            'LocalEdgeSize': [1, 0.1, 2, 0.3, 3, 0.3, 4, 0.3],
-    }
+    if mesh_ops is None:
+        mesh_ops = {
+                'SurfaceMeshFlag': True,
+                'VolumeMeshFlag': True,
+                'GlobalEdgeSize': 0.5,
+                'LocalEdgeSize': [1, 0.1, 2, 0.3, 3, 0.3, 4, 0.3],
+        }
 
     for key in mesh_ops:
         msh.SetMeshOptions(key, mesh_ops[key] if type(mesh_ops[key])==list else [mesh_ops[key]] )
-    msh.SetSizeFunctionBasedMesh(0.5, 'DistanceToCenterlines')
+    msh.SetSizeFunctionBasedMesh(0.5, sv_centerlines.DISTANCE_ARRAY)
     #msh.SetSizeFunctionBasedMesh(0.5, 'MeshSizingFunction')
     print("sizing function")
+    msh.GenerateMesh()
     msh.Print()
     
     poly_fn, ug_fn = fns_out
     if mesh_ops['SurfaceMeshFlag']:
         msh.GetPolyData(poly_fn)
-        Repository.WriteVtkPolyData(poly_fn, 'ascii', poly_fn)
+        sv_io.write_polydata(poly_fn, poly_fn)
     if mesh_ops['VolumeMeshFlag']:
         msh.GetUnstructuredGrid(ug_fn)
-        Repository.WriteVtkUnstructuredGrid(ug_fn, 'ascii', ug_fn)
+        sv_io.write_ugrid(ug_fn, ug_fn)
     return msh
 
-def local_size_function(name, fn, global_edge_size, local_edge_size_list, fns_out, bl_ops=None):
-    clean_repos()
-    print(local_edge_size_list)
-    
-    msh = new_object(name, solidName=fn)
+def budget_size_function(name, fn, max_elements, fns_out, mesh_ops=None, radius_array=None, cache=None,
+        session=None):
+    """
+    Mesh with a geometry-driven sizing field fitted to an element budget
+
+    Instead of a LocalEdgeSize list, sv_sizing computes an edge size per
+    surface point from the curvature (and the vessel radius, if the
+    surface carries a radius_array such as DistanceToCenterlines) so that
+    the estimated number of tetrahedra is at most max_elements. The sizes
+    are passed to TetGen as the MeshSizingFunction array.
+    """
+    sv_session.begin(session)
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(fn, {'scenario': 'budget_size_function', 'max_elements': max_elements,
+            'mesh_ops': mesh_ops, 'radius_array': radius_array})
+        restored = cache.get(cache_key, fns_out)
+        if restored:
+            return sv_mesh.load_cached(name, fn, restored, session)
+    if session is None:
+        solid = Solid.pySolidModel()
+        solid.ReadNative('surface', fn)
+        solid.GetPolyData('surface_p')
+        poly = 'surface_p'
+    else:
+        poly = session.load_model(fn)
+    sizes, estimate = sv_sizing.apply(poly, 'sizing', max_elements, radius_array)
+    print("sizing function: edge size %g to %g, about %d elements" % (sizes.min(), sizes.max(), estimate))
+
+    msh = new_object(name)
+    msh.SetVtkPolyData('sizing')
     msh.GetBoundaryFaces(50.)
-    print(msh.GetModelFaceInfo())
+    msh.NewMesh()
+    if mesh_ops is None:
+        mesh_ops = {
+                'SurfaceMeshFlag': True,
+                'VolumeMeshFlag': True,
+        }
+    mesh_ops = dict(mesh_ops, GlobalEdgeSize=float(sizes.max()))
+    for key in mesh_ops:
+        msh.SetMeshOptions(key, mesh_ops[key] if type(mesh_ops[key])==list else [mesh_ops[key]] )
+    msh.SetSizeFunctionBasedMesh(float(sizes.max()), sv_sizing.SIZING_ARRAY)
+    msh.GenerateMesh()
+    msh.Print()
+
+    poly_fn, ug_fn = fns_out
+    if mesh_ops['SurfaceMeshFlag']:
+        msh.GetPolyData(poly_fn)
+        sv_io.write_polydata(poly_fn, poly_fn)
+    if mesh_ops['VolumeMeshFlag']:
+        msh.GetUnstructuredGrid(ug_fn)
+        sv_io.write_ugrid(ug_fn, ug_fn)
+    if cache_key is not None:
+        cache.put(cache_key, (poly_fn if mesh_ops['SurfaceMeshFlag'] else None,
+            ug_fn if mesh_ops['VolumeMeshFlag'] else None))
+    return msh
+
+def set_local_size_options(msh, global_edge_size, local_edge_size_list, bl_ops=None):
+    """
+    Start a new mesh on a loaded model and set local edge size options
+
+    Returns:
+        the mesh options that were set
+    """
     msh.NewMesh()
     mesh_ops = {
             'SurfaceMeshFlag': True,
@@ -150,7 +227,6 @@ def local_size_function(name, fn, global_edge_size, local_edge_size_list, fns_ou
             'GlobalEdgeSize': global_edge_size,
             'LocalEdgeSize': local_edge_size_list,
     }
-    
 
     for key in mesh_ops:
         msh.SetMeshOptions(key, mesh_ops[key] if type(mesh_ops[key])==list else [mesh_ops[key]] )
@@ -158,55 +234,87 @@ def local_size_function(name, fn, global_edge_size, local_edge_size_list, fns_ou
     if bl_ops is not None:
         msh.SetWalls(bl_ops['wall'])
         msh.SetBoundaryLayer(bl_ops['type'], bl_ops['id'], bl_ops['side'],bl_ops['num_lyr'], bl_ops['H'])
+    return mesh_ops
+
+def local_size_function(name, fn, global_edge_size, local_edge_size_list, fns_out, bl_ops=None, cache=None,
+        session=None):
+    sv_session.begin(session)
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.key(fn, {'scenario': 'local_size_function', 'global_edge_size': global_edge_size,
+            'local_edge_size': local_edge_size_list, 'bl': bl_ops})
+        restored = cache.get(cache_key, fns_out)
+        if restored:
+            return sv_mesh.load_cached(name, fn, restored, session)
+    print(local_edge_size_list)
+    
+    msh = new_object(name)
+    sv_session.load_model(msh, fn, session)
+    msh.GetBoundaryFaces(50.)
+    print(msh.GetModelFaceInfo())
+    mesh_ops = set_local_size_options(msh, global_edge_size, local_edge_size_list, bl_ops)
     msh.GenerateMesh()
     msh.Print()
     
     poly_fn, ug_fn = fns_out
     if mesh_ops['SurfaceMeshFlag']:
         msh.GetPolyData(poly_fn)
-        Repository.WriteVtkPolyData(poly_fn, 'ascii', poly_fn)
+        sv_io.write_polydata(poly_fn, poly_fn)
     if mesh_ops['VolumeMeshFlag']:
         msh.GetUnstructuredGrid(ug_fn)
-        Repository.WriteVtkUnstructuredGrid(ug_fn, 'ascii', ug_fn)
+        sv_io.write_ugrid(ug_fn, ug_fn)
+    if cache_key is not None:
+        cache.put(cache_key, (poly_fn if mesh_ops['SurfaceMeshFlag'] else None,
+            ug_fn if mesh_ops['VolumeMeshFlag'] else None))
     return msh
 
 
+if __name__ == '__main__':
+    solid_fn = os.path.join(os.path.dirname(__file__), 'demo.vtp')
+    out_dir = os.path.join(os.path.dirname(__file__), 'test')
 
-solid_fn = os.path.join(os.path.dirname(__file__), 'demo.vtp')
-out_dir = os.path.join(os.path.dirname(__file__), 'test')
-
-MeshObject.SetKernel('TetGen')
-Solid.SetKernel('PolyData')
-try:
-    os.makedirs(out_dir)
-except Exception as e: print(e)
-
-mesh_ops = {
-        'SurfaceMeshFlag': True,
-        'VolumeMeshFlag': True,
-        'GlobalEdgeSize': 0.5,
-        'MeshWallFirst': True,
-        'NoMerge':True,
-        'NoBisect': True,
-        'Epsilon': 1e-8,
-        'Optimization': 3,
-        'QualityRatio': 1.4,
-}
-try:
-    print("*********size based function meshing****")
-    poly_fn = os.path.join(out_dir, 'sf_surface.vtk')
-    ug_fn = os.path.join(out_dir, 'sf_vol.vtk')
-    local_size_function('sf_test', solid_fn, 5., [1, 0.15, 2, 0.3, 3, 0.6, 4, 0.6], (poly_fn, ug_fn))
-    #Combine with boundary layer meshing:
-    #local_size_function('sf_test', solid_fn, 1., [1, 0.15, 2, 0.3, 3, 0.6, 4, 0.6], (poly_fn, ug_fn), 
-    #        {'wall':[1], 'type':0, 'id':0, 'side':0, 'num_lyr': 3, 'H':[0.3,0.6, 0.8]})
-except Exception as e: print(e)
-#try:
-#    print("*********boundary layer *****")
-#    poly_fn = os.path.join(out_dir, 'bl_surface.vtk')
-#    ug_fn = os.path.join(out_dir, 'bl_rfn_vol.vtk')
-#    msh = boundary_layer('bl_test', solid_fn, [1], 0.5,  
-#            {'type':0, 'id':0, 'side':0, 'num_lyr': 2, 'H':[0.1,0.3]}, (poly_fn, ug_fn))
-#except Exception as e: print(e)
-
+    MeshObject.SetKernel('TetGen')
+    Solid.SetKernel('PolyData')
+    try:
+        os.makedirs(out_dir)
+    except Exception as e: print(e)
 
+    mesh_ops = {
+            'SurfaceMeshFlag': True,
+            'VolumeMeshFlag': True,
+            'GlobalEdgeSize': 0.5,
+            'MeshWallFirst': True,
+            'NoMerge':True,
+            'NoBisect': True,
+            'Epsilon': 1e-8,
+            'Optimization': 3,
+            'QualityRatio': 1.4,
+    }
+    try:
+        print("*********size based function meshing****")
+        poly_fn = os.path.join(out_dir, 'sf_surface.vtk')
+        ug_fn = os.path.join(out_dir, 'sf_vol.vtk')
+        local_size_function('sf_test', solid_fn, 5., [1, 0.15, 2, 0.3, 3, 0.6, 4, 0.6], (poly_fn, ug_fn))
+        #Combine with boundary layer meshing:
+        #local_size_function('sf_test', solid_fn, 1., [1, 0.15, 2, 0.3, 3, 0.6, 4, 0.6], (poly_fn, ug_fn), 
+        #        {'wall':[1], 'type':0, 'id':0, 'side':0, 'num_lyr': 3, 'H':[0.3,0.6, 0.8]})
+    except Exception as e: print(e)
+    try:
+        print("*********element budget sizing function****")
+        poly_fn = os.path.join(out_dir, 'budget_surface.vtk')
+        ug_fn = os.path.join(out_dir, 'budget_vol.vtk')
+        budget_size_function('budget_test', solid_fn, 200000, (poly_fn, ug_fn))
+    except Exception as e: print(e)
+    #try:
+    #    print("*********radius based meshing****")
+    #    centerlines = sv_centerlines.CenterlineCache(os.path.join(out_dir, 'centerlines'))
+    #    size_function('cl_test', solid_fn, [1], [2, 3], [1], None,
+    #            (os.path.join(out_dir, 'cl_surface.vtk'), os.path.join(out_dir, 'cl_vol.vtk')), centerlines)
+    #except Exception as e: print(e)
+    #try:
+    #    print("*********boundary layer *****")
+    #    poly_fn = os.path.join(out_dir, 'bl_surface.vtk')
+    #    ug_fn = os.path.join(out_dir, 'bl_rfn_vol.vtk')
+    #    msh = boundary_layer('bl_test', solid_fn, [1], 0.5,  
+    #            {'type':0, 'id':0, 'side':0, 'num_lyr': 2, 'H':[0.1,0.3]}, (poly_fn, ug_fn))
+    #except Exception as e: print(e)
@@ -0,0 +1,273 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Mesh Partitioning
+"""
+Partition a volume mesh into balanced parts for distributed solvers
+
+The cells are split over the dual graph (cells adjacent through a shared
+face) to keep the edge cut small. METIS is used through pymetis when it is
+installed; otherwise the graph is split by recursive spectral bisection,
+cutting every subgraph at the quantile of its Fiedler vector that gives
+the requested part sizes. Each part is written to its own .vtu file with
+the GlobalNodeID/GlobalElementID arrays of the full mesh and an
+InterfaceNode point array marking nodes shared with other parts, so every
+rank reads only its own part.
+
+Example:
+    parts = partition_file('cylinder.vtu', 4, 'test/parts')
+"""
+import os
+import json
+import warnings
+import itertools
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import lobpcg
+try:
+    import pymetis
+except ImportError:
+    pymetis = None
+
+import sv_vtkxml
+
+PART_ARRAY = 'PartitionID'
+INTERFACE_ARRAY = 'InterfaceNode'
+
+def dual_graph(cells):
+    """
+    Adjacency of simplex cells sharing a facet (triangle of a tet, edge of a triangle)
+
+    Args:
+        cells: (ncells, npts) point ids
+    Returns:
+        symmetric CSR matrix of shape (ncells, ncells)
+    """
+    cells = np.asarray(cells, dtype=np.int64)
+    ncells, npts = cells.shape
+    facets = np.concatenate([cells[:, list(c)] for c in itertools.combinations(range(npts), npts - 1)])
+    facets.sort(axis=1)
+    owner = np.tile(np.arange(ncells), npts)
+    order = np.lexsort(facets.T[::-1])
+    facets, owner = facets[order], owner[order]
+    # consecutive equal facets are shared by two cells
+    shared = np.nonzero(np.all(facets[1:] == facets[:-1], axis=1))[0]
+    a, b = owner[shared], owner[shared + 1]
+    graph = sp.csr_matrix((np.ones(len(a)), (a, b)), shape=(ncells, ncells))
+    return (graph + graph.T).tocsr()
+
+def edge_cut(graph, parts):
+    """
+    Number of dual graph edges between different parts
+    """
+    coo = sp.triu(graph, format='coo')
+    return int(np.count_nonzero(parts[coo.row] != parts[coo.col]))
+
+def _fiedler(graph, seed):
+    """
+    Fiedler vector of a connected graph, or None if it could not be computed
+    """
+    n = graph.shape[0]
+    degree = np.asarray(graph.sum(axis=1)).ravel()
+    laplacian = sp.diags(degree) - graph
+    precond = sp.diags(1. / np.maximum(degree, 1.))
+    x = np.random.RandomState(seed).standard_normal((n, 1))
+    try:
+        with warnings.catch_warnings():
+            # a roughly converged vector splits the graph just as well
+            warnings.simplefilter('ignore', UserWarning)
+            _, vectors = lobpcg(laplacian, x, M=precond, Y=np.ones((n, 1)), largest=False,
+                    tol=1e-4, maxiter=300)
+    except Exception:
+        return None
+    return vectors[:, 0]
+
+def _bisect(graph, cells_idx, nparts, first, parts, coords, seed):
+    """
+    Split cells_idx into nparts parts numbered from first; without a graph
+    the cells are split by coordinates
+    """
+    if nparts == 1:
+        parts[cells_idx] = first
+        return
+    left = nparts // 2
+    n = len(cells_idx)
+    key = None
+    if graph is not None and n > 2:
+        sub = graph[cells_idx][:, cells_idx]
+        ncomp, labels = connected_components(sub, directed=False)
+        if ncomp == 1:
+            key = _fiedler(sub, seed)
+        else:
+            # keep whole components together as far as the balance allows
+            key = labels.astype(np.float64)
+    if key is None:
+        # coordinate bisection along the longest extent
+        c = coords[cells_idx]
+        key = c[:, np.argmax(np.ptp(c, axis=0))]
+    order = np.argsort(key, kind='stable')
+    cut = int(round(n * left / float(nparts)))
+    _bisect(graph, cells_idx[order[:cut]], left, first, parts, coords, seed)
+    _bisect(graph, cells_idx[order[cut:]], nparts - left, first + left, parts, coords, seed)
+
+def partition(mesh, nparts, method=None, graph=None, seed=0):
+    """
+    Part id of every cell of a volume mesh
+
+    Args:
+        mesh: sv_vtkxml.MeshArrays unstructured grid of tetrahedra
+        nparts: number of parts
+        method: 'metis', 'spectral' or 'coordinate'; metis if pymetis is
+            installed, spectral otherwise
+        graph: dual graph, computed if None
+    Returns:
+        (ncells,) int array of part ids 0 .. nparts-1
+    """
+    cells = mesh.cell_array()
+    ncells = len(cells)
+    if method is None:
+        method = 'metis' if pymetis is not None else 'spectral'
+    if nparts <= 1:
+        return np.zeros(ncells, dtype=np.int64)
+    if graph is None and method != 'coordinate':
+        graph = dual_graph(cells)
+    if method == 'metis':
+        if pymetis is None:
+            raise ImportError("pymetis is required for METIS partitioning")
+        _, membership = pymetis.part_graph(nparts, xadj=graph.indptr, adjncy=graph.indices)
+        return np.asarray(membership, dtype=np.int64)
+    points = np.asarray(mesh.points, dtype=np.float64)
+    centers = points[cells].mean(axis=1)
+    parts = np.zeros(ncells, dtype=np.int64)
+    if method == 'coordinate':
+        _bisect(None, np.arange(ncells), nparts, 0, parts, centers, seed)
+    elif method == 'spectral':
+        _bisect(graph.tocsr(), np.arange(ncells), nparts, 0, parts, centers, seed)
+    else:
+        raise ValueError("Unknown partitioning method: " + str(method))
+    return parts
+
+def interface_nodes(cells, parts, num_points):
+    """
+    Points used by cells of more than one part
+    """
+    cells = np.asarray(cells)
+    lo = np.full(num_points, np.iinfo(np.int64).max)
+    hi = np.full(num_points, -1)
+    owner = np.repeat(parts, cells.shape[1])
+    np.minimum.at(lo, cells.ravel(), owner)
+    np.maximum.at(hi, cells.ravel(), owner)
+    return (hi >= 0) & (lo != hi)
+
+def extract_part(mesh, parts, part, interface):
+    """
+    MeshArrays of one part with the arrays of the full mesh and InterfaceNode
+    """
+    cells = mesh.cell_array()
+    cell_ids = np.nonzero(parts == part)[0]
+    point_ids = np.unique(cells[cell_ids])
+    local = np.full(len(mesh.points), -1, dtype=np.int64)
+    local[point_ids] = np.arange(len(point_ids))
+    dtype = np.asarray(mesh.connectivity).dtype
+    npts = cells.shape[1]
+    point_data = dict((name, np.asarray(array)[point_ids]) for name, array in mesh.point_data.items())
+    point_data[INTERFACE_ARRAY] = interface[point_ids].astype(np.int32)
+    cell_data = dict((name, np.asarray(array)[cell_ids]) for name, array in mesh.cell_data.items())
+    out = sv_vtkxml.MeshArrays(mesh.kind,
+            points=np.asarray(mesh.points)[point_ids],
+            connectivity=local[cells[cell_ids]].ravel().astype(dtype),
+            offsets=np.arange(1, len(cell_ids) + 1, dtype=dtype) * npts,
+            types=None if mesh.types is None else np.asarray(mesh.types)[cell_ids],
+            point_data=point_data, cell_data=cell_data)
+    out.num_points = len(point_ids)
+    out.num_cells = len(cell_ids)
+    return out
+
+def write_parts(mesh, parts, out_dir, prefix='part_', threads=None):
+    """
+    Write every part to out_dir/<prefix><part>.vtu in parallel, with a
+    <prefix>info.json summary
+
+    Returns:
+        list of part file names
+    """
+    try:
+        os.makedirs(out_dir)
+    except OSError:
+        if not os.path.isdir(out_dir):
+            raise
+    cells = mesh.cell_array()
+    nparts = int(parts.max()) + 1 if len(parts) else 0
+    interface = interface_nodes(cells, parts, len(mesh.points))
+    fns = [os.path.join(out_dir, '%s%d.vtu' % (prefix, part)) for part in range(nparts)]
+    def write(part):
+        sub = extract_part(mesh, parts, part, interface)
+        sv_vtkxml.write(fns[part], sub)
+        return {'file': os.path.basename(fns[part]), 'cells': sub.num_cells, 'points': sub.num_points,
+                'interface_points': int(sub.point_data[INTERFACE_ARRAY].sum())}
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(threads) as pool:
+        info = list(pool.map(write, range(nparts)))
+    with open(os.path.join(out_dir, prefix + 'info.json'), 'w') as f:
+        json.dump({'parts': info, 'interface_points': int(interface.sum())}, f, indent=1)
+    return fns
+
+def partition_file(fn, nparts, out_dir, method=None, prefix='part_'):
+    """
+    Partition a .vtu volume mesh and write its parts
+
+    Returns:
+        (part id per cell, part file names)
+    """
+    mesh = sv_vtkxml.read(fn)
+    parts = partition(mesh, nparts, method)
+    return parts, write_parts(mesh, parts, out_dir, prefix)
+
+if __name__ == '__main__':
+    import sys
+    import time
+    base = os.path.dirname(os.path.abspath(__file__))
+    fn = sys.argv[1] if len(sys.argv) > 1 else os.path.join(base, 'cylinder.vtu')
+    nparts = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    mesh = sv_vtkxml.read(fn)
+    graph = dual_graph(mesh.cell_array())
+    for method in ('metis', 'spectral', 'coordinate'):
+        if method == 'metis' and pymetis is None:
+            continue
+        start = time.time()
+        parts = partition(mesh, nparts, method, graph)
+        print("%-10s %6.2f s, edge cut %d, part sizes %s" % (method, time.time() - start,
+            edge_cut(graph, parts), np.bincount(parts).tolist()))
+    parts = partition(mesh, nparts, graph=graph)
+    start = time.time()
+    fns = write_parts(mesh, parts, os.path.join(base, 'test', 'parts'))
+    print("wrote %d parts in %.2f s" % (len(fns), time.time() - start))
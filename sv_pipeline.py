@@ -0,0 +1,459 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Deferred Pipelines
+"""
+Lazy solid -> surface -> volume mesh pipelines
+
+Every operation of a Pipeline only records a node; nothing runs until an
+output is requested with run() or Node.compute(). The nodes that no
+requested output depends on are pruned, and writes marked debug=True are
+skipped unless the run asks for them. Nodes shared by several outputs are
+evaluated once in the calling process; the branches that diverge after
+them are evaluated concurrently in forked worker processes, which inherit
+the shared Repository objects.
+
+Example:
+    p = Pipeline(out_dir)
+    surf = (p.cylinder(1., 10., [0,0,0], [0,0,1])
+            .union(p.cylinder(0.6, 10., [0,5,0], [0,1,0]))
+            .polydata(90, 2).remesh(0.3, 0.4))
+    surf.write('surface.vtk', debug=True)
+    coarse = surf.mesh(mesh_ops, fns('coarse'))
+    fine = surf.mesh(mesh_ops, fns('fine'), 'sphere_refine', sph_rfn_ops)
+    p.run([coarse, fine])
+"""
+import os
+import time
+import traceback
+
+from sv import *
+
+import sv_io
+import sv_jobs
+import sv_session
+
+SOLID_OPS = ('cylinder', 'sphere', 'union', 'subtract', 'intersect')
+POLYDATA_OPS = ('polydata', 'read', 'remesh', 'local_op_sphere', 'smooth')
+# nodes that produce files; only these can be evaluated in a worker process
+FILE_OPS = ('write', 'mesh')
+# Pipeline methods that are also available on a Node, with the node as first input
+CHAINABLE = ('union', 'subtract', 'intersect', 'polydata', 'remesh', 'local_op_sphere', 'smooth',
+        'write', 'mesh')
+
+class Node(object):
+    """
+    A deferred operation of a Pipeline
+
+    Attributes:
+        op: operation name
+        inputs: input nodes
+        params: operation parameters
+        name: Repository name of the result, file name for writes
+        debug: debug writes are skipped unless requested
+    """
+    def __init__(self, pipeline, op, inputs, params, name=None, debug=False):
+        self.pipeline = pipeline
+        self.id = len(pipeline.nodes)
+        self.op = op
+        self.inputs = list(inputs)
+        self.params = params
+        self.name = name or '%s_%d_%s' % (pipeline.prefix, self.id, op)
+        self.debug = debug
+        self.consumers = []
+        for node in self.inputs:
+            if node.pipeline is not pipeline:
+                raise ValueError("Node %r belongs to another pipeline" % node)
+            if node.op in FILE_OPS and not (op == 'mesh' and node.op == 'write'):
+                raise ValueError("The %s node %r cannot be the input of %s" % (node.op, node, op))
+            node.consumers.append(self)
+
+    def __getattr__(self, attr):
+        if attr in CHAINABLE:
+            method = getattr(self.pipeline, attr)
+            return lambda *args, **kw: method(self, *args, **kw)
+        raise AttributeError(attr)
+
+    def __repr__(self):
+        return '<%s %d %s>' % (self.op, self.id, self.name)
+
+    def compute(self, processes=None, debug=None):
+        """
+        Evaluate this node and what it depends on
+
+        Returns:
+            Repository name, written file name, or (surface, volume) files of a mesh
+        """
+        return self.pipeline.run([self], processes, debug)[self]
+
+def _run_branch(job):
+    """
+    Evaluate the nodes of one branch in a worker process
+    """
+    result = {'name': job['name'], 'scenario': 'pipeline', 'ok': False, 'wall_time': 0.,
+            'error': None, 'pid': os.getpid(), 'outputs': {}, 'reports': {}}
+    start = time.time()
+    pipeline = job['pipeline']
+    try:
+        for node in job['nodes']:
+            value = pipeline._evaluate(node)
+            if node.op in FILE_OPS:
+                result['outputs'][node.id] = value
+        result['ok'] = True
+    except Exception:
+        result['error'] = traceback.format_exc()
+    for node in job['nodes']:
+        if node.id in pipeline.reports:
+            result['reports'][node.id] = pipeline.reports[node.id]
+    result['wall_time'] = time.time() - start
+    return result
+
+class Pipeline(object):
+    """
+    Builder of deferred solid modeling and meshing operations
+
+    Nodes evaluated in the calling process are evaluated at most once per
+    pipeline; later runs reuse their results, so the Repository objects
+    of the nodes must be kept. Of a branch evaluated in a worker process
+    only the writes and meshes are kept: its other nodes existed in the
+    worker only, and a later run that needs one evaluates it again.
+
+    Args:
+        out_dir: directory of the model files written for mesh nodes
+        prefix: prefix of the Repository names of the nodes
+        debug: run debug writes by default
+    """
+    def __init__(self, out_dir, prefix='pipeline', debug=False):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.debug = debug
+        self.nodes = []
+        self._solids = {}
+        self._values = {}
+        self._model_writes = {}
+        self.reports = {}
+        self.evaluated = 0
+        self.reused = 0
+        self.pruned = 0
+
+    def _add(self, op, inputs=(), name=None, debug=False, **params):
+        node = Node(self, op, inputs, params, name, debug)
+        self.nodes.append(node)
+        return node
+
+    def _check(self, node, ops):
+        if node.op not in ops:
+            raise ValueError("Expected a %s node, got %r" % (' or '.join(ops), node))
+
+    # solids
+    def cylinder(self, radius, length, center, axis, name=None):
+        return self._add('cylinder', name=name, radius=radius, length=length, center=center, axis=axis)
+
+    def sphere(self, radius, center, name=None):
+        return self._add('sphere', name=name, radius=radius, center=center)
+
+    def _boolean(self, op, a, b, simplify, name):
+        self._check(a, SOLID_OPS)
+        self._check(b, SOLID_OPS)
+        if simplify is None:
+            simplify = 'None' if op == 'intersect' else 'All'
+        return self._add(op, (a, b), name=name, simplify=simplify)
+
+    def union(self, a, b, simplify=None, name=None):
+        return self._boolean('union', a, b, simplify, name)
+
+    def subtract(self, a, b, simplify=None, name=None):
+        return self._boolean('subtract', a, b, simplify, name)
+
+    def intersect(self, a, b, simplify=None, name=None):
+        return self._boolean('intersect', a, b, simplify, name)
+
+    # surfaces
+    def polydata(self, solid, angle=90., max_dist=2, name=None):
+        """
+        Boundary faces (GetBoundaryFaces) and polydata (GetPolyData) of a solid
+        """
+        self._check(solid, SOLID_OPS)
+        return self._add('polydata', (solid,), name=name, angle=angle, max_dist=max_dist)
+
+    def read(self, fn, name=None):
+        return self._add('read', name=name, fn=fn)
+
+    def remesh(self, surface, hmin, hmax, name=None):
+        self._check(surface, POLYDATA_OPS)
+        return self._add('remesh', (surface,), name=name, hmin=hmin, hmax=hmax)
+
+    def local_op_sphere(self, surface, radius, center, array_name='LocalOpsArray', data=0, name=None):
+        """
+        Geom.Set_array_for_local_op_sphere; data is 0 for a point array, 1 for a cell array
+        """
+        self._check(surface, POLYDATA_OPS)
+        return self._add('local_op_sphere', (surface,), name=name, radius=radius, center=center,
+                array_name=array_name, data=data)
+
+    def smooth(self, surface, iterations, relax_factor, num_cg_solves, point_array='LocalOpsArray',
+            cell_array='LocalOpsArray', name=None):
+        """
+        Geom.Local_constrain_smooth
+        """
+        self._check(surface, POLYDATA_OPS)
+        return self._add('smooth', (surface,), name=name, iterations=iterations, relax_factor=relax_factor,
+                num_cg_solves=num_cg_solves, point_array=point_array, cell_array=cell_array)
+
+    # outputs
+    def write(self, surface, fn, debug=False):
+        """
+        Write a surface; debug writes only run when the run asks for them
+        """
+        self._check(surface, POLYDATA_OPS)
+        return self._add('write', (surface,), name=fn, debug=debug, fn=fn)
+
+    def mesh(self, surface, mesh_ops, fns_out, scenario='mesh', refine_ops=None, name=None, cache_dir=None,
+            quality_limits=None):
+        """
+        Mesh a surface with one of the sv_jobs.SCENARIOS
+
+        The surface is written to the model file of the mesh once, however
+        many meshes are made from it. The job is run by sv_jobs.run_job and
+        its report entry, with cache hit and quality results, is kept in
+        Pipeline.reports.
+        """
+        if surface.op != 'write':
+            self._check(surface, POLYDATA_OPS)
+            if surface.id not in self._model_writes:
+                fn = os.path.join(self.out_dir, '%s_%d_model.vtp' % (self.prefix, surface.id))
+                self._model_writes[surface.id] = self.write(surface, fn)
+            surface = self._model_writes[surface.id]
+        job = sv_jobs.make_job(name, scenario, surface.params['fn'], mesh_ops, fns_out, refine_ops, cache_dir,
+                quality_limits)
+        node = self._add('mesh', (surface,), name=name, job=job)
+        node.params['job']['name'] = node.name
+        return node
+
+    def _evaluate(self, node):
+        """
+        Run one node whose inputs are evaluated
+        """
+        p = node.params
+        src = [n.name for n in node.inputs]
+        if node.op not in FILE_OPS and Repository.Exists(node.name):
+            Repository.Delete(node.name)
+        if node.op in SOLID_OPS:
+            solid = Solid.pySolidModel()
+            if node.op == 'cylinder':
+                solid.Cylinder(node.name, p['radius'], p['length'], p['center'], p['axis'])
+            elif node.op == 'sphere':
+                solid.Sphere(node.name, p['radius'], p['center'])
+            else:
+                op = getattr(solid, {'union': 'Union', 'subtract': 'Subtract', 'intersect': 'Intersect'}[node.op])
+                op(node.name, src[0], src[1], p['simplify'])
+            self._solids[node.id] = solid
+        elif node.op == 'polydata':
+            solid = self._solids[node.inputs[0].id]
+            solid.GetBoundaryFaces(p['angle'])
+            solid.GetPolyData(node.name, p['max_dist'])
+        elif node.op == 'read':
+            sv_io.read_polydata(p['fn'], node.name)
+        elif node.op == 'remesh':
+            MeshUtil.Remesh(src[0], node.name, p['hmin'], p['hmax'])
+        elif node.op == 'local_op_sphere':
+            Geom.Set_array_for_local_op_sphere(src[0], node.name, p['radius'], p['center'],
+                    p['array_name'], p['data'])
+        elif node.op == 'smooth':
+            Geom.Local_constrain_smooth(src[0], node.name, p['iterations'], p['relax_factor'],
+                    p['num_cg_solves'], p['point_array'], p['cell_array'])
+        elif node.op == 'write':
+            sv_io.write_polydata(src[0], p['fn'])
+            return p['fn']
+        elif node.op == 'mesh':
+            return self._mesh(node)
+        else:
+            raise ValueError("Unknown pipeline operation: " + str(node.op))
+        return node.name
+
+    def _mesh(self, node):
+        """
+        Run a mesh job without cleaning the Repository objects of the pipeline
+        """
+        session = sv_session.Session()
+        try:
+            report = sv_jobs.run_job(node.params['job'], session)
+        finally:
+            session.close()
+        self.reports[node.id] = report
+        if not report['ok']:
+            raise RuntimeError("Meshing %s failed: %s" % (node.name, report['error']))
+        return node.params['job']['fns_out']
+
+    def outputs(self, debug=None):
+        """
+        Default outputs: the writes and meshes nothing else depends on
+        """
+        debug = self.debug if debug is None else debug
+        return [n for n in self.nodes if n.op in FILE_OPS and not n.consumers and (debug or not n.debug)]
+
+    def plan(self, outputs=None, debug=None):
+        """
+        Split the nodes needed for outputs into shared nodes and branches
+
+        Returns:
+            dict of 'shared' nodes evaluated in the calling process, the
+            'branches' (lists of nodes, one per file output) that may run
+            concurrently, and the 'pruned' nodes no output depends on
+        """
+        if outputs is None:
+            outputs = self.outputs(debug)
+        users = {}
+        for index, output in enumerate(outputs):
+            stack = [output]
+            while stack:
+                node = stack.pop()
+                if node.id in self._values:
+                    continue
+                ids = users.setdefault(node.id, set())
+                if index in ids:
+                    continue
+                ids.add(index)
+                stack.extend(node.inputs)
+        shared = []
+        branches = [[] for output in outputs]
+        for node in self.nodes:
+            ids = users.get(node.id)
+            if not ids:
+                continue
+            index = min(ids)
+            if len(ids) > 1 or outputs[index].op not in FILE_OPS:
+                shared.append(node)
+            else:
+                branches[index].append(node)
+        return {
+                'shared': shared,
+                'branches': [b for b in branches if b],
+                'pruned': [n for n in self.nodes if n.id not in users and n.id not in self._values],
+        }
+
+    def run(self, outputs=None, processes=None, debug=None):
+        """
+        Evaluate the requested outputs, all non-debug outputs if None
+
+        Args:
+            outputs: nodes to evaluate
+            processes: concurrent branch workers, all cores if None; 1
+                evaluates every branch in the calling process
+            debug: also run debug writes when outputs is None
+
+        Returns:
+            dict of node to Repository name, written file name, or
+            (surface, volume) files of a mesh
+        """
+        if outputs is None:
+            outputs = self.outputs(debug)
+        plan = self.plan(outputs)
+        self.pruned += len(plan['pruned'])
+        self.reused += len([n for n in outputs if n.id in self._values])
+        for node in plan['shared']:
+            self._values[node.id] = self._evaluate(node)
+            self.evaluated += 1
+        branches = plan['branches']
+        if processes == 1 or len(branches) < 2:
+            for nodes in branches:
+                for node in nodes:
+                    self._values[node.id] = self._evaluate(node)
+                    self.evaluated += 1
+        else:
+            jobs = [{'name': nodes[-1].name, 'pipeline': self, 'nodes': nodes} for nodes in branches]
+            results = sv_jobs.run_jobs(jobs, processes=processes, target=_run_branch)
+            for result in results:
+                self.reports.update(result.get('reports', {}))
+            failed = [r for r in results if not r['ok']]
+            if failed:
+                raise RuntimeError("Pipeline evaluation failed: " + "; ".join(
+                    "%s: %s" % (r['name'], r['error']) for r in failed))
+            for nodes, result in zip(branches, results):
+                self._values.update(result['outputs'])
+                self.evaluated += len(nodes)
+        return dict((node, self._values[node.id]) for node in outputs)
+
+    def stats(self):
+        return {'evaluated': self.evaluated, 'reused': self.reused, 'pruned': self.pruned}
+
+    def print_plan(self, outputs=None, debug=None):
+        plan = self.plan(outputs, debug)
+        print("shared: %s" % ', '.join(repr(n) for n in plan['shared']))
+        for i, nodes in enumerate(plan['branches']):
+            print("branch %d: %s" % (i, ', '.join(repr(n) for n in nodes)))
+        print("pruned: %s" % ', '.join(repr(n) for n in plan['pruned']))
+
+if __name__ == '__main__':
+    out_dir = os.path.join(os.path.dirname(__file__), 'test')
+    try:
+        os.makedirs(out_dir)
+    except Exception as e: print(e)
+    sv_session.clean_repos()
+    Solid.SetKernel('PolyData')
+
+    # the workflow of sv_geom.py; cyl.vtk is only written with debug=True
+    p = Pipeline(out_dir)
+    surf = (p.cylinder(1., 10., [0,0,0], [0,0,1])
+            .union(p.cylinder(0.6, 10., [0,5,0], [0,1,0]))
+            .polydata(90, 2)
+            .remesh(0.3, 0.4)
+            .remesh(0.3, 0.4))
+    arrays = (surf.local_op_sphere(3, [0,0,0], 'LocalOpsArray', 0)
+            .local_op_sphere(3, [0,0,0], 'LocalOpsArray', 1))
+    arrays.write(os.path.join(out_dir, 'cyl.vtk'), debug=True)
+    smooth = arrays.smooth(5, 0.8, 30, 'LocalOpsArray', 'LocalOpsArray')
+    smooth.write(os.path.join(out_dir, 'geom_test_local_smooth.vtk'))
+
+    # meshing variants of the same surface run concurrently after it is built once
+    mesh_ops = {
+            'SurfaceMeshFlag': True,
+            'VolumeMeshFlag': True,
+            'GlobalEdgeSize': 0.5,
+            'MeshWallFirst': True,
+            'NoMerge':True,
+            'NoBisect': True,
+            'Epsilon': 1e-8,
+            'Optimization': 3,
+            'QualityRatio': 1.4
+    }
+    def fns(prefix):
+        return (os.path.join(out_dir, prefix+'_surface.vtk'), os.path.join(out_dir, prefix+'_vol.vtk'))
+    smooth.mesh(mesh_ops, fns('pipeline_mesh'), name='pipeline_mesh')
+    smooth.mesh(mesh_ops, fns('pipeline_sph_rfn'), 'sphere_refine', {'size':0.2, 'rad':1, 'center':[0,0,0]},
+            name='pipeline_sph_rfn')
+    # never requested, so never run
+    surf.remesh(0.1, 0.2)
+
+    p.print_plan()
+    for node, value in p.run().items():
+        print(node, value)
+    sv_jobs.print_report(list(p.reports.values()))
+    print(p.stats())
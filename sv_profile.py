@@ -0,0 +1,281 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Profiling
+"""
+Opt-in per-stage timing and memory instrumentation of SV API calls
+
+enable() replaces the SV API modules (Repository, MeshObject, Solid, ...)
+imported by the example scripts with proxies that time every call. Objects
+created through the API (pyMeshObject, pySolidModel) are wrapped as well,
+so LoadModel, GetBoundaryFaces, GenerateMesh etc. are recorded with wall
+time, CPU time and peak RSS, tagged with the current scenario name.
+
+Example:
+    prof = sv_profile.Profiler()
+    sv_profile.enable(prof)
+    with prof.scenario('sphere_refine'):
+        sv_mesh.sphere_refine(...)
+    sv_profile.disable()
+    prof.print_summary()
+    prof.write_chrome_trace('trace.json')
+"""
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# SV API modules wrapped by enable()
+SV_MODULES = ('Repository', 'MeshObject', 'Solid', 'MeshUtil', 'Geom', 'VMTKUtils',
+        'MeshTetgen', 'SolidPolyData', 'SolidOCCT')
+# scripts whose SV module references are instrumented by default
+SCRIPTS = ('sv_mesh', 'sv_mesh2', 'sv_solid', 'sv_geom', 'sv_io', 'sv_session')
+
+def peak_rss():
+    """
+    Peak resident set size of this process in bytes, None if unavailable
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+class Profiler(object):
+    """
+    Collects one record per SV API call
+    """
+    def __init__(self):
+        self.records = []
+        self._scenario = None
+        self._origin = time.time()
+
+    @contextlib.contextmanager
+    def scenario(self, name):
+        """
+        Tag the calls made inside the block with a scenario name
+        """
+        previous = self._scenario
+        self._scenario = name
+        try:
+            yield self
+        finally:
+            self._scenario = previous
+
+    def call(self, stage, func, *args, **kwargs):
+        """
+        Call func and record its wall time, CPU time and peak RSS
+        """
+        rss_before = peak_rss()
+        start = time.time()
+        cpu = time.process_time()
+        error = None
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            end = time.time()
+            rss = peak_rss()
+            self.records.append({
+                    'scenario': self._scenario,
+                    'stage': stage,
+                    'start': start - self._origin,
+                    'wall_time': end - start,
+                    'cpu_time': time.process_time() - cpu,
+                    'peak_rss': rss,
+                    'peak_rss_increase': rss - rss_before if rss is not None else None,
+                    'pid': os.getpid(),
+                    'tid': threading.current_thread().ident,
+                    'error': error,
+            })
+
+    def summary(self):
+        """
+        Totals per (scenario, stage), sorted by total wall time
+        """
+        totals = {}
+        for r in self.records:
+            key = (r['scenario'], r['stage'])
+            entry = totals.setdefault(key, {'scenario': r['scenario'], 'stage': r['stage'],
+                'calls': 0, 'wall_time': 0., 'cpu_time': 0., 'peak_rss': 0})
+            entry['calls'] += 1
+            entry['wall_time'] += r['wall_time']
+            entry['cpu_time'] += r['cpu_time']
+            entry['peak_rss'] = max(entry['peak_rss'], r['peak_rss'] or 0)
+        return sorted(totals.values(), key=lambda e: -e['wall_time'])
+
+    def print_summary(self):
+        print("%-16s %-36s %6s %10s %10s %10s" % ('scenario', 'stage', 'calls', 'wall [s]',
+            'cpu [s]', 'rss [MB]'))
+        for e in self.summary():
+            print("%-16s %-36s %6d %10.3f %10.3f %10.1f" % (e['scenario'], e['stage'], e['calls'],
+                e['wall_time'], e['cpu_time'], e['peak_rss'] / 1024.**2))
+
+    def write_jsonl(self, fn):
+        """
+        Write one JSON record per call
+        """
+        with open(fn, 'w') as f:
+            for r in self.records:
+                f.write(json.dumps(r) + '\n')
+
+    def write_chrome_trace(self, fn):
+        """
+        Write the records in Chrome trace event format (chrome://tracing, Perfetto)
+        """
+        events = []
+        for r in self.records:
+            events.append({
+                    'name': r['stage'],
+                    'cat': r['scenario'] or 'default',
+                    'ph': 'X',
+                    'ts': r['start'] * 1e6,
+                    'dur': r['wall_time'] * 1e6,
+                    'pid': r['pid'],
+                    'tid': r['tid'],
+                    'args': {
+                        'scenario': r['scenario'],
+                        'cpu_time': r['cpu_time'],
+                        'peak_rss': r['peak_rss'],
+                        'error': r['error'],
+                    },
+            })
+        with open(fn, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+class _Proxy(object):
+    """
+    Forwards attribute access to an SV module or object and times calls
+    """
+    def __init__(self, target, label, profiler):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_label', label)
+        object.__setattr__(self, '_profiler', profiler)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        stage = self._label + '.' + name
+        profiler = self._profiler
+        def wrapper(*args, **kwargs):
+            result = profiler.call(stage, attr, *args, **kwargs)
+            # wrap SV objects (pyMeshObject, pySolidModel, ...) to time their methods
+            cls = type(result).__name__
+            if cls.startswith('py') and not isinstance(result, _Proxy):
+                return _Proxy(result, cls, profiler)
+            return result
+        return wrapper
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+
+    def __repr__(self):
+        return '<profiled %r>' % (self._target,)
+
+_saved = []
+
+def enable(profiler, modules=None):
+    """
+    Instrument the SV API references of the given script modules
+
+    Args:
+        profiler: Profiler collecting the records
+        modules: script modules or module names, SCRIPTS by default
+    """
+    if modules is None:
+        modules = SCRIPTS
+    for module in modules:
+        if isinstance(module, str):
+            module = __import__(module)
+        for name in SV_MODULES:
+            target = module.__dict__.get(name)
+            if target is None or isinstance(target, _Proxy):
+                continue
+            _saved.append((module, name, target))
+            setattr(module, name, _Proxy(target, name, profiler))
+
+def disable():
+    """
+    Restore the original SV API references
+    """
+    while _saved:
+        module, name, target = _saved.pop()
+        setattr(module, name, target)
+
+@contextlib.contextmanager
+def profiled(profiler, scenario=None, modules=None):
+    """
+    Instrument the scripts for the duration of a block
+    """
+    enable(profiler, modules)
+    try:
+        with profiler.scenario(scenario):
+            yield profiler
+    finally:
+        disable()
+
+if __name__ == '__main__':
+    import sv_mesh
+    solid_fn = os.path.join(os.path.dirname(__file__), 'cylinder.vtp')
+    out_dir = os.path.join(os.path.dirname(__file__), 'test')
+    try:
+        os.makedirs(out_dir)
+    except Exception as e: print(e)
+
+    mesh_ops = {
+            'SurfaceMeshFlag': True,
+            'VolumeMeshFlag': True,
+            'GlobalEdgeSize': 0.5,
+            'MeshWallFirst': True,
+            'NoMerge':True,
+            'NoBisect': True,
+            'Epsilon': 1e-8,
+            'Optimization': 3,
+            'QualityRatio': 1.4
+    }
+    prof = Profiler()
+    with profiled(prof, 'mesh'):
+        sv_mesh.mesh('cylinder', solid_fn, mesh_ops, (os.path.join(out_dir, 'mesh_surface.vtk'),
+            os.path.join(out_dir, 'mesh_vol.vtk')))
+    with profiled(prof, 'sphere_refine'):
+        sv_mesh.sphere_refine('sph_refine', solid_fn, mesh_ops, {'size':0.2, 'rad':1, 'center':[0,0,0]},
+            (os.path.join(out_dir, 'sph_rfn_surface.vtk'), os.path.join(out_dir, 'sph_rfn_vol.vtk')))
+    prof.print_summary()
+    prof.write_jsonl(os.path.join(out_dir, 'profile.jsonl'))
+    prof.write_chrome_trace(os.path.join(out_dir, 'profile_trace.json'))
@@ -0,0 +1,233 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Mesh Quality
+"""
+Vectorized quality metrics for tetrahedral volume meshes
+
+All metrics are computed for every tetrahedron in one batched NumPy pass:
+
+    volume              signed volume, <= 0 for inverted elements
+    radius_edge         circumradius / shortest edge, the measure bounded by
+                        TetGen's QualityRatio option (0.612 for a regular tet)
+    aspect_ratio        circumradius / (3 * inradius), 1 for a regular tet
+    min_dihedral        smallest dihedral angle in degrees (70.53 regular)
+    max_dihedral        largest dihedral angle in degrees
+
+Example:
+    report = sv_quality.from_file('cylinder.vtu')
+    print_report(report)
+    failures = check(report, {'radius_edge': 2.0, 'min_dihedral': 5.})
+"""
+import numpy as np
+
+import sv_vtkxml
+
+METRICS = ('volume', 'radius_edge', 'aspect_ratio', 'min_dihedral', 'max_dihedral')
+
+# limits used by check(); volume and min_dihedral are lower bounds
+DEFAULT_LIMITS = {
+        'volume': 0.,
+        'radius_edge': 2.,
+        'aspect_ratio': 10.,
+        'min_dihedral': 5.,
+        'max_dihedral': 175.,
+}
+_LOWER_BOUNDS = ('volume', 'min_dihedral')
+
+# vertex pairs of the six tet edges and, for each edge, the two vertices
+# opposite to it; the faces opposite those vertices share the edge
+_EDGES = np.array([[0, 1], [0, 2], [0, 3], [1, 2], [1, 3], [2, 3]])
+_EDGE_FACES = np.array([[2, 3], [1, 3], [1, 2], [0, 3], [0, 2], [0, 1]])
+# faces given by the vertex they are opposite to
+_FACES = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]])
+
+def tet_quality(points, tets):
+    """
+    Quality metrics of tetrahedra
+
+    Args:
+        points: (npoints, 3) coordinates
+        tets: (ntets, 4) point ids
+    Returns:
+        dict metric name -> (ntets,) array
+    """
+    p = np.asarray(points, dtype=np.float64)[np.asarray(tets)]
+    a = p[:, 1] - p[:, 0]
+    b = p[:, 2] - p[:, 0]
+    c = p[:, 3] - p[:, 0]
+    bxc = np.cross(b, c)
+    det = np.einsum('ij,ij->i', a, bxc)
+    volume = det / 6.
+
+    edges = p[:, _EDGES[:, 1]] - p[:, _EDGES[:, 0]]
+    edge_len = np.sqrt(np.einsum('ijk,ijk->ij', edges, edges))
+    min_edge = edge_len.min(axis=1)
+
+    # circumcenter offset from vertex 0
+    num = (np.einsum('ij,ij->i', a, a)[:, None] * bxc
+            + np.einsum('ij,ij->i', b, b)[:, None] * np.cross(c, a)
+            + np.einsum('ij,ij->i', c, c)[:, None] * np.cross(a, b))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        circumradius = np.sqrt(np.einsum('ij,ij->i', num, num)) / np.abs(2. * det)
+
+    # outward face normals: flip the ones pointing at the opposite vertex
+    fp = p[:, _FACES]
+    normals = np.cross(fp[:, :, 1] - fp[:, :, 0], fp[:, :, 2] - fp[:, :, 0])
+    areas2 = np.sqrt(np.einsum('ijk,ijk->ij', normals, normals))
+    side = np.einsum('ijk,ijk->ij', normals, p - fp[:, :, 0])
+    normals *= np.where(side > 0, -1., 1.)[:, :, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normals /= areas2[:, :, None]
+        inradius = 3. * np.abs(volume) / (0.5 * areas2.sum(axis=1))
+        n1 = normals[:, _EDGE_FACES[:, 0]]
+        n2 = normals[:, _EDGE_FACES[:, 1]]
+        cos = np.clip(np.einsum('ijk,ijk->ij', n1, n2), -1., 1.)
+        dihedral = 180. - np.degrees(np.arccos(cos))
+        radius_edge = circumradius / min_edge
+        aspect_ratio = circumradius / (3. * inradius)
+    return {
+            'volume': volume,
+            'radius_edge': radius_edge,
+            'aspect_ratio': aspect_ratio,
+            'min_dihedral': dihedral.min(axis=1),
+            'max_dihedral': dihedral.max(axis=1),
+    }
+
+def mesh_quality(mesh):
+    """
+    Quality metrics of the tetrahedra of a sv_vtkxml.MeshArrays grid
+    """
+    types = mesh.types
+    if types is None:
+        raise ValueError("Quality metrics need an unstructured grid")
+    conn = mesh.connectivity
+    offsets = np.asarray(mesh.offsets)
+    tet = types == sv_vtkxml.VTK_TETRA
+    if np.all(tet):
+        tets = mesh.cell_array(4)
+    else:
+        starts = offsets[tet] - 4
+        tets = np.asarray(conn)[starts[:, None] + np.arange(4)]
+    return tet_quality(mesh.points, tets)
+
+def summarize(metrics, bins=20):
+    """
+    Summary statistics and histograms of per-element metrics
+    """
+    report = {'num_elements': 0, 'metrics': {}}
+    for name in METRICS:
+        values = metrics[name]
+        report['num_elements'] = len(values)
+        finite = values[np.isfinite(values)]
+        entry = {'num_invalid': int(len(values) - len(finite))}
+        if len(finite):
+            counts, edges = np.histogram(finite, bins=bins)
+            entry.update({
+                    'min': float(finite.min()),
+                    'max': float(finite.max()),
+                    'mean': float(finite.mean()),
+                    'p01': float(np.percentile(finite, 1)),
+                    'p99': float(np.percentile(finite, 99)),
+                    'histogram': (counts.tolist(), edges.tolist()),
+            })
+        report['metrics'][name] = entry
+    return report
+
+def check(report, limits=None):
+    """
+    Compare a report against limits
+
+    Args:
+        limits: dict metric -> bound; volume and min_dihedral are lower
+            bounds on the minimum, all other metrics upper bounds on the
+            maximum. Defaults to DEFAULT_LIMITS.
+    Returns:
+        list of failure messages, empty if the mesh passes
+    """
+    if limits is None:
+        limits = DEFAULT_LIMITS
+    failures = []
+    for name, bound in limits.items():
+        entry = report['metrics'][name]
+        if entry['num_invalid']:
+            failures.append("%s: %d degenerate elements" % (name, entry['num_invalid']))
+        if 'min' not in entry:
+            continue
+        if name in _LOWER_BOUNDS and entry['min'] <= bound:
+            failures.append("%s: min %g <= %g" % (name, entry['min'], bound))
+        elif name not in _LOWER_BOUNDS and entry['max'] > bound:
+            failures.append("%s: max %g > %g" % (name, entry['max'], bound))
+    return failures
+
+def print_report(report, histograms=True):
+    print("Mesh quality of %d tetrahedra" % report['num_elements'])
+    print("%-14s %12s %12s %12s %12s %12s" % ('metric', 'min', 'p01', 'mean', 'p99', 'max'))
+    for name in METRICS:
+        entry = report['metrics'][name]
+        if 'min' not in entry:
+            continue
+        print("%-14s %12.4g %12.4g %12.4g %12.4g %12.4g" % (name, entry['min'], entry['p01'],
+            entry['mean'], entry['p99'], entry['max']))
+    if not histograms:
+        return
+    for name in METRICS:
+        entry = report['metrics'][name]
+        if 'histogram' not in entry:
+            continue
+        counts, edges = entry['histogram']
+        print("*********%s*********" % name)
+        width = max(counts) or 1
+        for i, count in enumerate(counts):
+            print("%12.4g - %-12.4g %8d %s" % (edges[i], edges[i+1], count, '#' * (40 * count // width)))
+
+def from_file(fn, bins=20):
+    """
+    Quality report of a .vtu file
+    """
+    return summarize(mesh_quality(sv_vtkxml.read(fn)), bins)
+
+def from_repository(name, bins=20):
+    """
+    Quality report of a Repository unstructured grid, e.g. from GetUnstructuredGrid
+    """
+    import sv_io
+    return summarize(mesh_quality(sv_io.export_arrays(name)), bins)
+
+if __name__ == '__main__':
+    import os
+    import sys
+    fn = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cylinder.vtu')
+    report = from_file(fn)
+    print_report(report)
+    failures = check(report)
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,227 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Incremental Remeshing
+"""
+Incremental face remeshing for PolyData solid models
+
+Every face is fingerprinted by a hash of its triangles' coordinates and
+its target edge size. Only the faces whose fingerprint changed since the
+previous run are passed to RemeshFace; the other faces are taken from the
+remeshed surface cached by that run and stitched back on. RemeshFace keeps
+face boundaries fixed, so cached and freshly remeshed faces share their
+boundary points and stitching only needs to merge coincident points;
+the stitched surface is checked to be closed and manifold.
+
+Example:
+    remesher = IncrementalRemesher(cache_dir)
+    solid.GetBoundaryFaces(80)
+    solid = remesher.remesh(solid, {1: 0.2, 2: 0.4, 3: 0.4}, 'model')
+"""
+import os
+import json
+import hashlib
+
+import numpy as np
+from scipy.spatial import cKDTree
+from sv import *
+
+import sv_io
+import sv_vtkxml
+
+def face_fingerprint(points, triangles, edge_size):
+    """
+    Hash of a face's triangle coordinates and its target edge size, None
+    for a face that is not remeshed
+    """
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(points[triangles], dtype='<f8').tobytes())
+    h.update(repr(None if edge_size is None else float(edge_size)).encode())
+    return h.hexdigest()
+
+def surface_fingerprints(mesh, face_sizes):
+    """
+    Fingerprints of all faces of a MeshArrays surface with a ModelFaceID array
+
+    Faces not in face_sizes are fingerprinted without an edge size.
+    """
+    tris = mesh.cell_array(3)
+    face_ids = np.asarray(mesh.cell_data['ModelFaceID'])
+    sizes = dict((int(face_id), None) for face_id in np.unique(face_ids))
+    sizes.update((int(face_id), size) for face_id, size in face_sizes.items())
+    fingerprints = {}
+    for face_id, size in sizes.items():
+        fingerprints[str(face_id)] = face_fingerprint(mesh.points, tris[face_ids == int(face_id)], size)
+    return fingerprints
+
+def merge_points(points, radius):
+    """
+    Representative point index for every point, merging points within radius
+
+    Pairs found by a cKDTree are joined with a union-find, so chains of
+    close points collapse onto one representative, the lowest index.
+    """
+    parent = np.arange(len(points))
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    for i, j in cKDTree(points).query_pairs(radius):
+        ri, rj = find(i), find(j)
+        if ri != rj:
+            parent[max(ri, rj)] = min(ri, rj)
+    return np.array([find(i) for i in range(len(points))], dtype=np.int64)
+
+def check_manifold(tris):
+    """
+    Raise ValueError unless every edge is shared by exactly two triangles
+    """
+    edges = np.sort(tris[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+    _, counts = np.unique(edges, axis=0, return_counts=True)
+    bad = int(np.count_nonzero(counts != 2))
+    if bad:
+        raise ValueError("Stitched surface has %d edges not shared by two triangles" % bad)
+
+def stitch(parts, tol=1e-8):
+    """
+    Merge (mesh, face ids) parts into one closed triangle surface
+
+    Points closer than tol times the bounding box size are merged.
+    Raises ValueError if the result has cracks or non-manifold edges.
+    Returns:
+        points, triangles, ModelFaceID array
+    """
+    points = []
+    tris = []
+    ids = []
+    offset = 0
+    for mesh, faces in parts:
+        face_ids = np.asarray(mesh.cell_data['ModelFaceID'])
+        keep = np.isin(face_ids, list(faces))
+        if not np.any(keep):
+            continue
+        used, local = np.unique(mesh.cell_array(3)[keep], return_inverse=True)
+        points.append(np.asarray(mesh.points, dtype=np.float64)[used])
+        tris.append(local.reshape(-1, 3) + offset)
+        ids.append(face_ids[keep])
+        offset += len(used)
+    points = np.concatenate(points)
+    tris = np.concatenate(tris)
+    scale = max(float(np.ptp(points, axis=0).max()), 1e-12) * tol
+    first, inverse = np.unique(merge_points(points, scale), return_inverse=True)
+    tris = inverse.ravel()[tris]
+    check_manifold(tris)
+    return points[first], tris, np.concatenate(ids).astype(np.int32)
+
+class IncrementalRemesher(object):
+    """
+    Remeshes only the faces that changed since the last run of a model
+
+    Args:
+        cache_dir: directory for the fingerprints and remeshed surfaces
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir):
+                raise
+
+    def _files(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + '.json', base + '.vtp'
+
+    def _load_state(self, key):
+        state_fn, surface_fn = self._files(key)
+        if not (os.path.exists(state_fn) and os.path.exists(surface_fn)):
+            return {}
+        with open(state_fn) as f:
+            return json.load(f)
+
+    def changed_faces(self, mesh, face_sizes, key, fingerprints=None):
+        """
+        Face ids of face_sizes whose geometry or target size differs from the cached run
+        """
+        state = self._load_state(key)
+        if fingerprints is None:
+            fingerprints = surface_fingerprints(mesh, face_sizes)
+        return [face_id for face_id in face_sizes if state.get(str(face_id)) != fingerprints[str(face_id)]]
+
+    def remesh(self, solid, face_sizes, key):
+        """
+        Remesh the faces of a solid, reusing unchanged faces of the last run
+
+        Args:
+            solid: PolyData solid model with boundary faces
+            face_sizes: dict face id -> target edge size; faces not listed
+                are kept as they are in the solid
+            key: name of the model in the cache
+        Returns:
+            solid model of the stitched surface
+        """
+        state_fn, surface_fn = self._files(key)
+        poly_name = key + '_remesh_input'
+        solid.GetPolyData(poly_name)
+        mesh = sv_io.export_arrays(poly_name)
+        fingerprints = surface_fingerprints(mesh, face_sizes)
+        changed = self.changed_faces(mesh, face_sizes, key, fingerprints)
+        print("Remeshing faces %s of %s" % (changed, sorted(face_sizes)))
+
+        # faces that are not listed are taken from the solid, so any change
+        # to them also invalidates the cached surface
+        if fingerprints != self._load_state(key):
+            remeshed = mesh
+            if changed:
+                by_size = {}
+                for face_id in changed:
+                    by_size.setdefault(face_sizes[face_id], []).append(int(face_id))
+                for size, face_ids in by_size.items():
+                    solid.RemeshFace(face_ids, size)
+                out_name = key + '_remesh_output'
+                solid.GetPolyData(out_name)
+                remeshed = sv_io.export_arrays(out_name)
+            all_faces = set(int(i) for i in np.unique(remeshed.cell_data['ModelFaceID']))
+            cached_faces = set(int(i) for i in face_sizes) - set(int(i) for i in changed)
+            parts = [(remeshed, all_faces - cached_faces)]
+            if cached_faces:
+                parts.append((sv_vtkxml.read(surface_fn), cached_faces))
+            points, tris, face_ids = stitch(parts)
+            tmp_fn = surface_fn + '.tmp'
+            sv_vtkxml.write_polydata(tmp_fn, points, tris.ravel(), cell_size=3,
+                    cell_data={'ModelFaceID': face_ids})
+            os.rename(tmp_fn, surface_fn)
+            with open(state_fn, 'w') as f:
+                json.dump(fingerprints, f)
+
+        result = Solid.pySolidModel()
+        result.ReadNative(key + '_remeshed', surface_fn)
+        return result
@@ -0,0 +1,210 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Mesh Renumbering
+"""
+Node and element renumbering for cache locality and matrix bandwidth
+
+TetGen leaves nodes in insertion order, so neighbouring nodes can be far
+apart in the arrays. reorder() renumbers the nodes with Reverse
+Cuthill-McKee ('rcm', smallest bandwidth of the node adjacency matrix) or
+along a Morton space-filling curve ('morton', spatial locality), then
+sorts the cells by their smallest new node id. Connectivity, point arrays
+and cell arrays are permuted consistently. GlobalNodeID/GlobalElementID
+travel with their nodes and cells, so they keep mapping to the original
+ids; they are added (1-based, like SV) when missing.
+
+Example:
+    mesh, node_order, cell_order = reorder(sv_vtkxml.read('cylinder.vtu'), 'rcm')
+    # new node i is old node node_order[i]
+"""
+import itertools
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+import sv_vtkxml
+
+METHODS = ('rcm', 'morton')
+
+def cell_groups(mesh):
+    """
+    Cells of a MeshArrays mesh grouped by their number of points
+
+    Returns:
+        list of (cell ids, (ncells, npts) point ids), one per cell size, so
+        meshes mixing tetrahedra and boundary layer wedges are supported
+    """
+    conn = np.asarray(mesh.connectivity, dtype=np.int64)
+    offsets = np.asarray(mesh.offsets, dtype=np.int64)
+    sizes = np.diff(offsets, prepend=0)
+    starts = offsets - sizes
+    groups = []
+    for npts in np.unique(sizes):
+        ids = np.nonzero(sizes == npts)[0]
+        groups.append((ids, conn[starts[ids][:, None] + np.arange(npts)]))
+    return groups
+
+def _cell_arrays(cells):
+    if isinstance(cells, (list, tuple)):
+        return [np.asarray(c, dtype=np.int64) for c in cells]
+    return [np.asarray(cells, dtype=np.int64)]
+
+def node_graph(cells, num_points):
+    """
+    Symmetric node adjacency of cells given as (ncells, npts) point ids,
+    or a list of such arrays for cells of different sizes
+    """
+    i, j = [], []
+    for group in _cell_arrays(cells):
+        for a, b in itertools.combinations(range(group.shape[1]), 2):
+            i += [group[:, a], group[:, b]]
+            j += [group[:, b], group[:, a]]
+    i = np.concatenate(i) if i else np.zeros(0, dtype=np.int64)
+    j = np.concatenate(j) if j else np.zeros(0, dtype=np.int64)
+    # duplicate entries are summed; only the pattern is used, so reset
+    # them to 1 instead of counting the cells sharing an edge
+    graph = sp.csr_matrix((np.ones(len(i), dtype=np.int32), (i, j)), shape=(num_points, num_points))
+    graph.data[:] = 1
+    return graph
+
+def bandwidth(cells, num_points=None):
+    """
+    Bandwidth statistics of the node adjacency matrix of cells
+
+    Args:
+        cells: (ncells, npts) point ids, or a list of such arrays
+    Returns:
+        dict with 'bandwidth' (largest |i - j| over connected nodes) and
+        'mean' (average |i - j| over the cell edges)
+    """
+    spread = [np.abs(group[:, a] - group[:, b]) for group in _cell_arrays(cells)
+            for a, b in itertools.combinations(range(group.shape[1]), 2)]
+    spread = np.concatenate(spread) if spread else np.zeros(0, dtype=np.int64)
+    return {
+            'bandwidth': int(spread.max()) if len(spread) else 0,
+            'mean': float(spread.mean()) if len(spread) else 0.,
+    }
+
+def morton_codes(points, bits=21):
+    """
+    Z-order curve index of points quantized to 2**bits cells per axis
+    """
+    points = np.asarray(points, dtype=np.float64)
+    lo = points.min(axis=0)
+    extent = np.ptp(points, axis=0).max() or 1.
+    q = ((points - lo) / extent * (2 ** bits - 1)).astype(np.uint64)
+    codes = np.zeros(len(points), dtype=np.uint64)
+    for bit in range(bits):
+        for axis in range(3):
+            codes |= ((q[:, axis] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(3 * bit + axis)
+    return codes
+
+def node_order(mesh, method='rcm', cells=None):
+    """
+    New node order: new node i is old node order[i]
+    """
+    if cells is None:
+        cells = [group for _, group in cell_groups(mesh)]
+    if method == 'rcm':
+        return np.asarray(reverse_cuthill_mckee(node_graph(cells, len(mesh.points)), symmetric_mode=True),
+                dtype=np.int64)
+    if method == 'morton':
+        return np.argsort(morton_codes(mesh.points), kind='stable')
+    raise ValueError("Unknown reordering method: " + str(method))
+
+def reorder(mesh, method='rcm'):
+    """
+    Renumber the nodes and cells of a MeshArrays mesh
+
+    Cells may have different numbers of points, e.g. tetrahedra and
+    boundary layer wedges.
+    Returns:
+        (renumbered MeshArrays, node order, cell order) where new node i is
+        old node node_order[i] and new cell k is old cell cell_order[k]
+    """
+    conn = np.asarray(mesh.connectivity)
+    offsets = np.asarray(mesh.offsets)
+    sizes = np.diff(offsets.astype(np.int64), prepend=0)
+    if np.any(sizes <= 0):
+        raise ValueError("Mesh has cells without points")
+    starts = offsets - sizes
+    num_points = len(mesh.points)
+    nodes = node_order(mesh, method)
+    new_id = np.empty(num_points, dtype=np.int64)
+    new_id[nodes] = np.arange(num_points)
+    new_conn = new_id[conn]
+    # cells in the order their first node is visited
+    cell_order = np.lexsort((np.maximum.reduceat(new_conn, starts), np.minimum.reduceat(new_conn, starts)))
+    new_sizes = sizes[cell_order]
+    new_offsets = np.cumsum(new_sizes)
+    gather = np.repeat(starts[cell_order] - (new_offsets - new_sizes), new_sizes) + np.arange(len(conn))
+
+    point_data = dict((name, np.asarray(array)[nodes]) for name, array in mesh.point_data.items())
+    cell_data = dict((name, np.asarray(array)[cell_order]) for name, array in mesh.cell_data.items())
+    if 'GlobalNodeID' not in point_data:
+        point_data['GlobalNodeID'] = (nodes + 1).astype(np.int32)
+    if 'GlobalElementID' not in cell_data:
+        cell_data['GlobalElementID'] = (cell_order + 1).astype(np.int32)
+    out = sv_vtkxml.MeshArrays(mesh.kind,
+            points=np.asarray(mesh.points)[nodes],
+            connectivity=new_conn[gather].astype(conn.dtype),
+            offsets=new_offsets.astype(offsets.dtype),
+            types=None if mesh.types is None else np.asarray(mesh.types)[cell_order],
+            point_data=point_data, cell_data=cell_data)
+    out.num_points = num_points
+    out.num_cells = len(offsets)
+    return out, nodes, cell_order
+
+def report(mesh, method='rcm'):
+    """
+    Reorder a mesh and print the bandwidth before and after
+
+    Returns:
+        (renumbered MeshArrays, node order, cell order)
+    """
+    before = bandwidth([group for _, group in cell_groups(mesh)])
+    out, nodes, cells = reorder(mesh, method)
+    after = bandwidth([group for _, group in cell_groups(out)])
+    print("%-7s bandwidth %d -> %d, mean index distance %.1f -> %.1f" % (method,
+        before['bandwidth'], after['bandwidth'], before['mean'], after['mean']))
+    return out, nodes, cells
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import time
+    fn = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cylinder.vtu')
+    mesh = sv_vtkxml.read(fn)
+    for method in METHODS:
+        start = time.time()
+        report(mesh, method)
+        print("        %.3f s" % (time.time() - start))
@@ -0,0 +1,145 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Face Segmentation
+"""
+Feature-angle face segmentation with a cached edge adjacency structure
+
+GetBoundaryFaces(angle) recomputes the face segmentation of a surface for
+every call. FaceSegmenter computes triangle normals and the angle across
+every shared edge once; a segmentation for any feature angle is then a
+connected-component query over the edges flatter than that angle.
+Segmenters are memoized per file content, so the ModelFaceID arrays can
+be reused by every mesh object loaded from the same file.
+
+Example:
+    seg = FaceSegmenter.from_file('demo.vtp')
+    face_ids = seg.segment(50.)     # ModelFaceID per triangle, from 1
+    face_ids = seg.segment(80.)     # no normals or adjacency recomputed
+"""
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+import sv_cache
+import sv_vtkxml
+
+_segmenters = {}
+
+class FaceSegmenter(object):
+    """
+    Edge adjacency and dihedral angles of a triangle surface
+
+    Args:
+        points: (npoints, 3) coordinates
+        triangles: (ntriangles, 3) point ids
+    """
+    def __init__(self, points, triangles):
+        points = np.asarray(points, dtype=np.float64)
+        tris = np.asarray(triangles, dtype=np.int64)
+        self.num_triangles = len(tris)
+        normals = np.cross(points[tris[:, 1]] - points[tris[:, 0]], points[tris[:, 2]] - points[tris[:, 0]])
+        length = np.linalg.norm(normals, axis=1)
+        self.normals = normals / np.where(length > 0, length, 1.)[:, None]
+
+        # every triangle edge as a sorted point pair, grouped by pair
+        edges = np.sort(np.concatenate([tris[:, [0, 1]], tris[:, [1, 2]], tris[:, [2, 0]]]), axis=1)
+        owner = np.tile(np.arange(len(tris)), 3)
+        order = np.lexsort((edges[:, 1], edges[:, 0]))
+        edges = edges[order]
+        owner = owner[order]
+        new = np.ones(len(edges), dtype=bool)
+        new[1:] = np.any(edges[1:] != edges[:-1], axis=1)
+        group = np.cumsum(new) - 1
+        count = np.bincount(group)
+        # only manifold edges connect faces; boundary and non-manifold
+        # edges always separate them
+        first = np.nonzero(new)[0]
+        manifold = count == 2
+        self.edge_triangles = np.stack([owner[first[manifold]], owner[first[manifold] + 1]], axis=1)
+        cos = np.einsum('ij,ij->i', self.normals[self.edge_triangles[:, 0]],
+                self.normals[self.edge_triangles[:, 1]])
+        self.edge_angles = np.degrees(np.arccos(np.clip(cos, -1., 1.)))
+        self._segmentations = {}
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        return cls(mesh.points, mesh.cell_array(3))
+
+    @classmethod
+    def from_file(cls, fn):
+        """
+        Segmenter of a .vtp file, shared by all callers reading the same content
+        """
+        key = sv_cache.file_digest(fn)
+        if key not in _segmenters:
+            _segmenters[key] = cls.from_mesh(sv_vtkxml.read(fn))
+        return _segmenters[key]
+
+    @classmethod
+    def from_repository(cls, name):
+        import sv_io
+        return cls.from_mesh(sv_io.export_arrays(name))
+
+    def segment(self, angle):
+        """
+        ModelFaceID of every triangle for a feature angle in degrees
+
+        Triangles are in the same face when they are connected through
+        edges whose normals differ by less than angle. Faces are numbered
+        from 1 in the order of their first triangle.
+        """
+        key = float(angle)
+        if key not in self._segmentations:
+            flat = self.edge_angles < key
+            pairs = self.edge_triangles[flat]
+            n = self.num_triangles
+            graph = sp.csr_matrix((np.ones(len(pairs)), (pairs[:, 0], pairs[:, 1])), shape=(n, n))
+            _, labels = connected_components(graph, directed=False)
+            # renumber by first occurrence so the ids are stable
+            _, first = np.unique(labels, return_index=True)
+            rank = np.empty(len(first), dtype=np.int32)
+            rank[np.argsort(first)] = np.arange(1, len(first) + 1, dtype=np.int32)
+            self._segmentations[key] = rank[labels]
+        return self._segmentations[key]
+
+    def num_faces(self, angle):
+        return int(self.segment(angle).max()) if self.num_triangles else 0
+
+def apply(name, dst_name, angle, segmenter=None):
+    """
+    Copy a Repository polydata with a ModelFaceID cell array for angle
+
+    The result can be given to a mesh object with SetVtkPolyData.
+    """
+    import sv_io
+    if segmenter is None:
+        segmenter = FaceSegmenter.from_repository(name)
+    return sv_io.set_array(name, dst_name, 'ModelFaceID', segmenter.segment(angle), 1)
@@ -0,0 +1,143 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Repository Sessions
+"""
+Scoped tracking of Repository objects
+
+clean_repos() deletes every object in the Repository before each
+scenario, including inputs that could have been reused. A Session only
+deletes the objects created while it is open, except the ones marked as
+shared, so scenarios can reuse a loaded model by reference:
+
+    with Session() as session:
+        msh = sv_mesh.mesh('cylinder', solid_fn, mesh_ops, fns, session=session)
+        msh = sv_mesh.sphere_refine('sph_refine', solid_fn, mesh_ops, sph_ops, fns, session=session)
+
+Here cylinder.vtp is read once and both mesh objects are created from
+the shared polydata.
+"""
+from sv import *
+
+def clean_repos():
+    """
+    Delete every object in the Repository
+    """
+    objs = Repository.List()
+    for name in objs:
+        try:
+            Repository.Delete(name)
+        except Exception as e: print(e)
+
+class Session(object):
+    """
+    Tracks the Repository objects created since the session started
+    """
+    def __init__(self):
+        self.shared = set()
+        self._existing = set(Repository.List())
+        self._models = {}
+
+    def created(self):
+        """
+        Names of the objects created in this session, shared ones excluded
+        """
+        return [name for name in Repository.List()
+                if name not in self._existing and name not in self.shared]
+
+    def share(self, name):
+        """
+        Keep an object alive across begin() calls until the session closes
+        """
+        if not Repository.Exists(name):
+            raise RuntimeError("Repository object " + name + " does not exist")
+        self.shared.add(name)
+        return name
+
+    def begin(self):
+        """
+        Start a new scenario: delete the non-shared objects of earlier scenarios
+        """
+        for name in self.created():
+            try:
+                Repository.Delete(name)
+            except Exception as e: print(e)
+
+    def load_model(self, fn):
+        """
+        Read a solid model once per session
+
+        Returns:
+            name of the shared polydata object of the model
+        """
+        if fn in self._models:
+            return self._models[fn]
+        index = len(self._models)
+        solid_name = 'session_model_%d' % index
+        poly_name = 'session_model_%d_poly' % index
+        solid = Solid.pySolidModel()
+        solid.ReadNative(solid_name, fn)
+        solid.GetPolyData(poly_name)
+        self.share(solid_name)
+        self.share(poly_name)
+        self._models[fn] = poly_name
+        return poly_name
+
+    def close(self):
+        """
+        Delete every object created in the session, shared ones included
+        """
+        self.shared = set()
+        self.begin()
+        self._models = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+        return False
+
+def begin(session=None):
+    """
+    Start a scenario; without a session the whole Repository is cleaned
+    """
+    if session is None:
+        clean_repos()
+    else:
+        session.begin()
+
+def load_model(msh, fn, session=None):
+    """
+    Load a solid model into a mesh object, reusing the session copy if any
+    """
+    if session is None:
+        return msh.LoadModel(fn)
+    return msh.SetVtkPolyData(session.load_model(fn))
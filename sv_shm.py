@@ -0,0 +1,281 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Shared Memory Meshes
+"""
+Shared-memory transport for polydata and unstructured grids
+
+publish() copies the arrays of a mesh once into a single
+multiprocessing.shared_memory block; any process can attach() to it by
+name and gets NumPy views of the arrays without copying or serializing
+them, instead of a Repository.WriteVtk*/LoadMesh round trip through disk.
+
+Block layout:
+
+    8 bytes   magic 'SVSHM1\\0\\0'
+    8 bytes   header length (little endian uint64)
+    header    JSON: {'kind', 'num_points', 'num_cells', 'arrays':
+              [[section, name, dtype, shape, offset], ...]}
+    arrays    each aligned to 64 bytes; section is 'mesh' for Points,
+              connectivity, offsets and types, 'point' or 'cell' for
+              named point/cell arrays
+
+Blocks are not unlinked when the publishing process exits, so a worker can
+publish a mesh and exit while the parent still reads it. Exactly one
+process, the owner, calls unlink() once every consumer is done; the
+others only close() it.
+
+Example:
+    # worker
+    shared = sv_shm.publish_repository('surface')
+    conn.send(shared.name)
+    # parent
+    with sv_shm.attach(name) as shared:
+        points = shared.mesh.points     # view into shared memory
+"""
+import sys
+import json
+import struct
+
+import numpy as np
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8
+    shared_memory = None
+
+import sv_vtkxml
+
+MAGIC = b'SVSHM1\0\0'
+ALIGN = 64
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def _require():
+    if shared_memory is None:
+        raise RuntimeError("Shared memory meshes require Python 3.8 or newer")
+
+class SharedMesh(object):
+    """
+    A mesh in a shared memory block
+
+    Attributes:
+        name: shared memory block name, pass it to attach()
+        mesh: sv_vtkxml.MeshArrays whose arrays are views into the block
+    """
+    def __init__(self, shm, header, owner):
+        self._shm = shm
+        self._closed = False
+        self.name = shm.name
+        self.header = header
+        self.owner = owner
+        self.mesh = self._views()
+
+    def _views(self):
+        # every array is a view of one byte array, so close() can tell
+        # from its reference count whether views are still alive
+        self._base = np.ndarray(self._shm.size, dtype=np.uint8, buffer=self._shm.buf)
+        arrays = {'mesh': {}, 'point': {}, 'cell': {}}
+        for section, name, dtype, shape, offset in self.header['arrays']:
+            dtype = np.dtype(dtype)
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            arrays[section][name] = self._base[offset:offset+nbytes].view(dtype).reshape(shape)
+        fields = arrays['mesh']
+        mesh = sv_vtkxml.MeshArrays(self.header['kind'], fields.get('Points'), fields.get('connectivity'),
+                fields.get('offsets'), fields.get('types'), arrays['point'], arrays['cell'])
+        mesh.num_points = self.header['num_points']
+        mesh.num_cells = self.header['num_cells']
+        return mesh
+
+    def copy(self):
+        """
+        MeshArrays with private copies of the arrays, valid after close()
+        """
+        m = self.mesh
+        mesh = sv_vtkxml.MeshArrays(m.kind, np.array(m.points), np.array(m.connectivity),
+                np.array(m.offsets), None if m.types is None else np.array(m.types),
+                dict((k, np.array(v)) for k, v in m.point_data.items()),
+                dict((k, np.array(v)) for k, v in m.cell_data.items()))
+        mesh.num_points = m.num_points
+        mesh.num_cells = m.num_cells
+        return mesh
+
+    def close(self):
+        """
+        Detach from the block; views of its arrays must no longer be referenced
+        """
+        if self._closed:
+            return
+        self.mesh = None
+        # one reference held here, one by getrefcount's argument
+        if sys.getrefcount(self._base) > 2:
+            self.mesh = self._views()
+            raise BufferError("Arrays of shared mesh %s are still referenced, "
+                    "delete them or use copy() before close()" % self.name)
+        self._base = None
+        self._shm.close()
+        self._closed = True
+
+    def unlink(self):
+        """
+        Free the block once all processes closed it; called by the owner
+        """
+        self.close()
+        if not getattr(self._shm, '_track', True):
+            self._shm.unlink()
+            return
+        # SharedMemory.unlink unregisters the block, see _block
+        from multiprocessing import resource_tracker
+        resource_tracker.register(self._shm._name, 'shared_memory')
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        if self.owner:
+            self.unlink()
+        else:
+            self.close()
+
+    def __repr__(self):
+        return "<SharedMesh %s: %s>" % (self.name, 'closed' if self._closed else self.mesh)
+
+def _block(name=None, create=False, size=0):
+    """
+    Open or create a block that no resource tracker unlinks behind our back
+
+    The block lives until its owner calls SharedMesh.unlink, whichever
+    process that is; a tracker would unlink it as soon as the process
+    that created or attached it exits.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, create=create, size=size, track=False)
+    except TypeError:
+        # Python < 3.13 registers every block with the resource tracker
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+def publish(mesh, name=None):
+    """
+    Copy a MeshArrays object into a new shared memory block
+
+    Args:
+        mesh: sv_vtkxml.MeshArrays, e.g. from sv_io.export_arrays or sv_vtkxml.read
+        name: block name, chosen by the system if None
+    Returns:
+        SharedMesh owned by the caller
+    """
+    _require()
+    entries = []
+    for section, arrays in (('mesh', mesh.arrays), ('point', mesh.point_data), ('cell', mesh.cell_data)):
+        for array_name in arrays:
+            entries.append((section, array_name, np.ascontiguousarray(arrays[array_name])))
+    num_points = len(mesh.points)
+    num_cells = len(mesh.offsets)
+    def header_for(start):
+        layout = []
+        offset = start
+        for section, array_name, array in entries:
+            layout.append([section, array_name, array.dtype.str, list(array.shape), offset])
+            offset = _aligned(offset + array.nbytes)
+        return {'kind': mesh.kind, 'num_points': num_points, 'num_cells': num_cells,
+                'arrays': layout}, offset
+    # the array offsets depend on the header length and vice versa; offsets
+    # only grow, so a few rounds settle
+    start = ALIGN
+    while True:
+        header, size = header_for(start)
+        text = json.dumps(header).encode()
+        needed = _aligned(len(MAGIC) + 8 + len(text))
+        if needed <= start:
+            break
+        start = needed
+    shm = _block(name, create=True, size=max(size, 1))
+    shm.buf[:len(MAGIC)] = MAGIC
+    shm.buf[len(MAGIC):len(MAGIC)+8] = struct.pack('<Q', len(text))
+    shm.buf[len(MAGIC)+8:len(MAGIC)+8+len(text)] = text
+    for (section, array_name, array), entry in zip(entries, header['arrays']):
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf, offset=entry[4])
+        view[...] = array
+        del view
+    return SharedMesh(shm, header, True)
+
+def attach(name):
+    """
+    Attach to a mesh published by any process
+
+    Returns:
+        SharedMesh whose arrays are views into the block
+    """
+    _require()
+    shm = _block(name)
+    if bytes(shm.buf[:len(MAGIC)]) != MAGIC:
+        shm.close()
+        raise ValueError("Shared memory block %s does not hold a mesh" % name)
+    length, = struct.unpack('<Q', bytes(shm.buf[len(MAGIC):len(MAGIC)+8]))
+    header = json.loads(bytes(shm.buf[len(MAGIC)+8:len(MAGIC)+8+length]).decode())
+    return SharedMesh(shm, header, False)
+
+def publish_repository(obj_name, name=None):
+    """
+    Publish a Repository polydata or unstructured grid
+    """
+    import sv_io
+    return publish(sv_io.export_arrays(obj_name), name)
+
+def to_repository(shared, dst_name):
+    """
+    Store a shared polydata in the Repository of this process
+    """
+    import sv_io
+    return sv_io.import_arrays(shared.mesh, dst_name)
+
+if __name__ == '__main__':
+    import os
+    import time
+    import sv_jobs
+    fn = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'demo.vtp')
+
+    def _publish(job):
+        shared = publish(sv_vtkxml.read(job['fn']))
+        shared.close()
+        return {'name': job['name'], 'scenario': 'publish', 'ok': True, 'wall_time': 0.,
+                'error': None, 'pid': os.getpid(), 'shm': shared.name}
+
+    result, = sv_jobs.run_jobs([{'name': 'demo', 'fn': fn}], target=_publish)
+    start = time.time()
+    shared = attach(result['shm'])
+    print("attached %s in %.2f ms" % (shared, (time.time() - start) * 1000.))
+    shared.close()
+    shared.unlink()
@@ -0,0 +1,258 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Sizing Fields
+"""
+Geometry-driven edge size field with a target element budget
+
+Instead of hand-tuned LocalEdgeSize lists per face, sizing_field computes
+one edge size per surface point from the local length scale of the
+geometry: the radius of curvature and, when known, the vessel radius
+(e.g. the distance to the centerlines, see sv_centerlines). The sizes are
+a single resolution factor times that length scale, limited by a grading
+rate between neighbouring points, and the factor is chosen so that the
+estimated number of tetrahedra stays within the budget.
+
+The result is written as the 'MeshSizingFunction' point array consumed by
+SetSizeFunctionBasedMesh, see sv_mesh2.budget_size_function.
+
+Example:
+    mesh = sv_vtkxml.read('demo.vtp')
+    sizes, estimate = sizing_field(mesh.points, mesh.cell_array(3), 500000)
+"""
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra
+
+SIZING_ARRAY = 'MeshSizingFunction'
+# tetrahedra per unit volume of a mesh of regular tetrahedra with edge size 1
+TETS_PER_VOLUME = 6. * np.sqrt(2.)
+
+def _edges(triangles):
+    tris = np.asarray(triangles, dtype=np.int64)
+    edges = np.concatenate([tris[:, [0, 1]], tris[:, [1, 2]], tris[:, [2, 0]]])
+    edges.sort(axis=1)
+    return np.unique(edges, axis=0)
+
+def _smooth(values, edges, iterations):
+    """
+    Average point values with their edge neighbours
+    """
+    n = len(values)
+    degree = np.bincount(edges.ravel(), minlength=n) + 1.
+    for i in range(iterations):
+        total = values.copy()
+        np.add.at(total, edges[:, 0], values[edges[:, 1]])
+        np.add.at(total, edges[:, 1], values[edges[:, 0]])
+        values = total / degree
+    return values
+
+def point_normals_areas(points, triangles):
+    """
+    Area weighted unit normals and one third of the adjacent triangle area per point
+    """
+    points = np.asarray(points, dtype=np.float64)
+    tris = np.asarray(triangles, dtype=np.int64)
+    cross = np.cross(points[tris[:, 1]] - points[tris[:, 0]], points[tris[:, 2]] - points[tris[:, 0]])
+    normals = np.zeros_like(points)
+    areas = np.zeros(len(points))
+    tri_areas = 0.5 * np.linalg.norm(cross, axis=1)
+    for k in range(3):
+        np.add.at(normals, tris[:, k], cross)
+        np.add.at(areas, tris[:, k], tri_areas / 3.)
+    length = np.linalg.norm(normals, axis=1)
+    normals /= np.where(length > 0, length, 1.)[:, None]
+    return normals, areas
+
+def curvature(points, triangles, smoothing=3, feature_angle=60.):
+    """
+    Largest normal curvature per point
+
+    Estimated for every edge shared by two triangles from the turn of the
+    triangle normals over the distance between the triangle centers,
+    |n_a - n_b| / |c_a - c_b|, taking the largest value over the edges of
+    a point and smoothing over `smoothing` rings of neighbours. Edges
+    across which the surface folds by more than feature_angle degrees are
+    sharp features (e.g. cap rims), not curvature, and are skipped.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    tris = np.asarray(triangles, dtype=np.int64)
+    p0, p1, p2 = points[tris[:, 0]], points[tris[:, 1]], points[tris[:, 2]]
+    normals = np.cross(p1 - p0, p2 - p0)
+    length = np.linalg.norm(normals, axis=1)
+    normals /= np.where(length > 0, length, 1.)[:, None]
+    centers = (p0 + p1 + p2) / 3.
+
+    edges = np.concatenate([tris[:, [0, 1]], tris[:, [1, 2]], tris[:, [2, 0]]])
+    edges.sort(axis=1)
+    owner = np.tile(np.arange(len(tris)), 3)
+    order = np.lexsort((edges[:, 1], edges[:, 0]))
+    edges, owner = edges[order], owner[order]
+    # consecutive entries of the same edge are the two triangles sharing it
+    shared = np.nonzero(np.all(edges[1:] == edges[:-1], axis=1))[0]
+    a, b = owner[shared], owner[shared + 1]
+    turn = np.linalg.norm(normals[a] - normals[b], axis=1)
+    distance = np.linalg.norm(centers[a] - centers[b], axis=1)
+    # |n_a - n_b| = 2 sin(angle / 2)
+    smooth = turn < 2. * np.sin(np.radians(feature_angle) / 2.)
+    k_edge = np.divide(turn, distance, out=np.zeros_like(turn), where=(distance > 0) & smooth)
+    k = np.zeros(len(points))
+    np.maximum.at(k, edges[shared, 0], k_edge)
+    np.maximum.at(k, edges[shared, 1], k_edge)
+    return _smooth(k, _edges(tris), smoothing)
+
+def length_scale(points, triangles, radius=None, smoothing=3, feature_angle=60.):
+    """
+    Local length scale: radius of curvature, limited by the vessel radius if given
+    """
+    points = np.asarray(points, dtype=np.float64)
+    diagonal = np.linalg.norm(points.max(axis=0) - points.min(axis=0))
+    k = curvature(points, triangles, smoothing, feature_angle)
+    scale = 1. / np.maximum(k, 2. / diagonal)
+    if radius is not None:
+        scale = np.minimum(scale, np.maximum(np.asarray(radius, dtype=np.float64), 1e-12 * diagonal))
+    return scale
+
+def volume_weights(points, triangles, scale):
+    """
+    Share of the enclosed volume assigned to every point
+
+    The volume of the closed surface (divergence theorem) is distributed
+    proportionally to point area times local length scale, the volume a
+    tube wall patch of that radius encloses.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    tris = np.asarray(triangles, dtype=np.int64)
+    p0, p1, p2 = points[tris[:, 0]], points[tris[:, 1]], points[tris[:, 2]]
+    volume = abs(np.einsum('ij,ij->i', p0, np.cross(p1, p2)).sum()) / 6.
+    _, areas = point_normals_areas(points, tris)
+    weights = areas * scale
+    return volume * weights / weights.sum()
+
+def estimate_elements(sizes, weights, calibration=1.):
+    """
+    Estimated number of tetrahedra for point sizes and volume weights
+
+    calibration scales the regular tetrahedron density to what the mesher
+    actually produces, see sv_estimate.
+    """
+    return calibration * TETS_PER_VOLUME * np.sum(weights / np.asarray(sizes, dtype=np.float64) ** 3)
+
+def edge_graph(points, triangles):
+    """
+    Sparse matrix of the surface edge lengths
+    """
+    points = np.asarray(points, dtype=np.float64)
+    edges = _edges(triangles)
+    length = np.linalg.norm(points[edges[:, 0]] - points[edges[:, 1]], axis=1)
+    return sp.csr_matrix((length, (edges[:, 0], edges[:, 1])), shape=(len(points), len(points)))
+
+def grade(sizes, graph, grading):
+    """
+    Limit the size growth along the surface: h_i <= h_j + grading * d(i, j)
+
+    Solved in one shortest path run from a virtual source connected to
+    every point j with weight h_j / grading.
+    """
+    sizes = np.asarray(sizes, dtype=np.float64)
+    n = len(sizes)
+    source = sp.csr_matrix((sizes / grading, (np.full(n, n), np.arange(n))), shape=(n + 1, n + 1))
+    edges = sp.bmat([[graph, None], [None, sp.csr_matrix((1, 1))]], format='csr')
+    distance = dijkstra(edges + source, directed=False, indices=n)
+    return np.minimum(sizes, grading * distance[:n])
+
+def sizing_field(points, triangles, max_elements, radius=None, min_size=None, max_size=None,
+        grading=0.3, smoothing=3, feature_angle=60., calibration=1., tol=0.01):
+    """
+    Point edge sizes giving the finest mesh within an element budget
+
+    Args:
+        points, triangles: closed triangle surface
+        max_elements: target upper bound on the number of tetrahedra
+        radius: optional point array of the vessel radius, e.g. DistanceToCenterlines
+        min_size, max_size: clamp the sizes; max_size defaults to a tenth
+            of the bounding box diagonal
+        grading: largest size increase per unit distance between neighbours
+        smoothing, feature_angle: see curvature
+        calibration: see estimate_elements
+        tol: relative tolerance on the resolution factor
+    Returns:
+        (sizes, estimated number of tetrahedra)
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if max_size is None:
+        max_size = 0.1 * np.linalg.norm(points.max(axis=0) - points.min(axis=0))
+    scale = length_scale(points, triangles, radius, smoothing, feature_angle)
+    weights = volume_weights(points, triangles, scale)
+    graph = edge_graph(points, triangles) if grading is not None else None
+
+    def field(factor):
+        sizes = np.clip(factor * scale, min_size, max_size)
+        if grading is not None:
+            sizes = grade(sizes, graph, grading)
+        if min_size is not None:
+            sizes = np.maximum(sizes, min_size)
+        return sizes
+
+    # sizes grow with the factor and the element count drops, bisect in log space
+    lo = 1e-6 * max_size / scale.max()
+    hi = max_size / scale.min()
+    sizes = field(hi)
+    if estimate_elements(sizes, weights, calibration) > max_elements:
+        # even the largest sizes do not fit the budget
+        return sizes, estimate_elements(sizes, weights, calibration)
+    while hi / lo > 1. + tol:
+        mid = np.sqrt(lo * hi)
+        if estimate_elements(field(mid), weights, calibration) > max_elements:
+            lo = mid
+        else:
+            hi = mid
+    sizes = field(hi)
+    return sizes, estimate_elements(sizes, weights, calibration)
+
+def apply(name, dst_name, max_elements, radius_array=None, **kwargs):
+    """
+    Copy a Repository polydata with a MeshSizingFunction point array
+
+    Args:
+        name: surface polydata object
+        dst_name: Repository name of the copy, to be given to SetVtkPolyData
+        max_elements: element budget, see sizing_field
+        radius_array: name of a point array on the surface holding the vessel radius
+        kwargs: passed to sizing_field
+    Returns:
+        (sizes, estimated number of tetrahedra)
+    """
+    import sv_io
+    mesh = sv_io.export_arrays(name)
+    radius = mesh.point_data[radius_array] if radius_array is not None else None
+    sizes, estimate = sizing_field(mesh.points, mesh.cell_array(3), max_elements, radius, **kwargs)
+    sv_io.set_array(name, dst_name, SIZING_ARRAY, sizes, 0)
+    return sizes, estimate
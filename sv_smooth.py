@@ -0,0 +1,172 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Surface Smoothing
+"""
+Sparse-matrix constrained local Laplacian smoothing
+
+NumPy/SciPy counterpart of Geom.Local_constrain_smooth with the same
+arguments. Each iteration minimizes
+
+    c * |x - x_prev|^2 + (1 - c) * |L x|^2
+
+over the free points, where L = I - D^-1 A is the umbrella Laplacian of the
+surface and c the constrain factor. The free points are those marked by
+the point and/or cell mask arrays, all other points stay fixed. L is built
+once as a CSR matrix and each iteration runs numcgsolves conjugate
+gradient steps on all three coordinates.
+
+Example:
+    points = smooth(mesh.points, mesh.cell_array(3), 5, 0.8, 30,
+                    point_mask=mesh.point_data['LocalOpsArray'],
+                    cell_mask=mesh.cell_data['LocalOpsArray'])
+"""
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import cg
+
+def laplacian(num_points, triangles):
+    """
+    Umbrella Laplacian I - D^-1 A of a triangle surface as a CSR matrix
+    """
+    tris = np.asarray(triangles, dtype=np.int64)
+    i = np.concatenate([tris[:, 0], tris[:, 1], tris[:, 2], tris[:, 1], tris[:, 2], tris[:, 0]])
+    j = np.concatenate([tris[:, 1], tris[:, 2], tris[:, 0], tris[:, 0], tris[:, 1], tris[:, 2]])
+    adj = sp.csr_matrix((np.ones(len(i)), (i, j)), shape=(num_points, num_points))
+    adj.data[:] = 1.
+    degree = np.asarray(adj.sum(axis=1)).ravel()
+    inv = np.divide(1., degree, out=np.zeros_like(degree), where=degree > 0)
+    return (sp.identity(num_points, format='csr') - sp.diags(inv) @ adj).tocsr()
+
+def free_points(num_points, triangles, point_mask=None, cell_mask=None):
+    """
+    Boolean mask of the points that may move
+    """
+    free = np.ones(num_points, dtype=bool)
+    if point_mask is not None:
+        free &= np.asarray(point_mask).ravel() > 0
+    if cell_mask is not None:
+        in_cells = np.zeros(num_points, dtype=bool)
+        in_cells[np.asarray(triangles)[np.asarray(cell_mask).ravel() > 0].ravel()] = True
+        free &= in_cells
+    return free
+
+def smooth(points, triangles, iterations, constrain_factor, num_cg_solves,
+        point_mask=None, cell_mask=None, lap=None):
+    """
+    Constrained Laplacian smoothing of the masked part of a surface
+
+    Args:
+        points: (npoints, 3) coordinates
+        triangles: (ntriangles, 3) point ids
+        iterations: number of smoothing iterations
+        constrain_factor: weight c in (0, 1] pulling points to their previous position
+        num_cg_solves: conjugate gradient iterations per smoothing iteration
+        point_mask, cell_mask: arrays > 0 for points/cells to smooth
+        lap: precomputed laplacian(), reused across calls on the same surface
+    Returns:
+        (npoints, 3) smoothed coordinates
+    """
+    x = np.array(points, dtype=np.float64)
+    if lap is None:
+        lap = laplacian(len(x), triangles)
+    free = free_points(len(x), triangles, point_mask, cell_mask)
+    if not np.any(free):
+        return x
+    fixed = ~free
+    c = float(constrain_factor)
+    # normal equations of the objective, split into free and fixed blocks
+    system = (c * sp.identity(len(x), format='csr') + (1. - c) * (lap.T @ lap)).tocsr()
+    a_ff = system[free][:, free]
+    a_fc = system[free][:, fixed]
+    rhs_fixed = a_fc @ x[fixed]
+    for _ in range(iterations):
+        rhs = c * x[free] - rhs_fixed
+        for k in range(3):
+            x[free, k], _ = cg(a_ff, rhs[:, k], x0=x[free, k], maxiter=num_cg_solves)
+    return x
+
+def local_constrain_smooth(name, dst_name, iterations, constrain_factor, num_cg_solves,
+        point_array=None, cell_array=None):
+    """
+    Drop-in replacement of Geom.Local_constrain_smooth on Repository polydata
+    """
+    import sv_io
+    mesh = sv_io.export_arrays(name)
+    tris = mesh.cell_array(3)
+    point_mask = mesh.point_data[point_array] if point_array else None
+    cell_mask = mesh.cell_data[cell_array] if cell_array else None
+    points = smooth(mesh.points, tris, iterations, constrain_factor, num_cg_solves, point_mask, cell_mask)
+    return sv_io.update_polydata(name, dst_name, points=points.astype(mesh.points.dtype))
+
+def benchmark(name, iterations=5, constrain_factor=0.8, num_cg_solves=30,
+        point_array='LocalOpsArray', cell_array='LocalOpsArray'):
+    """
+    Time Geom.Local_constrain_smooth against local_constrain_smooth on one surface
+    """
+    from sv import Geom
+    import sv_io
+    start = time.time()
+    Geom.Local_constrain_smooth(name, name + '_sv', iterations, constrain_factor, num_cg_solves,
+            point_array, cell_array)
+    sv_time = time.time() - start
+    start = time.time()
+    local_constrain_smooth(name, name + '_np', iterations, constrain_factor, num_cg_solves,
+            point_array, cell_array)
+    np_time = time.time() - start
+    original = sv_io.export_arrays(name).points
+    moved_sv = np.linalg.norm(sv_io.export_arrays(name + '_sv').points - original, axis=1)
+    moved_np = np.linalg.norm(sv_io.export_arrays(name + '_np').points - original, axis=1)
+    print("%-24s %10s %14s" % ('method', 'seconds', 'max movement'))
+    print("%-24s %10.3f %14.4g" % ('Geom.Local_constrain_smooth', sv_time, moved_sv.max()))
+    print("%-24s %10.3f %14.4g" % ('sv_smooth', np_time, moved_np.max()))
+    return sv_time, np_time
+
+if __name__ == '__main__':
+    from sv import *
+    from sv_session import clean_repos
+    clean_repos()
+    # surface of sv_geom.geom_local_constrain_smooth
+    Solid.SetKernel('PolyData')
+    cyl_1 = Solid.pySolidModel()
+    cyl_1.Cylinder('cyl',1.,10.,[0,0,0],[0,0,1])
+    cyl_2 = Solid.pySolidModel()
+    cyl_2.Cylinder('cyl2', 0.6, 10., [0,5,0], [0,1,0])
+    union = Solid.pySolidModel()
+    union.Union('u', 'cyl', 'cyl2', 'All')
+    union.GetBoundaryFaces(90)
+    union.GetPolyData('poly1', 2)
+    MeshUtil.Remesh('poly1', 'poly2', 0.3, 0.4)
+    MeshUtil.Remesh('poly2', 'poly3', 0.3, 0.4)
+    Geom.Set_array_for_local_op_sphere('poly3', 'smth', 3, [0,0,0],'LocalOpsArray', 0)
+    Geom.Set_array_for_local_op_sphere('smth', 'smth2', 3, [0,0,0],'LocalOpsArray', 1)
+    benchmark('smth2')
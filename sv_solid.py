@@ -33,13 +33,8 @@
 
 import os
 from sv import *
-
-def clean_repos():
-    objs = Repository.List()
-    for name in objs:
-        try:
-            Repository.Delete(name)
-        except Exception as e: print(e)
+import sv_io
+from sv_session import clean_repos
 
 def test_kernel(kernel_name):
     if kernel_name == 'PolyData':
@@ -57,7 +52,7 @@ def cylinder(ctr=[1., 1., 1.], axisL=[0.,0.,1.], radius=1., length=1., fn=None):
     cyl.Cylinder('cyl',radius,length,ctr,axisL)
     poly=cyl.GetPolyData('cyl_poly',1.)
     if fn is not None:
-        Repository.WriteVtkPolyData('cyl_poly','ascii',fn)
+        sv_io.write_polydata('cyl_poly', fn)
     return cyl
 
 def sphere(ctr=[0.,0.,0.], radius=1., fn=None):
@@ -65,7 +60,7 @@ def sphere(ctr=[0.,0.,0.], radius=1., fn=None):
     sph.Sphere('sph', radius, ctr)
     sph.GetPolyData('sph_poly', 1.)
     if fn is not None:
-        Repository.WriteVtkPolyData('sph_poly', 'ascii', fn)
+        sv_io.write_polydata('sph_poly', fn)
     return sph
 
 def ellipsoid(ctr=[1.,1.,1.], axis=[2.,1.,1.], fn=None):
@@ -73,7 +68,7 @@ def ellipsoid(ctr=[1.,1.,1.], axis=[2.,1.,1.], fn=None):
     ellpsd.Ellipsoid('ellpsd',axis,ctr)
     ellpsd.GetPolyData('ellpsd_poly',1.)
     if fn is not None:
-        Repository.WriteVtkPolyData('ellpsd_poly','ascii',fn)
+        sv_io.write_polydata('ellpsd_poly', fn)
     return ellpsd
 
 def box(ctr=[1.,1.,1.], axis=[2.,1.,1.], fn=None):
@@ -81,7 +76,7 @@ def box(ctr=[1.,1.,1.], axis=[2.,1.,1.], fn=None):
     box.Box3d('box',axis,ctr)
     box.GetPolyData('box_poly',1.)
     if fn is not None:
-        Repository.WriteVtkPolyData('box_poly','ascii',fn)
+        sv_io.write_polydata('box_poly', fn)
     return box
 def io_ops(fn):
     #reading a solid from file and write it out
@@ -102,12 +97,16 @@ def copy(fn, fn_copy):
     solid.WriteNative(fn)
     copy.WriteNative(fn_copy)
 
-def remesh(fn):
+def remesh(fn, remesher=None):
     clean_repos()
     assert Solid.GetKernel() == "PolyData", "Only works for PolyData"
     solid = cylinder()
     solid.GetBoundaryFaces(80)
-    solid.RemeshFace([1], 0.2)
+    if remesher is None:
+        solid.RemeshFace([1], 0.2)
+    else:
+        #only remesh faces changed since the last run, see sv_remesh
+        solid = remesher.remesh(solid, {1: 0.2}, 'remesh_cyl')
     solid.WriteNative(fn)
 
 def face_ops_polydata():
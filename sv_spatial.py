@@ -0,0 +1,271 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Spatial Queries
+"""
+Uniform grid index over the points and triangle centroids of a surface
+
+The index is built once per surface and answers sphere, cylinder and box
+region queries and nearest-face queries by visiting only the grid cells
+overlapping the query. local_ops_array() turns many regions at once into
+the 0/1 point or cell mask that Geom.Set_array_for_local_op_sphere writes
+as 'LocalOpsArray'.
+
+Example:
+    index = SurfaceIndex.from_file('demo.vtp')
+    mask = index.local_ops_array([
+            {'type': 'sphere', 'center': [0, 0, 0], 'radius': 3.},
+            {'type': 'cylinder', 'center': [0, 0, 0], 'radius': 1., 'length': 10., 'axis': [0, 0, 1]},
+            ], data=1)
+"""
+import numpy as np
+
+import sv_vtkxml
+
+class _Grid(object):
+    """
+    Points bucketed into a regular grid, sorted by bucket
+    """
+    def __init__(self, points, per_cell=4.):
+        self.points = np.asarray(points, dtype=np.float64)
+        n = max(len(self.points), 1)
+        lo = self.points.min(axis=0) if len(self.points) else np.zeros(3)
+        hi = self.points.max(axis=0) if len(self.points) else np.ones(3)
+        extent = np.maximum(hi - lo, 1e-12)
+        self.size = float(np.cbrt(np.prod(extent) * per_cell / n))
+        self.size = max(self.size, extent.max() / 1024.)
+        self.lo = lo
+        self.dims = np.maximum(np.ceil(extent / self.size).astype(np.int64), 1)
+        keys = self._keys(self._cells(self.points))
+        self.order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[self.order]
+        all_keys = np.arange(np.prod(self.dims) + 1)
+        self.starts = np.searchsorted(sorted_keys, all_keys)
+
+    def _cells(self, points):
+        ijk = np.floor((points - self.lo) / self.size).astype(np.int64)
+        return np.clip(ijk, 0, self.dims - 1)
+
+    def _keys(self, ijk):
+        return ijk[..., 0] + self.dims[0] * (ijk[..., 1] + self.dims[1] * ijk[..., 2])
+
+    def candidates(self, lo, hi):
+        """
+        Ids of the points in the grid cells overlapping the box [lo, hi]
+        """
+        lo = np.asarray(lo, dtype=np.float64)
+        hi = np.asarray(hi, dtype=np.float64)
+        if np.any(hi < self.lo) or np.any(lo > self.lo + self.dims * self.size):
+            return np.empty(0, dtype=np.int64)
+        c0 = self._cells(lo[None])[0]
+        c1 = self._cells(hi[None])[0]
+        ranges = [np.arange(c0[i], c1[i] + 1) for i in range(3)]
+        ijk = np.stack(np.meshgrid(*ranges, indexing='ij'), axis=-1).reshape(-1, 3)
+        keys = self._keys(ijk)
+        starts = self.starts[keys]
+        counts = self.starts[keys + 1] - starts
+        total = counts.sum()
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # concatenated ranges [start, start + count) without a Python loop
+        index = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        return self.order[index]
+
+class SurfaceIndex(object):
+    """
+    Spatial index over the points and triangles of a surface
+
+    Args:
+        points: (npoints, 3) coordinates
+        triangles: (ntriangles, 3) point ids
+    """
+    def __init__(self, points, triangles):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.triangles = np.asarray(triangles, dtype=np.int64)
+        corners = self.points[self.triangles]
+        self.centroids = corners.mean(axis=1)
+        # largest centroid to corner distance bounds the triangle extent
+        self.max_radius = float(np.sqrt(((corners - self.centroids[:, None]) ** 2).sum(axis=2)).max()) \
+                if len(self.triangles) else 0.
+        self._grids = {0: _Grid(self.points), 1: _Grid(self.centroids)}
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        return cls(mesh.points, mesh.cell_array(3))
+
+    @classmethod
+    def from_file(cls, fn):
+        return cls.from_mesh(sv_vtkxml.read(fn))
+
+    @classmethod
+    def from_repository(cls, name):
+        import sv_io
+        return cls.from_mesh(sv_io.export_arrays(name))
+
+    def _coords(self, data):
+        return self.points if data == 0 else self.centroids
+
+    def sphere(self, center, radius, data=0):
+        """
+        Ids of the points (data=0) or triangles (data=1, by centroid) inside a sphere
+        """
+        center = np.asarray(center, dtype=np.float64)
+        ids = self._grids[data].candidates(center - radius, center + radius)
+        d = self._coords(data)[ids] - center
+        return np.sort(ids[np.einsum('ij,ij->i', d, d) <= radius * radius])
+
+    def cylinder(self, center, radius, length, axis, data=0):
+        """
+        Ids inside a cylinder of given center, radius, length and axis
+        direction, the arguments of SetCylinderRefinement
+        """
+        center = np.asarray(center, dtype=np.float64)
+        axis = np.asarray(axis, dtype=np.float64)
+        axis = axis / np.linalg.norm(axis)
+        half = 0.5 * length
+        reach = np.abs(axis) * half + radius * np.sqrt(np.maximum(1. - axis * axis, 0.))
+        ids = self._grids[data].candidates(center - reach, center + reach)
+        d = self._coords(data)[ids] - center
+        t = d.dot(axis)
+        perp = d - t[:, None] * axis
+        inside = (np.abs(t) <= half) & (np.einsum('ij,ij->i', perp, perp) <= radius * radius)
+        return np.sort(ids[inside])
+
+    def box(self, lo, hi, data=0):
+        """
+        Ids inside an axis aligned box
+        """
+        lo = np.asarray(lo, dtype=np.float64)
+        hi = np.asarray(hi, dtype=np.float64)
+        ids = self._grids[data].candidates(lo, hi)
+        p = self._coords(data)[ids]
+        return np.sort(ids[np.all((p >= lo) & (p <= hi), axis=1)])
+
+    def query(self, region, data=0):
+        """
+        Ids inside a region dict: {'type': 'sphere', 'center', 'radius'},
+        {'type': 'cylinder', 'center', 'radius', 'length', 'axis'} or
+        {'type': 'box', 'min', 'max'}
+        """
+        kind = region['type']
+        if kind == 'sphere':
+            return self.sphere(region['center'], region['radius'], data)
+        if kind == 'cylinder':
+            return self.cylinder(region['center'], region['radius'], region['length'],
+                    region['axis'], data)
+        if kind == 'box':
+            return self.box(region['min'], region['max'], data)
+        raise ValueError("Unknown region type: " + str(kind))
+
+    def masks(self, regions, data=0):
+        """
+        (nregions, n) boolean masks of points or triangles inside each region
+        """
+        n = len(self._coords(data))
+        out = np.zeros((len(regions), n), dtype=bool)
+        for i, region in enumerate(regions):
+            out[i, self.query(region, data)] = True
+        return out
+
+    def local_ops_array(self, regions, data=0):
+        """
+        Int32 array with 1 for points/triangles inside any region, 0 elsewhere
+        """
+        return self.masks(regions, data).any(axis=0).astype(np.int32)
+
+    def nearest_face(self, points):
+        """
+        Closest triangle to each query point
+
+        Returns:
+            (triangle ids, distances)
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        grid = self._grids[1]
+        ids = np.empty(len(points), dtype=np.int64)
+        dists = np.empty(len(points))
+        for i, p in enumerate(points):
+            # grow the search box until it holds a centroid; any triangle
+            # closer than that one has its centroid within max_radius more
+            reach = grid.size
+            while True:
+                cand = grid.candidates(p - reach, p + reach)
+                if len(cand) or reach > 2. * grid.size * grid.dims.max():
+                    break
+                reach *= 2.
+            d = np.sqrt(((self.centroids[cand] - p) ** 2).sum(axis=1))
+            bound = d.min() + self.max_radius
+            cand = grid.candidates(p - bound, p + bound)
+            dist = _point_triangle_distance(p, self.points[self.triangles[cand]])
+            j = np.argmin(dist)
+            ids[i] = cand[j]
+            dists[i] = dist[j]
+        return ids, dists
+
+def _point_triangle_distance(p, tris):
+    """
+    Distance from p to each triangle of a (n, 3, 3) array
+    """
+    a, b, c = tris[:, 0], tris[:, 1], tris[:, 2]
+    ab = b - a
+    ac = c - a
+    ap = p - a
+    # barycentric projection clamped to the triangle (Ericson, Real-Time Collision Detection)
+    d1 = np.einsum('ij,ij->i', ab, ap)
+    d2 = np.einsum('ij,ij->i', ac, ap)
+    bp = p - b
+    d3 = np.einsum('ij,ij->i', ab, bp)
+    d4 = np.einsum('ij,ij->i', ac, bp)
+    cp = p - c
+    d5 = np.einsum('ij,ij->i', ab, cp)
+    d6 = np.einsum('ij,ij->i', ac, cp)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = va + vb + vc
+        v = vb / denom
+        w = vc / denom
+        closest = a + v[:, None] * ab + w[:, None] * ac
+        # edge regions
+        t_ab = np.clip(d1 / (d1 - d3), 0., 1.)
+        t_ac = np.clip(d2 / (d2 - d6), 0., 1.)
+        t_bc = np.clip((d4 - d3) / ((d4 - d3) + (d5 - d6)), 0., 1.)
+    on_ab = (vc <= 0) & (d1 >= 0) & (d3 <= 0)
+    on_ac = (vb <= 0) & (d2 >= 0) & (d6 <= 0)
+    on_bc = (va <= 0) & ((d4 - d3) >= 0) & ((d5 - d6) >= 0)
+    closest = np.where(on_ab[:, None], a + t_ab[:, None] * ab, closest)
+    closest = np.where(on_ac[:, None], a + t_ac[:, None] * ac, closest)
+    closest = np.where(on_bc[:, None], b + t_bc[:, None] * (c - b), closest)
+    # vertex regions
+    closest = np.where(((d1 <= 0) & (d2 <= 0))[:, None], a, closest)
+    closest = np.where(((d3 >= 0) & (d4 <= d3))[:, None], b, closest)
+    closest = np.where(((d6 >= 0) & (d5 <= d6))[:, None], c, closest)
+    return np.sqrt(((closest - p) ** 2).sum(axis=1))
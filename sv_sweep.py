@@ -0,0 +1,203 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API Mesh Sweeps
+"""
+Batched parameter sweeps over sv_mesh2.local_size_function settings
+
+The model is loaded and its boundary faces are extracted once in the
+parent process; every variant of the sweep then runs NewMesh/GenerateMesh
+in a forked worker that inherits the loaded mesh object. The result is a
+table of element counts, runtimes and mesh quality per variant.
+
+Example:
+    variants = make_grid([5., 2.], [[1, 0.15, 2, 0.3, 3, 0.6, 4, 0.6],
+                                    [1, 0.3, 2, 0.6, 3, 1.2, 4, 1.2]])
+    rows = sweep('sweep', 'demo.vtp', variants, out_dir)
+    print_table(rows)
+"""
+import os
+import csv
+import time
+import itertools
+import traceback
+from sv import *
+
+import sv_io
+import sv_jobs
+import sv_mesh2
+import sv_quality
+import sv_session
+
+TABLE_COLUMNS = ('name', 'ok', 'global_edge_size', 'local_edge_size', 'boundary_layer',
+        'num_points', 'num_elements', 'num_surface_elements', 'mesh_time', 'wall_time',
+        'min_dihedral', 'max_radius_edge', 'error')
+
+def make_grid(global_sizes, local_sizes, bl_ops_list=(None,)):
+    """
+    Cartesian product of global sizes, LocalEdgeSize lists and boundary
+    layer settings (None for no boundary layer)
+    """
+    variants = []
+    for i, (gs, ls, bl) in enumerate(itertools.product(global_sizes, local_sizes, bl_ops_list)):
+        variants.append({
+                'name': 'variant_%03d' % i,
+                'global_edge_size': gs,
+                'local_edge_size': list(ls),
+                'bl_ops': bl,
+        })
+    return variants
+
+# mesh object loaded by sweep() before the workers are forked
+_state = {}
+
+def _run_variant(variant):
+    result = {
+            'name': variant['name'],
+            'scenario': 'local_size_function',
+            'ok': False,
+            'error': None,
+            'global_edge_size': variant['global_edge_size'],
+            'local_edge_size': variant['local_edge_size'],
+            'boundary_layer': variant['bl_ops'] is not None,
+    }
+    start = time.time()
+    try:
+        msh = _state['msh']
+        sv_mesh2.set_local_size_options(msh, variant['global_edge_size'],
+                variant['local_edge_size'], variant['bl_ops'])
+        msh.GenerateMesh()
+        result['mesh_time'] = time.time() - start
+
+        poly_fn, ug_fn = variant['fns_out']
+        msh.GetPolyData(poly_fn)
+        msh.GetUnstructuredGrid(ug_fn)
+        sv_io.write_polydata(poly_fn, poly_fn)
+        sv_io.write_ugrid(ug_fn, ug_fn)
+        surface = sv_io.export_arrays(poly_fn)
+        volume = sv_io.export_arrays(ug_fn)
+        result['num_points'] = volume.num_points
+        result['num_elements'] = volume.num_cells
+        result['num_surface_elements'] = surface.num_cells
+        report = sv_quality.summarize(sv_quality.mesh_quality(volume))
+        result['min_dihedral'] = report['metrics']['min_dihedral'].get('min')
+        result['max_radius_edge'] = report['metrics']['radius_edge'].get('max')
+        result['ok'] = True
+    except Exception:
+        result['error'] = traceback.format_exc()
+    result['wall_time'] = time.time() - start
+    return result
+
+def sweep(name, fn, variants, out_dir, processes=None, angle=50., timeout=None):
+    """
+    Mesh every variant of a sweep
+
+    Args:
+        name: mesh object name
+        fn: solid model file, e.g. demo.vtp
+        variants: list of dicts from make_grid
+        out_dir: directory for the surface/volume outputs of each variant
+        processes: number of concurrent workers, all cores if None
+        angle: feature angle passed to GetBoundaryFaces
+        timeout: seconds before a variant is killed
+    Returns:
+        list of table rows, one per variant
+    """
+    try:
+        os.makedirs(out_dir)
+    except OSError:
+        if not os.path.isdir(out_dir):
+            raise
+    MeshObject.SetKernel('TetGen')
+    sv_session.clean_repos()
+    msh = sv_mesh2.new_object(name, solidName=fn)
+    msh.GetBoundaryFaces(angle)
+    print(msh.GetModelFaceInfo())
+    _state['msh'] = msh
+
+    jobs = []
+    for variant in variants:
+        job = dict(variant)
+        job['fns_out'] = (os.path.join(out_dir, variant['name'] + '_surface.vtp'),
+                os.path.join(out_dir, variant['name'] + '_vol.vtu'))
+        jobs.append(job)
+    try:
+        rows = sv_jobs.run_jobs(jobs, processes=processes, timeout=timeout, target=_run_variant)
+    finally:
+        _state.clear()
+    for variant, row in zip(jobs, rows):
+        for column in TABLE_COLUMNS:
+            row.setdefault(column, None)
+        row['global_edge_size'] = variant['global_edge_size']
+        row['local_edge_size'] = variant['local_edge_size']
+        row['boundary_layer'] = variant['bl_ops'] is not None
+    return rows
+
+def print_table(rows):
+    """
+    Print the sweep results; mesh s is the GenerateMesh time, wall s the
+    whole variant including writing and quality metrics
+    """
+    print("%-12s %-4s %8s %-36s %3s %10s %10s %8s %8s %8s %8s" % ('name', 'ok', 'global', 'local',
+        'bl', 'elements', 'surface', 'mesh s', 'wall s', 'min_dih', 'max_re'))
+    for row in rows:
+        fmt = lambda v, f: f % v if v is not None else '-'
+        print("%-12s %-4s %8g %-36s %3s %10s %10s %8s %8s %8s %8s" % (row['name'],
+            'ok' if row['ok'] else 'FAIL', row['global_edge_size'], row['local_edge_size'],
+            'y' if row['boundary_layer'] else 'n', fmt(row['num_elements'], '%d'),
+            fmt(row['num_surface_elements'], '%d'), fmt(row['mesh_time'], '%.1f'),
+            fmt(row['wall_time'], '%.1f'),
+            fmt(row['min_dihedral'], '%.2f'), fmt(row['max_radius_edge'], '%.2f')))
+        if row['error']:
+            print("    " + row['error'].strip().replace('\n', '\n    '))
+
+def write_table(rows, fn):
+    """
+    Write sweep results as CSV
+    """
+    with open(fn, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(TABLE_COLUMNS)
+        for row in rows:
+            writer.writerow([row.get(column) for column in TABLE_COLUMNS])
+
+if __name__ == '__main__':
+    solid_fn = os.path.join(os.path.dirname(__file__), 'demo.vtp')
+    out_dir = os.path.join(os.path.dirname(__file__), 'test', 'sweep')
+    try:
+        os.makedirs(out_dir)
+    except Exception as e: print(e)
+
+    variants = make_grid([5., 1.],
+            [[1, 0.15, 2, 0.3, 3, 0.6, 4, 0.6], [1, 0.3, 2, 0.6, 3, 1.2, 4, 1.2]],
+            [None, {'wall':[1], 'type':0, 'id':0, 'side':0, 'num_lyr': 3, 'H':[0.3,0.6, 0.8]}])
+    rows = sweep('sweep', solid_fn, variants, out_dir)
+    print_table(rows)
+    write_table(rows, os.path.join(out_dir, 'sweep.csv'))
@@ -0,0 +1,599 @@
+# Copyright (c) Stanford University, The Regents of the University of
+#               California, and others.
+#
+# All Rights Reserved.
+#
+# See Copyright-SimVascular.txt for additional details.
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the
+# "Software"), to deal in the Software without restriction, including
+# without limitation the rights to use, copy, modify, merge, publish,
+# distribute, sublicense, and/or sell copies of the Software, and to
+# permit persons to whom the Software is furnished to do so, subject
+# to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+# IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+# TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+# PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+# OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+# PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+# PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+# LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+# NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+# SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+# SV Python API VTK XML Reader
+"""
+Lightweight NumPy reader for VTK XML polydata (.vtp) and unstructured
+grid (.vtu) files, no SimVascular or VTK runtime required
+
+Supports the appended layout written by SimVascular/VTK (raw or base64
+encoded, optionally vtkZLibDataCompressor compressed) as well as inline
+binary and ascii arrays. The file is memory mapped and arrays are decoded
+on first access only; uncompressed raw appended arrays are returned as
+zero-copy views into the mapping.
+
+write_ugrid/write_polydata stream arrays back out in the same appended
+zlib layout, compressing one bounded-size block at a time.
+
+Example:
+    mesh = sv_vtkxml.read('demo.vtp')
+    mesh.points                   # (NumberOfPoints, 3)
+    mesh.cell_data['ModelFaceID'] # decoded now, cached afterwards
+"""
+import re
+import mmap
+import zlib
+import binascii
+import xml.etree.ElementTree as ET
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+VTK_TYPES = {
+        'Int8': 'i1', 'UInt8': 'u1',
+        'Int16': 'i2', 'UInt16': 'u2',
+        'Int32': 'i4', 'UInt32': 'u4',
+        'Int64': 'i8', 'UInt64': 'u8',
+        'Float32': 'f4', 'Float64': 'f8',
+}
+
+# VTK cell type ids used by the meshing scripts
+VTK_VERTEX = 1
+VTK_LINE = 3
+VTK_TRIANGLE = 5
+VTK_POLYGON = 7
+VTK_QUAD = 9
+VTK_TETRA = 10
+VTK_WEDGE = 13
+
+POLYDATA_SECTIONS = ('Verts', 'Lines', 'Strips', 'Polys')
+
+class LazyArrays(MutableMapping):
+    """
+    Ordered name -> array mapping whose entries are produced by loader
+    callables on first access
+    """
+    def __init__(self, arrays=None):
+        self._loaders = OrderedDict()
+        self._arrays = {}
+        if arrays is not None:
+            for name in arrays:
+                self[name] = arrays[name]
+
+    def add_loader(self, name, loader):
+        self._loaders[name] = loader
+        self._arrays.pop(name, None)
+
+    def is_loaded(self, name):
+        return name in self._arrays
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = self._loaders[name]()
+        return self._arrays[name]
+
+    def __setitem__(self, name, array):
+        self._loaders[name] = None
+        self._arrays[name] = array
+
+    def __delitem__(self, name):
+        del self._loaders[name]
+        self._arrays.pop(name, None)
+
+    def __iter__(self):
+        return iter(self._loaders)
+
+    def __len__(self):
+        return len(self._loaders)
+
+    def __repr__(self):
+        return 'LazyArrays(%s)' % ', '.join(self._loaders)
+
+class MeshArrays(object):
+    """
+    Points, cells and named arrays of a polydata or unstructured grid
+
+    `connectivity` and `offsets` follow the VTK XML convention: offsets
+    holds the end position of every cell in connectivity. For polydata they
+    are the Polys section; the other sections are available in `cells`.
+    `types` holds VTK cell type ids, it is None for polydata.
+    """
+    def __init__(self, kind, points=None, connectivity=None, offsets=None, types=None,
+            point_data=None, cell_data=None):
+        self.kind = kind
+        self.arrays = LazyArrays()
+        self.cells = OrderedDict()
+        self.point_data = point_data if isinstance(point_data, LazyArrays) else LazyArrays(point_data)
+        self.cell_data = cell_data if isinstance(cell_data, LazyArrays) else LazyArrays(cell_data)
+        for name, array in (('Points', points), ('connectivity', connectivity),
+                ('offsets', offsets), ('types', types)):
+            if array is not None:
+                self.arrays[name] = array
+        self.num_points = None
+        self.num_cells = None
+
+    @property
+    def points(self):
+        return self.arrays['Points']
+
+    @property
+    def connectivity(self):
+        return self.arrays['connectivity']
+
+    @property
+    def offsets(self):
+        return self.arrays['offsets']
+
+    @property
+    def types(self):
+        return self.arrays.get('types')
+
+    def __getitem__(self, name):
+        """
+        Named point or cell array, or one of Points/connectivity/offsets/types
+        """
+        for arrays in (self.point_data, self.cell_data, self.arrays):
+            if name in arrays:
+                return arrays[name]
+        raise KeyError(name)
+
+    def cell_array(self, npts=None):
+        """
+        Connectivity as an (ncells, npts) array; all cells must have npts points
+        """
+        conn = self.connectivity
+        offsets = self.offsets
+        ncells = len(offsets)
+        if ncells == 0:
+            return conn.reshape(0, npts or 0)
+        if npts is None:
+            npts = int(offsets[0])
+        if len(conn) != ncells * npts or np.any(np.diff(offsets) != npts):
+            raise ValueError("Cells do not all have %d points" % npts)
+        return conn.reshape(ncells, npts)
+
+    def __repr__(self):
+        return '<MeshArrays %s: %s points, %s cells, point data %s, cell data %s>' % (
+                self.kind, self.num_points, self.num_cells,
+                list(self.point_data), list(self.cell_data))
+
+class _AppendedData(object):
+    """
+    Decoder for DataArray elements of one file
+    """
+    def __init__(self, buf, start, encoding, header_type, byte_order, compressed):
+        self.buf = buf
+        self.start = start
+        self.encoding = encoding
+        self.header = np.dtype(VTK_TYPES[header_type]).newbyteorder(byte_order)
+        self.byte_order = byte_order
+        self.compressed = compressed
+
+    def _b64(self, begin, nchars):
+        return binascii.a2b_base64(bytes(self.buf[begin:begin+nchars]))
+
+    def _b64_length(self, nbytes):
+        return (nbytes + 2) // 3 * 4
+
+    def decode(self, offset, dtype, count):
+        """
+        Decode `count` values of an appended array starting at `offset`
+        """
+        dtype = np.dtype(dtype).newbyteorder(self.byte_order)
+        hsize = self.header.itemsize
+        pos = self.start + offset
+        if self.encoding == 'raw':
+            if not self.compressed:
+                nbytes = int(np.frombuffer(self.buf, self.header, 1, pos)[0])
+                return np.frombuffer(self.buf, dtype, nbytes // dtype.itemsize, pos + hsize)
+            head = np.frombuffer(self.buf, self.header, 3, pos)
+            nblocks = int(head[0])
+            sizes = np.frombuffer(self.buf, self.header, nblocks, pos + 3*hsize)
+            data_pos = pos + (3 + nblocks) * hsize
+            blocks = []
+            for size in sizes:
+                size = int(size)
+                blocks.append(zlib.decompress(self.buf[data_pos:data_pos+size]))
+                data_pos += size
+            return self._join(blocks, dtype, count)
+
+        if not self.compressed:
+            # header and data may be encoded as one stream or separately
+            nchars = self._b64_length(hsize)
+            head = bytes(self.buf[pos:pos+nchars])
+            if head.endswith(b'='):
+                nbytes = int(np.frombuffer(binascii.a2b_base64(head), self.header, 1)[0])
+                data = self._b64(pos + nchars, self._b64_length(nbytes))
+            else:
+                nbytes = int(np.frombuffer(self._b64(pos, 8), self.header, 1)[0])
+                data = self._b64(pos, self._b64_length(hsize + nbytes))[hsize:hsize+nbytes]
+            return np.frombuffer(data, dtype, nbytes // dtype.itemsize)
+        head = self._b64(pos, self._b64_length(3*hsize))
+        nblocks = int(np.frombuffer(head, self.header, 1)[0])
+        nchars = self._b64_length((3 + nblocks) * hsize)
+        head = np.frombuffer(self._b64(pos, nchars), self.header, 3 + nblocks)
+        sizes = head[3:]
+        data = self._b64(pos + nchars, self._b64_length(int(sizes.sum())))
+        blocks = []
+        data_pos = 0
+        for size in sizes:
+            size = int(size)
+            blocks.append(zlib.decompress(data[data_pos:data_pos+size]))
+            data_pos += size
+        return self._join(blocks, dtype, count)
+
+    def decode_inline(self, text, fmt, dtype, count):
+        dtype = np.dtype(dtype).newbyteorder(self.byte_order)
+        if fmt == 'ascii':
+            return np.array(text.split(), dtype=dtype)
+        data = binascii.a2b_base64(''.join(text.split()).encode())
+        hsize = self.header.itemsize
+        if not self.compressed:
+            nbytes = int(np.frombuffer(data, self.header, 1)[0])
+            return np.frombuffer(data, dtype, nbytes // dtype.itemsize, hsize)
+        # inline compressed data has the header base64 encoded on its own
+        text = ''.join(text.split()).encode()
+        nblocks = int(np.frombuffer(binascii.a2b_base64(text[:self._b64_length(3*hsize)]), self.header, 1)[0])
+        nchars = self._b64_length((3 + nblocks) * hsize)
+        sizes = np.frombuffer(binascii.a2b_base64(text[:nchars]), self.header, 3 + nblocks)[3:]
+        data = binascii.a2b_base64(text[nchars:])
+        blocks = []
+        data_pos = 0
+        for size in sizes:
+            size = int(size)
+            blocks.append(zlib.decompress(data[data_pos:data_pos+size]))
+            data_pos += size
+        return self._join(blocks, dtype, count)
+
+    def _join(self, blocks, dtype, count):
+        out = np.empty(sum(len(b) for b in blocks) // dtype.itemsize, dtype=dtype)
+        view = out.view(np.uint8)
+        pos = 0
+        for block in blocks:
+            view[pos:pos+len(block)] = np.frombuffer(block, np.uint8)
+            pos += len(block)
+        return out
+
+def _array_loader(data, elem, ncomp_default=1):
+    dtype = VTK_TYPES.get(elem.get('type'))
+    if dtype is None:
+        raise ValueError("Unsupported VTK data type: " + str(elem.get('type')))
+    ncomp = int(elem.get('NumberOfComponents', ncomp_default))
+    fmt = elem.get('format')
+    def load():
+        if fmt == 'appended':
+            array = data.decode(int(elem.get('offset')), dtype, None)
+        else:
+            array = data.decode_inline(elem.text or '', fmt, dtype, None)
+        if ncomp > 1:
+            array = array.reshape(-1, ncomp)
+        return array
+    return load
+
+def read(fn):
+    """
+    Read a .vtp or .vtu file into a MeshArrays object, arrays are decoded lazily
+    """
+    with open(fn, 'rb') as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    head_end = buf.find(b'<AppendedData')
+    if head_end < 0:
+        tree = ET.fromstring(bytes(buf[:]))
+        appended_start = None
+        encoding = None
+    else:
+        tag_end = buf.find(b'>', head_end)
+        tag = bytes(buf[head_end:tag_end+1]).decode()
+        match = re.search(r'encoding="(\w+)"', tag)
+        encoding = match.group(1) if match else 'raw'
+        appended_start = buf.find(b'_', tag_end) + 1
+        tree = ET.fromstring(bytes(buf[:head_end]) + b'</VTKFile>')
+    kind = tree.get('type')
+    if kind not in ('PolyData', 'UnstructuredGrid'):
+        raise ValueError("Unsupported VTK XML dataset type: " + str(kind))
+    byte_order = '<' if tree.get('byte_order', 'LittleEndian') == 'LittleEndian' else '>'
+    data = _AppendedData(buf, appended_start, encoding, tree.get('header_type', 'UInt32'),
+            byte_order, tree.get('compressor') is not None)
+
+    pieces = tree.find(kind).findall('Piece')
+    if len(pieces) != 1:
+        raise ValueError("Only single piece files are supported, found %d pieces" % len(pieces))
+    piece = pieces[0]
+    mesh = MeshArrays(kind)
+    mesh.num_points = int(piece.get('NumberOfPoints'))
+    for section, arrays in (('PointData', mesh.point_data), ('CellData', mesh.cell_data)):
+        node = piece.find(section)
+        if node is None:
+            continue
+        for elem in node.findall('DataArray'):
+            arrays.add_loader(elem.get('Name'), _array_loader(data, elem))
+    points = piece.find('Points').find('DataArray')
+    mesh.arrays.add_loader('Points', _array_loader(data, points, 3))
+
+    if kind == 'UnstructuredGrid':
+        mesh.num_cells = int(piece.get('NumberOfCells'))
+        for elem in piece.find('Cells').findall('DataArray'):
+            mesh.arrays.add_loader(elem.get('Name'), _array_loader(data, elem))
+    else:
+        mesh.num_cells = 0
+        for section in POLYDATA_SECTIONS:
+            node = piece.find(section)
+            count = int(piece.get('NumberOf' + section, 0))
+            mesh.num_cells += count
+            if node is None or count == 0:
+                continue
+            arrays = LazyArrays()
+            for elem in node.findall('DataArray'):
+                arrays.add_loader(elem.get('Name'), _array_loader(data, elem))
+            mesh.cells[section] = arrays
+        main = mesh.cells.get('Polys')
+        if main is None and mesh.cells:
+            main = list(mesh.cells.values())[0]
+        if main is not None:
+            mesh.arrays.add_loader('connectivity', lambda: main['connectivity'])
+            mesh.arrays.add_loader('offsets', lambda: main['offsets'])
+    return mesh
+
+NUMPY_TYPES = dict((np.dtype(v).str[1:], k) for k, v in VTK_TYPES.items())
+
+class _Source(object):
+    """
+    Array-like input of the writer: a NumPy array, memmap or any object
+    supporting len() and slicing, or a function generating slices
+    """
+    def __init__(self, array=None, length=None, func=None, dtype=None, ncomp=None):
+        if array is not None:
+            shape = getattr(array, 'shape', (len(array),))
+            self.length = shape[0]
+            self.ncomp = ncomp or (shape[1] if len(shape) > 1 else 1)
+            self.dtype = np.dtype(dtype or getattr(array, 'dtype', np.float64))
+            self.func = lambda start, stop: array[start:stop]
+        else:
+            self.length = length
+            self.ncomp = ncomp or 1
+            self.dtype = np.dtype(dtype)
+            self.func = func
+        if self.dtype.str[1:] not in NUMPY_TYPES:
+            raise ValueError("Unsupported array type: " + str(self.dtype))
+        self.dtype = self.dtype.newbyteorder('<')
+
+    def nbytes(self):
+        return self.length * self.ncomp * self.dtype.itemsize
+
+    def chunks(self, block_size):
+        """
+        Yield little endian byte strings of whole tuples, each at most block_size long
+        """
+        rows = max(1, block_size // (self.ncomp * self.dtype.itemsize))
+        for start in range(0, self.length, rows):
+            stop = min(start + rows, self.length)
+            chunk = np.ascontiguousarray(self.func(start, stop), dtype=self.dtype)
+            yield chunk.tobytes()
+
+class _StreamWriter(object):
+    def __init__(self, f, compress, block_size, level, header):
+        self.f = f
+        self.compress = compress
+        self.block_size = block_size
+        self.level = level
+        self.header = np.dtype(header).newbyteorder('<')
+
+    def write_array(self, source):
+        """
+        Append one array at the current file position
+        """
+        f = self.f
+        if not self.compress:
+            f.write(np.array([source.nbytes()], dtype=self.header).tobytes())
+            for chunk in source.chunks(self.block_size):
+                f.write(chunk)
+            return
+        row_bytes = source.ncomp * source.dtype.itemsize
+        block = max(row_bytes, self.block_size // row_bytes * row_bytes)
+        nbytes = source.nbytes()
+        nblocks = (nbytes + block - 1) // block
+        last = nbytes - (nblocks - 1) * block if nblocks else 0
+        head = np.zeros(3 + nblocks, dtype=self.header)
+        head[:3] = (nblocks, block, last if last != block else 0)
+        head_pos = f.tell()
+        f.write(head.tobytes())
+        for i, chunk in enumerate(source.chunks(block)):
+            data = zlib.compress(chunk, self.level)
+            head[3 + i] = len(data)
+            f.write(data)
+        end = f.tell()
+        f.seek(head_pos)
+        f.write(head.tobytes())
+        f.seek(end)
+
+def _write(fn, kind, points, cells, point_data, cell_data, compress, block_size, level):
+    """
+    cells: list of (section, [(name, source), ...]) in file order
+    """
+    point_data = point_data or {}
+    cell_data = cell_data or {}
+    sources = []
+    def array(name, source, indent):
+        sources.append(source)
+        return '%s<DataArray type="%s" Name="%s"%s format="appended" offset="%s"/>\n' % (
+                indent, NUMPY_TYPES[source.dtype.str[1:]], name,
+                ' NumberOfComponents="%d"' % source.ncomp if source.ncomp > 1 else '', '@%d@' % (len(sources) - 1))
+
+    npoints = points.length
+    header_type = 'UInt32'
+    if not compress and max([s.nbytes() for s in [points] + [src for _, arrs in cells for _, src in arrs]
+            + list(point_data.values()) + list(cell_data.values())]) >= 2**32:
+        header_type = 'UInt64'
+    xml = '<?xml version="1.0"?>\n'
+    xml += '<VTKFile type="%s" version="0.1" byte_order="LittleEndian" header_type="%s"%s>\n' % (
+            kind, header_type, ' compressor="vtkZLibDataCompressor"' if compress else '')
+    xml += '  <%s>\n' % kind
+    if kind == 'UnstructuredGrid':
+        xml += '    <Piece NumberOfPoints="%d" NumberOfCells="%d">\n' % (npoints, cells[0][1][1][1].length)
+    else:
+        counts = dict((section, arrs[1][1].length) for section, arrs in cells)
+        xml += '    <Piece NumberOfPoints="%d"%s>\n' % (npoints, ''.join(
+            ' NumberOf%s="%d"' % (section, counts.get(section, 0)) for section in POLYDATA_SECTIONS))
+    for section, data in (('PointData', point_data), ('CellData', cell_data)):
+        xml += '      <%s>\n' % section
+        for name, source in data.items():
+            xml += array(name, source, '        ')
+        xml += '      </%s>\n' % section
+    xml += '      <Points>\n' + array('Points', points, '        ') + '      </Points>\n'
+    for section, arrs in cells:
+        xml += '      <%s>\n' % section
+        for name, source in arrs:
+            xml += array(name, source, '        ')
+        xml += '      </%s>\n' % section
+    xml += '    </Piece>\n  </%s>\n  <AppendedData encoding="raw">\n   _' % kind
+
+    # placeholders are replaced by padded offsets once the data is written
+    parts = re.split(r'@(\d+)@', xml)
+    with open(fn, 'wb') as f:
+        positions = []
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                f.write(part.encode())
+            else:
+                positions.append(f.tell())
+                f.write(b' ' * 20)
+        start = f.tell()
+        stream = _StreamWriter(f, compress, block_size, level, VTK_TYPES[header_type])
+        offsets = []
+        for source in sources:
+            offsets.append(f.tell() - start)
+            stream.write_array(source)
+        f.write(b'\n  </AppendedData>\n</VTKFile>\n')
+        for pos, offset in zip(positions, offsets):
+            f.seek(pos)
+            f.write(('%-20d' % offset).encode())
+
+def _sources(arrays):
+    out = OrderedDict()
+    if arrays is not None:
+        for name in arrays:
+            array = arrays[name]
+            out[name] = array if isinstance(array, _Source) else _Source(array)
+    return out
+
+def _cell_sources(ncells, connectivity, offsets, cell_size):
+    conn = connectivity if isinstance(connectivity, _Source) else _Source(connectivity)
+    if offsets is None:
+        if cell_size is None:
+            raise ValueError("Either offsets or cell_size is required")
+        if conn.length != ncells * cell_size:
+            raise ValueError("connectivity does not match cell_size")
+        offsets = _Source(length=ncells, dtype=conn.dtype,
+                func=lambda start, stop: np.arange(start + 1, stop + 1, dtype=np.int64) * cell_size)
+    elif not isinstance(offsets, _Source):
+        offsets = _Source(offsets)
+    return conn, offsets
+
+def write_ugrid(fn, points, connectivity, offsets=None, types=None, point_data=None, cell_data=None,
+        cell_size=None, cell_type=VTK_TETRA, compress=True, block_size=DEFAULT_BLOCK_SIZE, level=6):
+    """
+    Stream an unstructured grid to a .vtu file
+
+    Arrays are read, converted and zlib compressed one block at a time, so
+    the extra memory used is a few blocks regardless of the mesh size.
+    Inputs may be NumPy arrays, np.memmap or any array-like supporting
+    len() and slicing.
+
+    Args:
+        fn: output .vtu file
+        points: (npoints, 3) coordinates
+        connectivity: flat point ids of all cells
+        offsets: end offset of every cell; generated from cell_size if None
+        types: VTK cell types; all cell_type if None
+        point_data, cell_data: dicts name -> array, e.g. GlobalNodeID,
+            GlobalElementID, ModelRegionID
+        cell_size: number of points per cell when offsets is None
+        compress: zlib compress the appended blocks like cylinder.vtu
+        block_size: uncompressed bytes per block
+        level: zlib compression level
+    """
+    points = points if isinstance(points, _Source) else _Source(points)
+    if offsets is None and cell_size is None:
+        cell_size = 4
+    ncells = len(offsets) if offsets is not None else len(connectivity) // cell_size
+    conn, offsets = _cell_sources(ncells, connectivity, offsets, cell_size)
+    if types is None:
+        types = _Source(length=ncells, dtype=np.uint8,
+                func=lambda start, stop: np.full(stop - start, cell_type, dtype=np.uint8))
+    elif not isinstance(types, _Source):
+        types = _Source(types, dtype=np.uint8)
+    cells = [('Cells', [('connectivity', conn), ('offsets', offsets), ('types', types)])]
+    _write(fn, 'UnstructuredGrid', points, cells, _sources(point_data), _sources(cell_data),
+            compress, block_size, level)
+
+def write_polydata(fn, points, connectivity, offsets=None, point_data=None, cell_data=None,
+        cell_size=None, compress=True, block_size=DEFAULT_BLOCK_SIZE, level=6):
+    """
+    Stream a polygonal surface (Polys) to a .vtp file, see write_ugrid
+    """
+    points = points if isinstance(points, _Source) else _Source(points)
+    if offsets is None and cell_size is None:
+        cell_size = 3
+    ncells = len(offsets) if offsets is not None else len(connectivity) // cell_size
+    conn, offsets = _cell_sources(ncells, connectivity, offsets, cell_size)
+    cells = [('Polys', [('connectivity', conn), ('offsets', offsets)])]
+    _write(fn, 'PolyData', points, cells, _sources(point_data), _sources(cell_data),
+            compress, block_size, level)
+
+def write(fn, mesh, **kwargs):
+    """
+    Write a MeshArrays object with write_ugrid or write_polydata
+    """
+    if mesh.kind == 'UnstructuredGrid':
+        write_ugrid(fn, mesh.points, mesh.connectivity, mesh.offsets, mesh.types,
+                mesh.point_data, mesh.cell_data, **kwargs)
+    else:
+        write_polydata(fn, mesh.points, mesh.connectivity, mesh.offsets,
+                mesh.point_data, mesh.cell_data, **kwargs)
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import time
+    fns = sys.argv[1:] or [os.path.join(os.path.dirname(os.path.abspath(__file__)), fn)
+            for fn in ('cylinder.vtp', 'cylinder.vtu', 'demo.vtp')]
+    for fn in fns:
+        start = time.time()
+        mesh = read(fn)
+        names = list(mesh.arrays) + list(mesh.point_data) + list(mesh.cell_data)
+        for name in names:
+            mesh[name]
+        print("%s: %s, read in %.1f ms" % (os.path.basename(fn), mesh, (time.time()-start)*1000.))